@@ -1,31 +1,90 @@
+import asyncio
 import os
 import ssl
-from ldap3 import Server, Connection, SUBTREE, Tls
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-LDAP_URI = os.getenv("LDAP_URI", "ldap://dc01.home.lan")
+from ldap3 import Server, ServerPool, Connection, SUBTREE, Tls, ROUND_ROBIN
+from ldap3.core.exceptions import LDAPException
+from ldap3.utils.config import set_config_parameter
+
+LDAP_URI = os.getenv("LDAP_URI", "ldap://dc01.home.lan")  # mehrere DCs: durch Leerzeichen/Komma getrennt
 LDAP_BASE_DN = os.getenv("LDAP_BASE_DN", "DC=home,DC=lan")
 LDAP_REALM = os.getenv("LDAP_REALM", "HOME.LAN")
 LDAP_PARENT_GROUP_CN = os.getenv("LDAP_PARENT_GROUP_CN", "eltern")
 
+LDAP_CONNECT_TIMEOUT = float(os.getenv("LDAP_CONNECT_TIMEOUT", "3"))
+# ganze Sekunden: ldap3 packt den Wert unter Linux per struct.pack("LL") in SO_RCVTIMEO
+LDAP_RECEIVE_TIMEOUT = int(os.getenv("LDAP_RECEIVE_TIMEOUT", "5"))
+# memberOf-Ergebnis pro sAMAccountName; das Passwort wird trotzdem jedes Mal per Bind geprüft
+LDAP_GROUP_CACHE_SECONDS = float(os.getenv("LDAP_GROUP_CACHE_SECONDS", "60"))
+# höchstens so viele LDAP-Anmeldungen gleichzeitig, weitere werden abgewiesen
+LDAP_MAX_WORKERS = int(os.getenv("LDAP_MAX_WORKERS", "4"))
+LDAP_MAX_PENDING = int(os.getenv("LDAP_MAX_PENDING", "16"))
+# Circuit Breaker: nach N Verbindungsfehlern in Folge für X Sekunden sofort ablehnen
+LDAP_BREAKER_FAILURES = int(os.getenv("LDAP_BREAKER_FAILURES", "3"))
+LDAP_BREAKER_RESET_SECONDS = float(os.getenv("LDAP_BREAKER_RESET_SECONDS", "30"))
+
 # Homelab: Zertifikat-Validierung aus (schnell & pragmatisch).
 # Wenn du es "richtig" willst: CA importieren + validate=ssl.CERT_REQUIRED
 tls_config = Tls(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLSv1_2)
 
-def authenticate_parent(login: str, password: str) -> bool:
-    login = login.strip()
-    if not login or not password:
-        return False
+# ldap3 schläft nach jeder erfolglosen Runde durch den Pool POOLING_LOOP_TIMEOUT
+# Sekunden (Standard 10), auch nach der letzten – das hielte bei ausgefallenen
+# DCs jeden LDAP-Thread 10 s fest. Die Wartezeit regelt hier der Breaker.
+set_config_parameter("POOLING_LOOP_TIMEOUT", 0)
 
-    upn = f"{login}@{LDAP_REALM}"
 
-    server = Server(LDAP_URI, use_ssl=False, tls=tls_config, get_info=None)
-    conn = Connection(server, user=upn, password=password, auto_bind=False)
+def make_server_pool(uris: str) -> ServerPool:
+    return ServerPool(
+        [
+            Server(uri, use_ssl=False, tls=tls_config, get_info=None, connect_timeout=LDAP_CONNECT_TIMEOUT)
+            for uri in uris.replace(",", " ").split()
+        ],
+        ROUND_ROBIN,
+        active=1,  # jede Runde nur einmal durch alle DCs, nicht endlos
+        exhaust=LDAP_BREAKER_RESET_SECONDS,
+    )
 
-    if not conn.start_tls():
-        return False
-    if not conn.bind():
-        return False
 
+# Einmal aufgebaut und für alle Anmeldungen wiederverwendet; ldap3 merkt sich
+# darin, welcher DC gerade nicht erreichbar ist, und probiert den nächsten.
+server_pool = make_server_pool(LDAP_URI)
+
+# sAMAccountName -> (gültig bis, ist Elternteil)
+_group_cache: dict[str, tuple[float, bool]] = {}
+_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=LDAP_MAX_WORKERS, thread_name_prefix="kidscontrol-ldap")
+_pending = threading.BoundedSemaphore(LDAP_MAX_PENDING)
+
+breaker = {"failures": 0, "open_until": 0.0, "trial": False}
+
+
+class LDAPUnavailable(Exception):
+    """LDAP derzeit nicht nutzbar (Breaker offen, Warteschlange voll oder Timeout)."""
+
+
+def _cached_is_parent(login: str) -> bool | None:
+    with _lock:
+        hit = _group_cache.get(login.lower())
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def _remember(login: str, is_parent: bool):
+    with _lock:
+        _group_cache[login.lower()] = (time.monotonic() + LDAP_GROUP_CACHE_SECONDS, is_parent)
+
+
+def clear_cache():
+    with _lock:
+        _group_cache.clear()
+
+
+def _lookup_is_parent(conn: Connection, login: str) -> bool:
     search_filter = f"(&(objectClass=user)(sAMAccountName={login}))"
     ok = conn.search(
         search_base=LDAP_BASE_DN,
@@ -34,13 +93,105 @@ def authenticate_parent(login: str, password: str) -> bool:
         attributes=["memberOf"]
     )
     if not ok or not conn.entries:
-        conn.unbind()
         return False
 
     entry = conn.entries[0]
     member_of = entry.memberOf.values if "memberOf" in entry else []
     needle = f"CN={LDAP_PARENT_GROUP_CN},"
-    is_parent = any(str(g).startswith(needle) for g in member_of)
+    return any(str(g).startswith(needle) for g in member_of)
+
+
+def authenticate_parent(login: str, password: str) -> bool:
+    """Synchron: Bind mit UPN, dann Gruppenprüfung (aus dem Cache, wenn frisch)."""
+    login = login.strip()
+    if not login or not password:
+        return False
+
+    upn = f"{login}@{LDAP_REALM}"
+    conn = Connection(
+        server_pool, user=upn, password=password, auto_bind=False, receive_timeout=LDAP_RECEIVE_TIMEOUT
+    )
+    try:
+        if not conn.start_tls():
+            return False
+        if not conn.bind():
+            return False
+
+        is_parent = _cached_is_parent(login)
+        if is_parent is None:
+            is_parent = _lookup_is_parent(conn, login)
+            _remember(login, is_parent)
+        return is_parent
+    finally:
+        conn.unbind()
+
+
+def _breaker_allows() -> bool:
+    with _lock:
+        if breaker["failures"] < LDAP_BREAKER_FAILURES:
+            return True
+        if time.monotonic() < breaker["open_until"] or breaker["trial"]:
+            return False
+        # halb offen: genau ein Versuch darf durch
+        breaker["trial"] = True
+        return True
+
+
+def _breaker_record(ok: bool, attempt: dict | None = None):
+    """
+    Ergebnis eines Versuchs verbuchen – pro Versuch genau einmal: nach einem
+    Timeout zählt der Fehler, das späte Ergebnis des Threads wird ignoriert.
+    """
+    with _lock:
+        if attempt is not None:
+            if attempt["settled"]:
+                return
+            attempt["settled"] = True
+        breaker["trial"] = False
+        if ok:
+            breaker["failures"] = 0
+            return
+        breaker["failures"] += 1
+        if breaker["failures"] >= LDAP_BREAKER_FAILURES:
+            breaker["open_until"] = time.monotonic() + LDAP_BREAKER_RESET_SECONDS
+
+
+def _run(attempt: dict, login: str, password: str) -> bool:
+    try:
+        result = authenticate_parent(login, password)
+    except Exception:
+        _breaker_record(False, attempt)
+        raise
+    finally:
+        _pending.release()
+    _breaker_record(True, attempt)
+    return result
+
+
+async def authenticate_parent_async(login: str, password: str) -> bool:
+    """
+    Für async-Handler: läuft im begrenzten LDAP-Threadpool, damit ein langsamer
+    DC den Event-Loop nicht blockiert. Wirft LDAPUnavailable, wenn der Breaker
+    offen ist, zu viele Anmeldungen warten oder der DC nicht rechtzeitig antwortet.
+    """
+    if not _breaker_allows():
+        raise LDAPUnavailable("circuit open")
+    if not _pending.acquire(blocking=False):
+        with _lock:
+            breaker["trial"] = False
+        raise LDAPUnavailable("too many pending logins")
 
-    conn.unbind()
-    return is_parent
+    attempt = {"settled": False}
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, _run, attempt, login, password)
+    timeout = LDAP_CONNECT_TIMEOUT + 2 * LDAP_RECEIVE_TIMEOUT
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except LDAPException as e:
+        # vor TimeoutError prüfen: ldap3 wirft Socket-Timeouts als Klasse, die
+        # auch von TimeoutError erbt (= asyncio.TimeoutError ab Python 3.11)
+        raise LDAPUnavailable(str(e)) from e
+    except asyncio.TimeoutError:
+        # der Thread läuft noch zu Ende und gibt seinen Platz dann selbst frei
+        _breaker_record(False, attempt)
+        raise LDAPUnavailable("timeout")
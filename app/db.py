@@ -1,11 +1,79 @@
+import os
 from datetime import datetime, timezone
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, UniqueConstraint
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime, UniqueConstraint, Index
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 DB_PATH = "/opt/kids-control/app/data/kidscontrol.sqlite3"
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
+
+# SQLite-Pragmas pro Verbindung (WAL: Leser blockieren den Schreiber nicht)
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("KIDSCONTROL_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("KIDSCONTROL_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("KIDSCONTROL_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("KIDSCONTROL_SQLITE_CACHE_SIZE", "-16000")),  # negativ = KiB
+    "mmap_size": int(os.getenv("KIDSCONTROL_SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),
+    # wirkt bei neuen Dateien sofort, bestehende stellt Migration 004 einmalig per VACUUM um
+    "auto_vacuum": "INCREMENTAL",
+}
+
+DB_POOL_SIZE = int(os.getenv("KIDSCONTROL_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("KIDSCONTROL_DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("KIDSCONTROL_DB_POOL_TIMEOUT", "30"))
+
+
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    cur = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cur.execute(f"PRAGMA {name}={value}")
+    cur.close()
+
+
+def make_engine(url: str = DATABASE_URL):
+    """
+    Engine-Fabrik für SQLite (Standard) und PostgreSQL.
+    SQLite bekommt WAL & Co. per connect-Event, PostgreSQL einen normalen Pool.
+    """
+    pool = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            pool = {}  # In-Memory-DB: SQLAlchemy wählt selbst den passenden Pool
+        eng = create_engine(url, connect_args={"check_same_thread": False}, **pool)
+        event.listen(eng, "connect", _apply_sqlite_pragmas)
+        return eng
+    return create_engine(url, pool_pre_ping=True, **pool)
+
+
+def async_url(url: str = DATABASE_URL) -> str:
+    """Gleiche Datenbank, async Treiber: aiosqlite bzw. asyncpg."""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+def make_async_engine(url: str = DATABASE_URL):
+    """Async-Engine für die heißen Endpunkte (Widget, Status, Heartbeat)."""
+    url = async_url(url)
+    pool = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if url.startswith("sqlite"):
+        if url.endswith("://") or url.endswith(":memory:"):
+            pool = {}
+        eng = create_async_engine(url, **pool)
+        event.listen(eng.sync_engine, "connect", _apply_sqlite_pragmas)
+        return eng
+    return create_async_engine(url, pool_pre_ping=True, **pool)
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+async_engine = make_async_engine()
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 class Child(Base):
@@ -13,12 +81,17 @@ class Child(Base):
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)  # z.B. "kind1"
     display_name = Column(String, nullable=False)           # z.B. "Kind 1"
+    widget_token_hash = Column(String, nullable=True)       # SHA-256 des Widget-Tokens (app/widget_tokens.py)
+
+    __table_args__ = (Index("ix_children_widget_token_hash", "widget_token_hash", unique=True),)
 
 class Schedule(Base):
     """
-    Ein Zeitfenster pro Wochentag und Kind.
+    Zeitplan pro Wochentag und Kind.
     weekday: 0=Mo ... 6=So
-    start_min/end_min: Minuten ab 00:00 (z.B. 15:00 => 900)
+    start_min/end_min: Minuten ab 00:00 (z.B. 15:00 => 900); bei mehreren Fenstern
+                       Beginn des ersten und Ende des letzten
+    windows: alle Fenster des Tages, z.B. "420-465,900-1110" (NULL = nur start_min..end_min)
     daily_minutes: erlaubte Minuten am Tag
     """
     __tablename__ = "schedules"
@@ -28,6 +101,7 @@ class Schedule(Base):
     start_min = Column(Integer, nullable=False, default=900)   # 15:00
     end_min = Column(Integer, nullable=False, default=1110)    # 18:30
     daily_minutes = Column(Integer, nullable=False, default=120)
+    windows = Column(String, nullable=True)
 
     __table_args__ = (UniqueConstraint("username", "weekday", name="uq_schedule_user_weekday"),)
 
@@ -62,6 +136,8 @@ class Override(Base):
     created_by = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (Index("ix_overrides_user_until", "username", "grant_until"),)
+
 class AuditLog(Base):
     __tablename__ = "audit_log"
     id = Column(Integer, primary_key=True)
@@ -71,6 +147,11 @@ class AuditLog(Base):
     action = Column(String, nullable=False)      # z.B. SCHEDULE_UPDATE, GRANT_DAY_ON
     details = Column(String, nullable=True)      # Freitext (kurz)
 
+    __table_args__ = (
+        Index("ix_audit_log_child_at", "child", "at"),
+        Index("ix_audit_log_at", "at"),
+    )
+
 class DailyUsage(Base):
     __tablename__ = "daily_usage"
 
@@ -82,7 +163,71 @@ class DailyUsage(Base):
 
     __table_args__ = (
         UniqueConstraint("username", "day", name="uq_daily_usage_user_day"),
+        Index("ix_daily_usage_day", "day"),
     )
+
+
+class UsageInterval(Base):
+    """Aktivitätsintervall eines Geräts; die Tagesnutzung ist die Vereinigung aller Intervalle."""
+
+    __tablename__ = "usage_intervals"
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    day = Column(String, nullable=False)  # YYYY-MM-DD (lokaler Tag!)
+    device = Column(String, nullable=False, default="")
+    start_at = Column(DateTime(timezone=True), nullable=False)  # naive UTC
+    end_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (Index("ix_usage_intervals_user_day", "username", "day"),)
+
+
+class UsageReset(Base):
+    """
+    Letztes "Tag zurücksetzen" pro Kind und Tag. Die Nutzungspuffer aller
+    Worker (app/usage_buffer.py) prüfen das vor jedem Flush und verwerfen
+    dann ihren Stand von vor dem Zurücksetzen.
+    """
+
+    __tablename__ = "usage_resets"
+
+    username = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)  # YYYY-MM-DD (lokaler Tag!)
+    reset_at = Column(DateTime(timezone=True), nullable=False)  # naive UTC
+
+
+class WeeklyUsage(Base):
+    """Wochensumme aus daily_usage (app/usage_history.py), bleibt nach dem Löschen der Tageszeilen."""
+
+    __tablename__ = "weekly_usage"
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    period = Column(String, nullable=False)  # Montag der Woche, YYYY-MM-DD
+    used_minutes = Column(Integer, nullable=False, default=0)
+    active_days = Column(Integer, nullable=False, default=0)
+    max_minutes = Column(Integer, nullable=False, default=0)
+    through_day = Column(String, nullable=False)  # letzter eingerechneter Tag
+
+    __table_args__ = (UniqueConstraint("username", "period", name="uq_weekly_usage_user_period"),)
+
+
+class MonthlyUsage(Base):
+    """Monatssumme aus daily_usage, wie WeeklyUsage."""
+
+    __tablename__ = "monthly_usage"
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    period = Column(String, nullable=False)  # YYYY-MM
+    used_minutes = Column(Integer, nullable=False, default=0)
+    active_days = Column(Integer, nullable=False, default=0)
+    max_minutes = Column(Integer, nullable=False, default=0)
+    through_day = Column(String, nullable=False)
+
+    __table_args__ = (UniqueConstraint("username", "period", name="uq_monthly_usage_user_period"),)
+
+
 class DayOverride(Base):
     __tablename__ = "day_overrides"
     username = Column(String, primary_key=True)
@@ -90,5 +235,35 @@ class DayOverride(Base):
     enabled = Column(Boolean, nullable=False, default=False)
     updated_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
 
+class PolicyVersion(Base):
+    """
+    Versionszähler für den Policy-Snapshot (app/policy_cache.py).
+    Jede Eltern-Änderung erhöht ihn, damit alle Worker ihren Cache neu bauen.
+    """
+    __tablename__ = "policy_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class MaintenanceLease(Base):
+    """
+    Wer die nächtliche Wartung gerade fährt (app/maintenance.py). Mit mehreren
+    Workern startet jeder den Scheduler; laufen darf nur, wer die Zeile bekommt.
+    """
+    __tablename__ = "maintenance_lease"
+    id = Column(Integer, primary_key=True)
+    holder = Column(String, nullable=False, default="")
+    lease_until = Column(DateTime(timezone=True), nullable=False)
+
+class SchemaMigration(Base):
+    """Angewendete Migrationen (app/migrations.py), eine Zeile pro Version."""
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from app.migrations import run_migrations, startup_lock
+
+    with startup_lock(engine):
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
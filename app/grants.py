@@ -0,0 +1,84 @@
+"""Freigaben für mehrere Kinder auf einmal (POST /api/admin/bulk/grant).
+
+Wie die Einzel-Endpunkte /grant/{user}/hour und /grant/{user}/day, aber für
+eine ganze Liste: ein Insert bzw. Upsert für alle Kinder, ein AuditLog-Batch,
+ein Commit. Die Schreibzugriffe laufen über Core-Statements an den ORM-Events
+vorbei, deshalb rufen beide Funktionen policy_cache.mark_changed() selbst auf.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import policy_cache
+from app.db import AuditLog, DayOverride, Override
+from app.policy import as_aware_utc
+
+
+def grant_hours(db, users: list[str], actor: str, hours: int = 1, now: datetime | None = None) -> dict[str, datetime]:
+    """
+    Verlängert die Stunden-Freigabe jedes Kindes um `hours`: ab dem Ende einer
+    noch laufenden HOUR-Freigabe, sonst ab jetzt. Liefert user -> neues Ende.
+    """
+    users = list(dict.fromkeys(users))
+    if not users:
+        return {}
+    now = now or datetime.now(timezone.utc)
+    latest = dict(
+        db.execute(
+            select(Override.username, func.max(Override.grant_until))
+            .where(Override.username.in_(users), Override.grant_type == "HOUR")
+            .group_by(Override.username)
+        ).all()
+    )
+    until = {}
+    for user in users:
+        last = as_aware_utc(latest.get(user))
+        until[user] = (last if last and last > now else now) + timedelta(hours=hours)
+
+    db.execute(
+        insert(Override.__table__),
+        [
+            {"username": u, "grant_until": t, "grant_type": "HOUR", "created_by": actor, "created_at": now}
+            for u, t in until.items()
+        ],
+    )
+    db.execute(
+        insert(AuditLog.__table__),
+        [
+            {"at": now, "actor": actor, "child": u, "action": "GRANT_HOUR", "details": f"+{hours}h bis {t.isoformat()}"}
+            for u, t in until.items()
+        ],
+    )
+    policy_cache.mark_changed(db)
+    db.commit()
+    return until
+
+
+def grant_day(db, users: list[str], actor: str, day: str, enabled: bool = True) -> int:
+    """Schaltet "heute unbegrenzt" für alle `users` am lokalen Tag `day` an (oder aus)."""
+    users = list(dict.fromkeys(users))
+    if not users:
+        return 0
+    now = datetime.now(timezone.utc)
+    dialect = db.get_bind().dialect.name
+    insert_ = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert_(DayOverride.__table__).values(
+        [{"username": u, "day": day, "enabled": enabled, "updated_at": now} for u in users]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["username"],
+        set_={"day": stmt.excluded.day, "enabled": stmt.excluded.enabled, "updated_at": stmt.excluded.updated_at},
+    )
+    db.execute(stmt)
+    action = "GRANT_DAY_ON" if enabled else "GRANT_DAY_OFF"
+    db.execute(
+        insert(AuditLog.__table__),
+        [{"at": now, "actor": actor, "child": u, "action": action, "details": day} for u in users],
+    )
+    policy_cache.mark_changed(db)
+    db.commit()
+    return len(users)
@@ -0,0 +1,46 @@
+"""Vereinigung von Zeitintervallen (für die Nutzungszählung über mehrere Geräte).
+
+Intervalle werden als disjunkte, sortierte Liste gehalten; add() verschmilzt
+überlappende oder angrenzende Intervalle per Binärsuche und führt die
+Gesamtdauer inkrementell mit. Zwei Geräte, die gleichzeitig laufen, zählen
+dadurch nur einmal – und dasselbe Intervall zweimal einzufügen ändert nichts.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+
+
+class IntervalUnion:
+    __slots__ = ("_starts", "_ends", "_total")
+
+    def __init__(self, intervals=()):
+        self._starts: list[float] = []
+        self._ends: list[float] = []
+        self._total = 0.0
+        for start, end in intervals:
+            self.add(start, end)
+
+    def add(self, start: float, end: float):
+        if end < start:
+            start, end = end, start
+        # erstes Intervall, das bei/ nach `start` endet, bis letztes, das bei/ vor `end` beginnt
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+            for i in range(lo, hi):
+                self._total -= self._ends[i] - self._starts[i]
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+        self._total += end - start
+
+    def total(self) -> float:
+        return self._total
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def __len__(self):
+        return len(self._starts)
@@ -41,5 +41,12 @@ Item {
             value: plasmoid.configuration.refreshSeconds
             onValueChanged: plasmoid.configuration.refreshSeconds = value
         }
+
+        PC3.CheckBox {
+            Layout.fillWidth: true
+            text: "Live-Stream statt Abfrage (Server-Sent Events)"
+            checked: plasmoid.configuration.useStream
+            onToggled: plasmoid.configuration.useStream = checked
+        }
     }
 }
@@ -0,0 +1,129 @@
+"""Live-Status per Server-Sent Events.
+
+Ein einziger Hintergrund-Task berechnet den Widget-Status und schläft bis
+zum nächsten möglichen Zustandswechsel (oder bis Eltern etwas ändern).
+Nur wenn sich der Zustand wirklich geändert hat, bekommt jeder verbundene
+Client ein Event – viele Zuschauer kosten also eine Berechnung pro
+Änderung, nicht eine pro Poll. Zwischendurch hält ein Kommentar-Heartbeat
+die Verbindung offen.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from app import metrics
+
+STREAM_HEARTBEAT_SECONDS = int(os.getenv("KIDSCONTROL_STREAM_HEARTBEAT_SECONDS", "15"))
+# Obergrenze für den Schlaf, falls keine Änderung absehbar ist
+STREAM_MAX_SLEEP_SECONDS = int(os.getenv("KIDSCONTROL_STREAM_MAX_SLEEP_SECONDS", "60"))
+
+# async compute() -> (payload, next_wake | None)
+_compute: Callable[[], Awaitable[tuple[dict, datetime | None]]] | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+_task: asyncio.Task | None = None
+_wake: asyncio.Event | None = None
+_changed: asyncio.Condition | None = None
+
+_seq = 0
+_latest: dict | None = None
+_fingerprint = ""
+subscribers = 0
+
+
+metrics.register_gauges(
+    "kidscontrol_stream", "Live-Stream (verbundene Clients, letzte Event-Nummer)",
+    lambda: [({"kind": "subscribers"}, subscribers), ({"kind": "seq"}, _seq)],
+)
+
+
+def _fp(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+
+def poke():
+    """Thread-sicher: sofort neu berechnen (z. B. nach einer Eltern-Änderung)."""
+    if _loop is not None and _wake is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+async def _run():
+    global _seq, _latest, _fingerprint
+    while True:
+        _wake.clear()
+        try:
+            payload, next_wake = await _compute()
+        except Exception as e:
+            print(f"[WARN] Live-Status fehlgeschlagen: {e}")
+            payload, next_wake = None, None
+
+        if payload is not None:
+            fp = _fp(payload.get("kids", payload))
+            if fp != _fingerprint:
+                _fingerprint = fp
+                _latest = payload
+                _seq += 1
+                async with _changed:
+                    _changed.notify_all()
+
+        sleep = STREAM_MAX_SLEEP_SECONDS
+        if next_wake is not None:
+            sleep = min(sleep, max(0.5, (next_wake - datetime.now(timezone.utc)).total_seconds()))
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=sleep)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start(compute: Callable[[], Awaitable[tuple[dict, datetime | None]]]):
+    global _compute, _loop, _task, _wake, _changed
+    if _task is not None and not _task.done():
+        return
+    _compute = compute
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    _changed = asyncio.Condition()
+    _task = _loop.create_task(_run())
+
+
+async def stop():
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+
+
+def _event(seq: int, payload: dict) -> str:
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {seq}\nevent: status\ndata: {data}\n\n"
+
+
+async def events(last_seq: int = 0):
+    """Async-Generator für StreamingResponse: erst der aktuelle Stand, dann nur Änderungen."""
+    global subscribers
+    subscribers += 1
+    try:
+        yield f"retry: {STREAM_HEARTBEAT_SECONDS * 1000}\n\n"
+        seen = last_seq
+        while True:
+            async with _changed:
+                if _latest is None or _seq == seen:
+                    try:
+                        await asyncio.wait_for(_changed.wait(), timeout=STREAM_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+            if _latest is not None and _seq != seen:
+                seen = _seq
+                yield _event(seen, _latest)
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        subscribers -= 1
@@ -1,12 +1,24 @@
  from fastapi import FastAPI, Request, Form
  from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
++from fastapi import Depends, Query
++from fastapi.responses import Response, StreamingResponse
  from starlette.middleware.sessions import SessionMiddleware
++from starlette.middleware.gzip import GZipMiddleware
  from zoneinfo import ZoneInfo
  from datetime import datetime, timezone
  import os
++import hashlib
++import json
++
++try:
++    from brotli_asgi import BrotliMiddleware  # optional: pip install brotli-asgi
++except ImportError:
++    BrotliMiddleware = None
  
  from app.db import (
      SessionLocal,
++    AsyncSessionLocal,
++    async_engine,
      init_db,
      Child,
      Schedule,
@@ -17,21 +29,34 @@
      DayOverride,
  )
  
- from app.policy import compute_access, as_aware_utc
++from app import policy_cache, maintenance, usage_buffer, usage_history, offline_bundle, widget_tokens, wire, grants, live, metrics
++from app.policy import (
++    compute_access,
++    evaluate_access_async,
++    evaluate_access_many_async,
++    record_heartbeat_async,
++    record_heartbeat_batch_async,
++    as_aware_utc,
++)
  from app.ui import (
      css_block,
++    CSS,
++    CSS_HASH,
 +    REASON_MAP_DE,
      render_login_page,
      render_dashboard,
      render_trace,
      render_schedule_editor,
      render_child_view,
++    parse_schedule_form,
  )
  from app.profiles import (
      ensure_profile_dir,
      list_profiles,
      load_profile,
      save_profile,
++    apply_profile,
++    week_profile,
      PRESETS,
  )
  
@@ -43,9 +68,34 @@
  
  CHILD_VIEW_TOKEN = os.getenv("KIDSCONTROL_CHILD_VIEW_TOKEN", "")
 +WIDGET_TOKEN = os.getenv("KIDSCONTROL_WIDGET_TOKEN", "")
++# Obergrenze für Cache-Control: max-age – Eltern-Aktionen sind nicht vorhersehbar
++STATUS_MAX_AGE = int(os.getenv("KIDSCONTROL_STATUS_MAX_AGE", "60"))
++HEARTBEAT_BATCH_MAX = int(os.getenv("KIDSCONTROL_HEARTBEAT_BATCH_MAX", "500"))
++METRICS_TOKEN = os.getenv("KIDSCONTROL_METRICS_TOKEN", "")
  
  app = FastAPI()
  app.add_middleware(SessionMiddleware, secret_key=SECRET)
++
++
++class CompressionMiddleware:
++    """Brotli (falls installiert, sonst gzip) für HTML/JSON; der SSE-Stream bleibt unkomprimiert."""
++
++    def __init__(self, app):
++        self.plain = app
++        if BrotliMiddleware is not None:
++            self.compressed = BrotliMiddleware(app, minimum_size=500)
++        else:
++            self.compressed = GZipMiddleware(app, minimum_size=500)
++
++    async def __call__(self, scope, receive, send):
++        if scope["type"] == "http" and not scope["path"].startswith("/api/stream/"):
++            await self.compressed(scope, receive, send)
++        else:
++            await self.plain(scope, receive, send)
++
++
++app.add_middleware(CompressionMiddleware)
++app.add_middleware(metrics.MetricsMiddleware)
  
  
  def now_local() -> datetime:
@@ -89,11 +139,108 @@
 +        return ""
 +    return REASON_MAP_DE.get(reason, reason)
 +
++
++# Sekunden-Countdown: ändert sich bei jedem Aufruf, folgt aber aus "until" und gehört nicht ins ETag
++_ETAG_SKIP = frozenset({"override_seconds_left"})
++
++
++def _etag_view(value):
++    if isinstance(value, dict):
++        return {k: _etag_view(v) for k, v in value.items() if k not in _ETAG_SKIP}
++    if isinstance(value, list):
++        return [_etag_view(v) for v in value]
++    return value
++
++
++def _state_etag(state) -> str:
++    """Schwaches ETag: gleich, solange sich der Zustand bis auf den Sekunden-Countdown nicht ändert."""
++    raw = json.dumps(_etag_view(state), sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
++    return 'W/"' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"'
++
++
++def _etag_matches(request: Request, etag: str) -> bool:
++    header = request.headers.get("if-none-match")
++    if not header:
++        return False
++    if header.strip() == "*":
++        return True
++    # schwacher Vergleich: W/ wird ignoriert
++    wanted = etag.removeprefix("W/")
++    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
++
++
++def _max_age(next_changes: list[str | None]) -> int:
++    """Sekunden bis zum frühesten next_change_at, gedeckelt auf STATUS_MAX_AGE."""
++    now = datetime.now(timezone.utc)
++    age = STATUS_MAX_AGE
++    for value in next_changes:
++        if value:
++            age = min(age, int((datetime.fromisoformat(value) - now).total_seconds()))
++    return max(0, age)
++
++
++def _conditional_json(
++    request: Request, payload: dict, fingerprint, next_changes: list[str | None], compact=None
++) -> Response:
++    """
++    ETag aus dem Zustand (ohne Serverzeit), 304 bei passendem If-None-Match.
++    max-age reicht bis zum nächsten absehbaren Zustandswechsel.
++    compact(): kompakte Fassung für MessagePack/CBOR (app/wire.py), falls der Client sie will.
++    """
++    fmt = wire.negotiate(request.headers.get("accept")) if compact else None
++    etag = _state_etag([fingerprint, fmt]) if fmt else _state_etag(fingerprint)
++    max_age = _max_age(next_changes)
++    cache = f"private, max-age={max_age}" if max_age else "private, no-cache"
++    headers = {"ETag": etag, "Cache-Control": cache}
++    if compact:
++        headers["Vary"] = "Accept"
++    if _etag_matches(request, etag):
++        return Response(status_code=304, headers=headers)
++    if fmt:
++        return Response(wire.encode(fmt, compact()), media_type=wire.MEDIA_TYPES[fmt], headers=headers)
++    return JSONResponse(payload, headers=headers)
++
++
++def _negotiated(request: Request, payload, compact) -> Response:
++    """JSON oder – per Accept – MessagePack/CBOR, ohne Caching (für Heartbeats)."""
++    fmt = wire.negotiate(request.headers.get("accept"))
++    headers = {"Vary": "Accept"}
++    if fmt:
++        return Response(wire.encode(fmt, compact()), media_type=wire.MEDIA_TYPES[fmt], headers=headers)
++    return JSONResponse(payload, headers=headers)
++
 +
  @app.on_event("startup")
  def _startup():
      init_db()
      ensure_profile_dir()
++    db = SessionLocal()
++    try:
++        policy_cache.rebuild(db)
++    finally:
++        db.close()
++    maintenance.start(TZ)
++    usage_buffer.start()
++    metrics.start()
++
++
++@app.on_event("startup")
++async def _start_live():
++    live.start(_live_status)
++    policy_cache.on_invalidate(live.poke)
++
++
++@app.on_event("shutdown")
++async def _stop_live():
++    await live.stop()
++    await async_engine.dispose()
++
++
++@app.on_event("shutdown")
++def _shutdown():
++    maintenance.stop()
++    usage_buffer.stop()
++    metrics.stop()
  
  
  @app.get("/healthz")
@@ -126,6 +273,44 @@
      finally:
          db.close()
  
++@app.get("/api/admin/usage/{user}/range")
++def api_admin_usage_range(
++    request: Request,
++    user: str,
++    from_: str | None = Query(None, alias="from"),
++    to: str | None = None,
++    granularity: str = "week",
++):
++    """Verlauf aus den Wochen-/Monatssummen; ohne from/to die letzten 12 Wochen."""
++    r = require_admin(request)
++    if r:
++        return r
++    from datetime import date, timedelta
++
++    try:
++        end = date.fromisoformat(to) if to else now_local().date()
++        start = date.fromisoformat(from_) if from_ else end - timedelta(weeks=12)
++    except ValueError:
++        return JSONResponse({"error": "from/to must be YYYY-MM-DD"}, status_code=400)
++    db = SessionLocal()
++    try:
++        buckets = usage_history.usage_range(db, user, start, end, granularity)
++    except ValueError as e:
++        return JSONResponse({"error": str(e)}, status_code=400)
++    finally:
++        db.close()
++    return JSONResponse(
++        {
++            "user": user,
++            "granularity": granularity,
++            "from": start.isoformat(),
++            "to": end.isoformat(),
++            "daily_retention_days": maintenance.USAGE_RETENTION_DAYS,
++            "buckets": buckets,
++        }
++    )
++
++
  @app.post("/api/admin/reset-daily/{user}")
  def api_admin_reset_daily(request: Request, user: str):
      r = require_admin(request)
@@ -134,42 +319,416 @@
      db = SessionLocal()
      try:
          day = now_local().date().isoformat()
-         db.query(DailyUsage).filter_by(username=user, day=day).delete(synchronize_session=False)
-         db.commit()
+-        db.query(DailyUsage).filter_by(username=user, day=day).delete(synchronize_session=False)
+-        db.commit()
++        # löscht Tageszeile und Intervalle und setzt die Marke für die Puffer der anderen Worker
++        usage_buffer.reset_day(db, user, day)
++        live.poke()
          return JSONResponse({"ok": True, "user": user, "day": day})
      finally:
          db.close()
  
  
++async def _widget_kids(adb, users: list[str] | None = None) -> tuple[list[dict], dict]:
++    """Widget-Zeilen für `users` (Standard: alle Kinder); ausgewertet werden nur diese."""
++    kids = await policy_cache.get_snapshot_async(adb)
++    users = list(kids) if users is None else [u for u in users if u in kids]
++    states = await evaluate_access_many_async(adb, users, tz=TZ)
++    payload = []
++    for username in users:
++        k = kids[username]
++        state = states[username]
++        payload.append(
++            {
++                "username": username,
++                "display_name": k["display_name"],
++                "allow": bool(state.get("allow")),
++                "reason": state.get("reason", ""),
++                "reason_label": _widget_reason_label(state.get("reason", "")),
++                "warn": bool(state.get("warn", False)),
++                "remaining_minutes": _widget_remaining_minutes(state),
++                "remaining_label": _widget_remaining_label(state),
++                "daily_remaining": state.get("daily_remaining"),
++                "daily_limit": state.get("daily_limit"),
++                "minutes_left_window": state.get("minutes_left_window"),
++                "override_text": state.get("override_text"),
++                "next_change_at": state.get("next_change_at"),
++            }
++        )
++    return payload, states
++
++
++async def _live_status() -> tuple[dict, datetime | None]:
++    async with AsyncSessionLocal() as adb:
++        payload, states = await _widget_kids(adb)
++    changes = [datetime.fromisoformat(st["next_change_at"]) for st in states.values() if st.get("next_change_at")]
++    return {"server_time": now_local().isoformat(), "kids": payload}, min(changes, default=None)
++
++
++def _widget_response(request: Request, payload: list[dict]) -> Response:
++    server_time = now_local().isoformat()
++    return _conditional_json(
++        request,
++        {"server_time": server_time, "kids": payload},
++        payload,
++        [k["next_change_at"] for k in payload],
++        compact=lambda: wire.envelope(server_time, k=[wire.compact_widget_row(k) for k in payload]),
++    )
++
++
++@app.get("/api/reasons")
++def api_reasons(request: Request):
++    """Wörterbuch Grund-Code -> Text für das kompakte Format; ändert sich nur mit neuer Version."""
++    etag = f'"{wire.REASONS_VERSION}"'
++    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
++    if _etag_matches(request, etag):
++        return Response(status_code=304, headers=headers)
++    return JSONResponse({"version": wire.REASONS_VERSION, **wire.reasons_document()}, headers=headers)
++
++
 +@app.get("/api/widget/status")
-+def api_widget_status(t: str | None = None):
++async def api_widget_status(request: Request, t: str | None = None):
 +    if WIDGET_TOKEN and t != WIDGET_TOKEN:
 +        return JSONResponse({"error": "unauthorized"}, status_code=401)
++    async with AsyncSessionLocal() as adb:
++        payload, _ = await _widget_kids(adb)
++    return _widget_response(request, payload)
++
++
++def _widget_token(request: Request, t: str | None) -> str | None:
++    auth = request.headers.get("authorization", "")
++    if auth.lower().startswith("bearer "):
++        return auth[7:].strip()
++    return t
++
++
++@app.get("/api/widget/status/{user}")
++async def api_widget_status_user(request: Request, user: str, t: str | None = None):
++    """
++    Status eines einzelnen Kindes für dessen Widget. Zugang: der Token des Kindes
++    (?t= oder Authorization: Bearer) oder der Haushalts-Token. Ohne Kind-Token
++    gilt dieselbe Regel wie für /api/widget/status.
++    """
++    token = _widget_token(request, t)
++    async with AsyncSessionLocal() as adb:
++        kids = await policy_cache.get_snapshot_async(adb)  # hält auch den Token-Index aktuell
++        child = kids.get(user)
++        if WIDGET_TOKEN and token == WIDGET_TOKEN:
++            allowed = True
++        elif child is not None and child["widget_token_hash"]:
++            allowed = widget_tokens.user_for(token) == user
++        else:
++            allowed = not WIDGET_TOKEN
++        if not allowed:
++            return JSONResponse({"error": "unauthorized"}, status_code=401)
++        if child is None:
++            return JSONResponse({"error": "unknown user"}, status_code=404)
++        payload, _ = await _widget_kids(adb, [user])
++    return _widget_response(request, payload)
++
++
++@app.post("/api/admin/widget-token/{user}")
++def api_admin_widget_token(request: Request, user: str):
++    """Neuen Widget-Token für ein Kind ausstellen; der Klartext wird nur hier einmal gezeigt."""
++    r = require_admin(request)
++    if r:
++        return r
++    db = SessionLocal()
++    try:
++        token = widget_tokens.issue(db, user, actor=logged_in(request))
++    finally:
++        db.close()
++    if token is None:
++        return JSONResponse({"error": "unknown user"}, status_code=404)
++    return JSONResponse({"user": user, "token": token, "url": f"/api/widget/status/{user}?t={token}"})
++
++
++@app.delete("/api/admin/widget-token/{user}")
++def api_admin_widget_token_revoke(request: Request, user: str):
++    r = require_admin(request)
++    if r:
++        return r
++    db = SessionLocal()
++    try:
++        ok = widget_tokens.revoke(db, user, actor=logged_in(request))
++    finally:
++        db.close()
++    if not ok:
++        return JSONResponse({"error": "unknown user"}, status_code=404)
++    return JSONResponse({"ok": True, "user": user})
++
++
++@app.get("/api/stream/status")
++async def api_stream_status(request: Request, t: str | None = None):
++    if WIDGET_TOKEN and t != WIDGET_TOKEN:
++        return JSONResponse({"error": "unauthorized"}, status_code=401)
++    last_id = request.headers.get("last-event-id", "")
++    return StreamingResponse(
++        live.events(int(last_id) if last_id.isdigit() else 0),
++        media_type="text/event-stream",
++        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
++    )
++
++
++@app.get("/api/status/{user}")
++async def api_status(request: Request, user: str):
++    # Nur lesen – zählt keine Nutzung (dafür: POST /api/heartbeat/{user})
++    async with AsyncSessionLocal() as adb:
++        state = await evaluate_access_async(adb, user=user, tz=TZ)
++    return _conditional_json(
++        request,
++        state,
++        state,
++        [state.get("next_change_at")],
++        compact=lambda: wire.envelope(now_local().isoformat(), s=wire.compact_state(state)),
++    )
++
++
++@app.get("/static/app.{css_hash}.css")
++def static_css(css_hash: str):
++    # Seiten verlinken die URL mit dem Inhalts-Hash (app/ui.py: CSS_URL)
++    cache = "public, max-age=31536000, immutable" if css_hash == CSS_HASH else "no-cache"
++    return Response(CSS, media_type="text/css; charset=utf-8", headers={"Cache-Control": cache})
++
++
++@app.get("/metrics")
++def api_metrics(t: str | None = None):
++    if METRICS_TOKEN and t != METRICS_TOKEN:
++        return JSONResponse({"error": "unauthorized"}, status_code=401)
++    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
++
++
++@app.get("/api/admin/maintenance")
++def api_admin_maintenance(request: Request):
++    r = require_admin(request)
++    if r:
++        return r
++    return JSONResponse(maintenance.status)
++
++
++@app.post("/api/admin/maintenance/run")
++def api_admin_maintenance_run(request: Request):
++    r = require_admin(request)
++    if r:
++        return r
++    return JSONResponse(maintenance.run_once(TZ))
++
++
++@app.post("/api/heartbeat/batch")
++async def api_heartbeat_batch(request: Request):
++    """
++    Body: {"heartbeats": [{"device": "...", "user": "kind1", "observed_at": "ISO-8601"}, ...]}
++    Antwort: eine Entscheidung pro Eintrag, gleiche Reihenfolge. Einträge, die
++    weiter zurückliegen als KIDSCONTROL_HEARTBEAT_MAX_BACKFILL_SECONDS, oder aus der
++    Zukunft zählen nicht und tragen "ignored": "stale" | "future".
++    """
++    try:
++        fmt = wire.content_format(request.headers.get("content-type"))
++        body = wire.decode(fmt, await request.body()) if fmt else await request.json()
++        items = body["heartbeats"]
++        records = [
++            {
++                "device": str(x.get("device") or ""),
++                "user": str(x["user"]),
++                "observed_at": datetime.fromisoformat(x["observed_at"]) if x.get("observed_at") else None,
++            }
++            for x in items
++        ]
++    except (ValueError, KeyError, TypeError, AttributeError):
++        return JSONResponse({"error": "invalid body"}, status_code=400)
++    if len(records) > HEARTBEAT_BATCH_MAX:
++        return JSONResponse({"error": f"max {HEARTBEAT_BATCH_MAX} heartbeats per batch"}, status_code=413)
++    async with AsyncSessionLocal() as adb:
++        results = await record_heartbeat_batch_async(adb, records, tz=TZ)
++    server_time = now_local().isoformat()
++    return _negotiated(
++        request,
++        {"server_time": server_time, "results": results},
++        lambda: wire.envelope(
++            server_time,
++            res=[
++                {"d": x["device"], "u": x["user"], "s": wire.compact_state(x["decision"]), **({"x": x["ignored"]} if "ignored" in x else {})}
++                for x in results
++            ],
++        ),
++    )
++
++
++@app.post("/api/heartbeat/{user}")
++async def api_heartbeat(request: Request, user: str, device: str = ""):
++    # Nur der durchsetzende Client ruft das auf – hier läuft das Tagesbudget mit.
++    # device: Kennung des Geräts; mehrere Geräte eines Kindes zählen nicht doppelt.
++    async with AsyncSessionLocal() as adb:
++        state = await record_heartbeat_async(adb, user=user, tz=TZ, device=device)
++    return _negotiated(request, state, lambda: wire.envelope(now_local().isoformat(), s=wire.compact_state(state)))
++
++
++async def _request_json(request: Request):
++    """Body für sync Handler schon im Event-Loop lesen; None, wenn es kein JSON ist."""
++    try:
++        return await request.json()
++    except ValueError:
++        return None
++
++
++async def _request_form(request: Request):
++    return await request.form()
++
++
++def _bulk_body(body) -> tuple[dict, list[str]] | JSONResponse:
++    """Body mit "users": [...] oder "all": true; unbekannte Kinder -> 400."""
++    try:
++        if not isinstance(body, dict):
++            raise ValueError
++        requested = [str(u) for u in body.get("users") or []]
++    except (ValueError, TypeError):
++        return JSONResponse({"error": "invalid body"}, status_code=400)
++    db = SessionLocal()
++    try:
++        known = policy_cache.get_snapshot(db)
++    finally:
++        db.close()
++    users = list(known) if body.get("all") else list(dict.fromkeys(requested))
++    unknown = [u for u in users if u not in known]
++    if unknown:
++        return JSONResponse({"error": "unknown users", "users": unknown}, status_code=400)
++    if not users:
++        return JSONResponse({"error": "no users"}, status_code=400)
++    return body, users
++
++
++@app.post("/api/admin/bulk/apply-profile")
++def api_admin_bulk_apply_profile(request: Request, body=Depends(_request_json)):
++    """
++    Body: {"users": ["kind1", ...] | "all": true, "profile": "Ferien"} oder statt
++    "profile" ein Wochenplan {"week": {...}} im Profilformat (app/profiles.py).
++    Ein Upsert für alle Schedule-Zeilen, ein AuditLog-Batch, ein Commit.
++    """
++    r = require_admin(request)
++    if r:
++        return r
++    parsed = _bulk_body(body)
++    if isinstance(parsed, Response):
++        return parsed
++    body, users = parsed
++    name = str(body.get("profile") or "")
++    profile = {"week": body["week"]} if isinstance(body.get("week"), dict) else load_profile(name) if name else None
++    if profile is None:
++        return JSONResponse({"error": "unknown profile"}, status_code=400)
++    db = SessionLocal()
++    try:
++        rows = apply_profile(db, users, profile, actor=logged_in(request), name=name)
++    except (KeyError, TypeError, ValueError):
++        db.rollback()
++        return JSONResponse({"error": "invalid week"}, status_code=400)
++    finally:
++        db.close()
++    return JSONResponse({"ok": True, "users": users, "schedule_rows": rows})
++
++
++@app.post("/api/admin/bulk/grant")
++def api_admin_bulk_grant(request: Request, body=Depends(_request_json)):
++    """
++    Body: {"users": [...] | "all": true, "type": "hour" | "day", "hours": 1}
++    hour: +hours Sonderfreigabe je Kind (wie /grant/{user}/hour), day: heute unbegrenzt.
++    """
++    r = require_admin(request)
++    if r:
++        return r
++    parsed = _bulk_body(body)
++    if isinstance(parsed, Response):
++        return parsed
++    body, users = parsed
++    kind = body.get("type", "hour")
++    db = SessionLocal()
++    try:
++        if kind == "hour":
++            try:
++                hours = int(body.get("hours", 1))
++            except (TypeError, ValueError):
++                hours = 0
++            if not 1 <= hours <= 24:
++                return JSONResponse({"error": "hours must be 1..24"}, status_code=400)
++            until = grants.grant_hours(db, users, actor=logged_in(request), hours=hours)
++            return JSONResponse({"ok": True, "type": "hour", "until": {u: t.isoformat() for u, t in until.items()}})
++        if kind == "day":
++            day = now_local().date().isoformat()
++            grants.grant_day(db, users, actor=logged_in(request), day=day)
++            return JSONResponse({"ok": True, "type": "day", "day": day, "users": users})
++        return JSONResponse({"error": "type must be hour or day"}, status_code=400)
++    finally:
++        db.close()
++
++
++@app.get("/api/bundle/{user}")
++async def api_bundle(
++    request: Request, user: str, hours: int = offline_bundle.BUNDLE_DEFAULT_HOURS, t: str | None = None
++):
++    """
++    Signierte Zeitleiste für die lokale Durchsetzung (app/offline_bundle.py); zählt keine Nutzung.
++    Zugang: Admin-Session oder der Widget-Token des Kindes (?t= oder Authorization: Bearer).
++    """
++    if not offline_bundle.BUNDLE_KEY:
++        return JSONResponse({"error": "KIDSCONTROL_BUNDLE_KEY not configured"}, status_code=503)
++    async with AsyncSessionLocal() as adb:
++        if require_admin(request) is not None:
++            await policy_cache.get_snapshot_async(adb)  # hält den Token-Index aktuell
++            if widget_tokens.user_for(_widget_token(request, t)) != user:
++                return JSONResponse({"error": "unauthorized"}, status_code=401)
++        bundle = await offline_bundle.load_bundle_async(adb, user, now_local(), hours)
++    if bundle is None:
++        return JSONResponse({"error": "unknown user"}, status_code=404)
++    return JSONResponse(bundle, headers={"Cache-Control": "private, no-store"})
++
++
++@app.get("/ui/schedule/{user}/week")
++def ui_schedule_week(request: Request, user: str):
++    """Zeitplan-Editor mit mehreren Fenstern pro Tag, direkt aus dem Policy-Snapshot."""
++    r = require_admin(request)
++    if r:
++        return r
++    db = SessionLocal()
++    try:
++        child = policy_cache.get_snapshot(db).get(user)
++    finally:
++        db.close()
++    if child is None:
++        return HTMLResponse("<h1>Unbekanntes Kind</h1>", status_code=404)
++    return HTMLResponse(
++        render_schedule_editor(CSS, user, child["display_name"], child["week"], PRESETS, list_profiles())
++    )
++
++
++@app.post("/ui/schedule/{user}/week")
++def ui_schedule_week_save(request: Request, user: str, form=Depends(_request_form)):
++    r = require_admin(request)
++    if r:
++        return r
++    action = form.get("action") or "save_schedule"
++    name = (form.get("profile_name") or "").strip()
++    edited = parse_schedule_form(form)
++
++    if action == "save_profile":
++        if name:
++            save_profile(name, week_profile(edited["week"]))
++        return RedirectResponse(f"/ui/schedule/{user}/week", status_code=303)
++
++    if action == "apply_preset":
++        name = form.get("preset") or ""
++        profile, details = PRESETS.get(name), f"Preset: {name}"
++    elif action == "load_profile":
++        profile, details = load_profile(name) if name else None, f"Profil: {name}"
++    else:
++        profile, details = edited, "Zeitplan gespeichert"
++    if profile is None:
++        return RedirectResponse(f"/ui/schedule/{user}/week", status_code=303)
++
 +    db = SessionLocal()
 +    try:
-+        kids = db.query(Child).order_by(Child.username.asc()).all()
-+        payload = []
-+        for k in kids:
-+            state = compute_access(db, user=k.username, tz=TZ, include_debug=False)
-+            payload.append(
-+                {
-+                    "username": k.username,
-+                    "display_name": k.display_name or k.username,
-+                    "allow": bool(state.get("allow")),
-+                    "reason": state.get("reason", ""),
-+                    "reason_label": _widget_reason_label(state.get("reason", "")),
-+                    "warn": bool(state.get("warn", False)),
-+                    "remaining_minutes": _widget_remaining_minutes(state),
-+                    "remaining_label": _widget_remaining_label(state),
-+                    "daily_remaining": state.get("daily_remaining"),
-+                    "daily_limit": state.get("daily_limit"),
-+                    "minutes_left_window": state.get("minutes_left_window"),
-+                    "override_text": state.get("override_text"),
-+                }
-+            )
-+        return JSONResponse({"server_time": now_local().isoformat(), "kids": payload})
++        apply_profile(db, [user], profile, actor=logged_in(request), details=details)
 +    finally:
 +        db.close()
++    return RedirectResponse(f"/ui/schedule/{user}/week", status_code=303)
 +
 +
  # =========================
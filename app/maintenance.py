@@ -0,0 +1,216 @@
+"""Hintergrund-Wartung: einmal täglich (oder im Intervall) statt bei jedem Poll.
+
+Jobs:
+- daily_usage: abgeschlossene Tage in Wochen-/Monatssummen einrechnen
+  (app/usage_history.py), danach Zeilen älter als USAGE_RETENTION_DAYS löschen
+- usage_intervals: Zeilen älter als USAGE_RETENTION_DAYS löschen
+- usage_resets: Marken von "Tag zurücksetzen" nach zwei Tagen löschen
+- overrides / prewarn_log: abgelaufene Einträge entfernen
+- SQLite: PRAGMA optimize + incremental_vacuum (auto_vacuum=INCREMENTAL, siehe Migration 004)
+
+Jeder Worker startet den Scheduler, laufen darf aber nur einer: wer fällig
+ist, holt sich vorher die Zeile in `maintenance_lease`. Die anderen lassen den
+Termin aus.
+
+Konfiguration über Umgebungsvariablen:
+- KIDSCONTROL_MAINTENANCE_AT="03:30"        feste lokale Uhrzeit (Standard)
+- KIDSCONTROL_MAINTENANCE_INTERVAL_SECONDS  stattdessen alle N Sekunden
+- KIDSCONTROL_USAGE_RETENTION_DAYS=14
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text, update
+from sqlalchemy.exc import IntegrityError
+
+from app import metrics, usage_history
+from app.db import SessionLocal, DailyUsage, MaintenanceLease, Override, PrewarnLog, UsageInterval, UsageReset
+
+MAINTENANCE_AT = os.getenv("KIDSCONTROL_MAINTENANCE_AT", "03:30")
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("KIDSCONTROL_MAINTENANCE_INTERVAL_SECONDS", "0"))
+USAGE_RETENTION_DAYS = int(os.getenv("KIDSCONTROL_USAGE_RETENTION_DAYS", "14"))
+
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_holder = f"{socket.gethostname()}:{os.getpid()}"
+
+status = {
+    "running": False,
+    "last_run_at": None,
+    "last_duration_ms": None,
+    "last_ok": None,
+    "next_run_at": None,
+    "last_skipped_at": None,
+    "jobs": {},
+}
+
+
+def prune_daily_usage(db, today) -> int:
+    # in derselben Transaktion: keine Tageszeile verschwindet, bevor sie in den Summen steckt
+    usage_history.rollup(db, today)
+    cutoff = (today - timedelta(days=USAGE_RETENTION_DAYS)).isoformat()
+    return db.query(DailyUsage).filter(DailyUsage.day < cutoff).delete(synchronize_session=False)
+
+
+def prune_usage_intervals(db, today) -> int:
+    cutoff = (today - timedelta(days=USAGE_RETENTION_DAYS)).isoformat()
+    return db.query(UsageInterval).filter(UsageInterval.day < cutoff).delete(synchronize_session=False)
+
+
+def prune_usage_resets(db, today) -> int:
+    # Marken braucht nur der Nutzungspuffer, und der kennt nur heute und gestern
+    cutoff = (today - timedelta(days=2)).isoformat()
+    return db.query(UsageReset).filter(UsageReset.day < cutoff).delete(synchronize_session=False)
+
+
+def prune_overrides(db, today) -> int:
+    # Abgelaufene Freigaben werden nur noch für den Verlauf gebraucht
+    cutoff = datetime.now(timezone.utc) - timedelta(days=USAGE_RETENTION_DAYS)
+    return db.query(Override).filter(Override.grant_until < cutoff).delete(synchronize_session=False)
+
+
+def prune_prewarn_log(db, today) -> int:
+    cutoff = (today - timedelta(days=USAGE_RETENTION_DAYS)).isoformat()
+    return db.query(PrewarnLog).filter(PrewarnLog.day < cutoff).delete(synchronize_session=False)
+
+
+def sqlite_optimize(db, today) -> int:
+    if db.get_bind().dialect.name != "sqlite":
+        return 0
+    db.execute(text("PRAGMA optimize"))
+    db.execute(text("PRAGMA incremental_vacuum"))
+    return 0
+
+
+JOBS = [
+    ("daily_usage", prune_daily_usage),
+    ("usage_intervals", prune_usage_intervals),
+    ("usage_resets", prune_usage_resets),
+    ("overrides", prune_overrides),
+    ("prewarn_log", prune_prewarn_log),
+    ("sqlite_optimize", sqlite_optimize),
+]
+
+
+def run_once(tz: ZoneInfo) -> dict:
+    """Alle Jobs nacheinander; ein Fehler in einem Job stoppt die anderen nicht."""
+    with _lock:
+        status["running"] = True
+        started = time.monotonic()
+        today = datetime.now(tz).date()
+        jobs = {}
+        db = SessionLocal()
+        try:
+            for name, job in JOBS:
+                t0 = time.monotonic()
+                try:
+                    rows = job(db, today)
+                    db.commit()
+                    jobs[name] = {"ok": True, "rows": rows, "duration_ms": round((time.monotonic() - t0) * 1000, 1)}
+                except Exception as e:
+                    db.rollback()
+                    jobs[name] = {"ok": False, "error": str(e), "duration_ms": round((time.monotonic() - t0) * 1000, 1)}
+        finally:
+            db.close()
+        status["running"] = False
+        status["last_run_at"] = datetime.now(tz).isoformat()
+        status["last_duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+        status["last_ok"] = all(j["ok"] for j in jobs.values())
+        status["jobs"] = jobs
+        return dict(status)
+
+
+def _gauges():
+    out = [
+        ({"job": "all", "kind": "running"}, 1 if status["running"] else 0),
+        ({"job": "all", "kind": "ok"}, 1 if status["last_ok"] else 0),
+        ({"job": "all", "kind": "duration_ms"}, status["last_duration_ms"] or 0),
+    ]
+    for name, j in status["jobs"].items():
+        out.append(({"job": name, "kind": "ok"}, 1 if j["ok"] else 0))
+        out.append(({"job": name, "kind": "duration_ms"}, j["duration_ms"]))
+        out.append(({"job": name, "kind": "rows"}, j.get("rows") or 0))
+    return out
+
+
+metrics.register_gauges("kidscontrol_maintenance", "Letzter Wartungslauf (ok, Dauer, gelöschte Zeilen)", _gauges)
+
+
+def next_run(now: datetime) -> datetime:
+    if MAINTENANCE_INTERVAL_SECONDS > 0:
+        return now + timedelta(seconds=MAINTENANCE_INTERVAL_SECONDS)
+    h, m = (int(x) for x in MAINTENANCE_AT.split(":", 1))
+    at = now.replace(hour=h, minute=m, second=0, microsecond=0)
+    if at <= now:
+        at += timedelta(days=1)
+    return at
+
+
+def lease_seconds() -> float:
+    """Wie lange ein Lauf den Termin für die anderen Worker belegt."""
+    if MAINTENANCE_INTERVAL_SECONDS > 0:
+        return MAINTENANCE_INTERVAL_SECONDS * 0.9
+    return 3600.0
+
+
+def acquire_lease(seconds: float) -> bool:
+    """True, wenn dieser Prozess den fälligen Lauf übernehmen darf."""
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        if db.get(MaintenanceLease, 1) is None:
+            try:
+                db.add(MaintenanceLease(id=1, holder="", lease_until=now - timedelta(seconds=1)))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+        won = db.execute(
+            update(MaintenanceLease)
+            .where(MaintenanceLease.id == 1, MaintenanceLease.lease_until < now)
+            .values(holder=_holder, lease_until=now + timedelta(seconds=seconds))
+        ).rowcount
+        db.commit()
+        return bool(won)
+    finally:
+        db.close()
+
+
+def _loop(tz: ZoneInfo):
+    while not _stop.is_set():
+        now = datetime.now(tz)
+        at = next_run(now)
+        status["next_run_at"] = at.isoformat()
+        if _stop.wait((at - now).total_seconds()):
+            break
+        try:
+            mine = acquire_lease(lease_seconds())
+        except Exception as e:
+            print(f"[WARN] Wartung: Lease nicht lesbar: {e}")
+            continue
+        if mine:
+            run_once(tz)
+        else:
+            status["last_skipped_at"] = datetime.now(tz).isoformat()
+
+
+def start(tz: ZoneInfo):
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(tz,), name="kidscontrol-maintenance", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
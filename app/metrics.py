@@ -0,0 +1,353 @@
+"""Laufzeit-Metriken im Prometheus-Textformat (GET /metrics).
+
+Jeder Prozess zählt im Speicher: Counter, Histogramme und Gauges (letztere
+werden erst beim Auslesen über registrierte Collector-Funktionen erhoben).
+Mit mehreren uvicorn-Workern KIDSCONTROL_METRICS_DIR auf ein gemeinsames
+Verzeichnis setzen: jeder Worker schreibt dann alle
+KIDSCONTROL_METRICS_DUMP_SECONDS einen Snapshot `metrics-<pid>-<start>.json`
+dorthin, und der Worker, der /metrics beantwortet, summiert alle Snapshots.
+<start> ist der Startzeitpunkt des Prozesses: ein neuer Worker mit recycelter
+PID überschreibt nicht die Datei seines Vorgängers. Snapshots beendeter Worker
+werden beim Auslesen gelöscht; deren Counter fallen damit weg (für Prometheus
+ein Reset wie nach einem Neustart).
+
+Quellen:
+- MetricsMiddleware: Latenz und SQL-Queries pro Route
+- SQLAlchemy-Engine-Events: Anzahl/Dauer aller Queries, SQLite-busy-Fehler
+- app/policy.py: Entscheidungen pro reason, Dauer pro Stufe
+- Gauges: usage_buffer, maintenance, live (siehe register_gauges)
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.db import engine, async_engine
+
+METRICS_DIR = os.getenv("KIDSCONTROL_METRICS_DIR", "")
+METRICS_DUMP_SECONDS = float(os.getenv("KIDSCONTROL_METRICS_DUMP_SECONDS", "5"))
+# SQLites busy-Handler wartet intern; schreibende Statements, die länger dauern, zählen als Lock-Wartezeit
+LOCK_WAIT_SECONDS = float(os.getenv("KIDSCONTROL_METRICS_LOCK_WAIT_MS", "50")) / 1000
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name -> (Typ, Hilfetext, Buckets)
+METRICS = {
+    "kidscontrol_http_request_duration_seconds": ("histogram", "HTTP-Latenz pro Route", LATENCY_BUCKETS),
+    "kidscontrol_http_request_queries": ("histogram", "SQL-Queries pro HTTP-Request", QUERY_BUCKETS),
+    "kidscontrol_http_request_sql_seconds": ("histogram", "SQL-Zeit pro HTTP-Request", LATENCY_BUCKETS),
+    "kidscontrol_sql_queries_total": ("counter", "Ausgeführte SQL-Statements", None),
+    "kidscontrol_sql_duration_seconds": ("histogram", "Dauer einzelner SQL-Statements", LATENCY_BUCKETS),
+    "kidscontrol_sqlite_busy_errors_total": ("counter", "SQLite 'database is locked/busy' nach Ablauf von busy_timeout", None),
+    "kidscontrol_sqlite_lock_waits_total": ("counter", "Schreibende Statements über KIDSCONTROL_METRICS_LOCK_WAIT_MS", None),
+    "kidscontrol_sqlite_lock_wait_seconds_total": ("counter", "Zeit in diesen Statements", None),
+    "kidscontrol_decisions_total": ("counter", "Entscheidungen pro reason", None),
+    "kidscontrol_decision_stage_seconds": ("histogram", "Dauer der Stufen in evaluate_access/record_heartbeat", LATENCY_BUCKETS),
+}
+
+_lock = threading.Lock()
+# (name, labels) -> Wert bzw. [Bucket-Zähler..., sum, count]
+_counters: dict[tuple[str, tuple], float] = {}
+_hists: dict[tuple[str, tuple], list] = {}
+_collectors: list = []
+
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_ident: tuple[int, str] | None = None
+
+
+def _key(name: str, labels: dict | None) -> tuple[str, tuple]:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, labels: dict | None = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+
+
+def observe(name: str, value: float, labels: dict | None = None):
+    buckets = METRICS[name][2]
+    k = _key(name, labels)
+    with _lock:
+        h = _hists.get(k)
+        if h is None:
+            h = _hists[k] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def register_gauges(name: str, help_text: str, collect):
+    """collect() -> Liste von (labels-dict, Wert); wird erst beim Auslesen aufgerufen."""
+    METRICS.setdefault(name, ("gauge", help_text, None))
+    _collectors.append((name, collect))
+
+
+# =========================
+# SQL (Engine-Events)
+# =========================
+# pro HTTP-Request: [Queries, Sekunden]; von der Middleware gesetzt
+request_sql: contextvars.ContextVar[list | None] = contextvars.ContextVar("kidscontrol_request_sql", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("kidscontrol_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("kidscontrol_t0")
+    dt = time.perf_counter() - starts.pop() if starts else 0.0
+    inc("kidscontrol_sql_queries_total")
+    observe("kidscontrol_sql_duration_seconds", dt)
+    if dt > LOCK_WAIT_SECONDS and context is not None and context.isinsert | context.isupdate | context.isdelete:
+        inc("kidscontrol_sqlite_lock_waits_total")
+        inc("kidscontrol_sqlite_lock_wait_seconds_total", value=dt)
+    acc = request_sql.get()
+    if acc is not None:
+        acc[0] += 1
+        acc[1] += dt
+
+
+def _handle_error(ctx):
+    starts = ctx.connection.info.get("kidscontrol_t0") if ctx.connection is not None else None
+    if starts:
+        starts.pop()
+    err = ctx.original_exception
+    if isinstance(ctx.sqlalchemy_exception, OperationalError) or type(err).__name__ == "OperationalError":
+        msg = str(err).lower()
+        if "locked" in msg or "busy" in msg:
+            inc("kidscontrol_sqlite_busy_errors_total")
+
+
+def instrument(target_engine):
+    event.listen(target_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(target_engine, "handle_error", _handle_error)
+
+
+instrument(engine)
+instrument(async_engine.sync_engine)
+
+
+# =========================
+# HTTP (ASGI-Middleware)
+# =========================
+class MetricsMiddleware:
+    """Latenz und SQL pro Route-Template; der SSE-Stream läuft unbegrenzt und wird ausgelassen."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/api/stream/"):
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        acc = [0, 0.0]
+        token = request_sql.set(acc)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            dt = time.perf_counter() - t0
+            request_sql.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "other"
+            labels = {"route": route, "method": scope["method"], "status": str(status["code"])}
+            observe("kidscontrol_http_request_duration_seconds", dt, labels)
+            labels = {"route": route}
+            observe("kidscontrol_http_request_queries", acc[0], labels)
+            observe("kidscontrol_http_request_sql_seconds", acc[1], labels)
+
+
+# =========================
+# Export / Aggregation
+# =========================
+def snapshot() -> dict:
+    with _lock:
+        counters = [[n, list(map(list, lbl)), v] for (n, lbl), v in _counters.items()]
+        hists = [[n, list(map(list, lbl)), list(h)] for (n, lbl), h in _hists.items()]
+    gauges = []
+    for name, collect in _collectors:
+        try:
+            for labels, value in collect():
+                gauges.append([name, sorted([k, str(v)] for k, v in labels.items()), float(value)])
+        except Exception as e:
+            print(f"[WARN] Metrik {name} nicht erhebbar: {e}")
+    pid, start = _identity()
+    return {"pid": pid, "start": start, "at": time.time(), "counters": counters, "hists": hists, "gauges": gauges}
+
+
+def _proc_start(pid: int) -> str:
+    """Startzeitpunkt in Ticks seit Boot (/proc/<pid>/stat, Feld 22); "" ohne /proc."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return ""
+    # der Prozessname in Klammern darf Leerzeichen enthalten
+    return stat.rsplit(b")", 1)[1].split()[19].decode()
+
+
+def _identity() -> tuple[int, str]:
+    """(pid, start) dieses Prozesses; nach fork() neu erhoben."""
+    global _ident
+    pid = os.getpid()
+    if _ident is None or _ident[0] != pid:
+        _ident = (pid, _proc_start(pid) or f"t{time.time_ns()}")
+    return _ident
+
+
+def _dump_path(pid: int, start: str) -> str:
+    return os.path.join(METRICS_DIR, f"metrics-{pid}-{start}.json")
+
+
+def dump():
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _dump_path(*_identity())
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _alive(pid: int, start: str = "") -> bool:
+    """Läuft noch derselbe Prozess? Bei recycelter PID weicht der Startzeitpunkt ab."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if start and not start.startswith("t"):
+        current = _proc_start(pid)
+        return not current or current == start
+    return True
+
+
+def collect_all() -> list[dict]:
+    """Eigener Snapshot (frisch) plus die der anderen laufenden Worker aus METRICS_DIR."""
+    own = snapshot()
+    snaps = [own]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for fn in os.listdir(METRICS_DIR):
+            if not (fn.startswith("metrics-") and fn.endswith(".json")):
+                continue
+            path = os.path.join(METRICS_DIR, fn)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if (snap.get("pid"), snap.get("start", "")) == (own["pid"], own["start"]):
+                continue
+            if not _alive(int(snap.get("pid", 0)), snap.get("start", "")):
+                # beendeter Worker (oder Vorgänger mit derselben PID): Datei aufräumen
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            snaps.append(snap)
+    return snaps
+
+
+def _esc(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels) + "}"
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render() -> str:
+    counters: dict[tuple, float] = {}
+    hists: dict[tuple, list] = {}
+    gauges: dict[tuple, float] = {}
+    for snap in collect_all():
+        pid_label = [["pid", str(snap["pid"])]] if METRICS_DIR else []
+        for name, labels, v in snap["counters"]:
+            k = (name, tuple(map(tuple, labels)))
+            counters[k] = counters.get(k, 0.0) + v
+        for name, labels, h in snap["hists"]:
+            k = (name, tuple(map(tuple, labels)))
+            if k in hists and len(hists[k]) == len(h):
+                hists[k] = [a + b for a, b in zip(hists[k], h)]
+            else:
+                hists[k] = list(h)
+        for name, labels, v in snap["gauges"]:
+            gauges[(name, tuple(map(tuple, sorted(labels + pid_label))))] = v
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = (
+            [(k, v) for k, v in counters.items() if k[0] == name]
+            + [(k, v) for k, v in hists.items() if k[0] == name]
+            + [(k, v) for k, v in gauges.items() if k[0] == name]
+        )
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (_, labels), v in sorted(series):
+            if kind != "histogram":
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt(v)}")
+                continue
+            for bound, count in zip(buckets, v):
+                lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', _fmt(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {v[-1]}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt(v[-2])}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {v[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _loop():
+    while not _stop.wait(METRICS_DUMP_SECONDS):
+        try:
+            dump()
+        except Exception as e:
+            print(f"[WARN] Metriken nicht geschrieben: {e}")
+
+
+def start():
+    global _thread
+    if not METRICS_DIR or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="kidscontrol-metrics", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
+    try:
+        dump()
+    except OSError:
+        pass
@@ -0,0 +1,134 @@
+"""Versionierte Schema-Migrationen.
+
+`create_all()` legt nur fehlende Tabellen an – neue Indizes oder Spalten
+erreichen bestehende Datenbanken so nie. Deshalb läuft beim Start nach
+`create_all()` dieser Runner: er merkt sich in `schema_migrations`, was
+schon angewendet wurde, und spielt den Rest in Reihenfolge ein, jede
+Migration in ihrer eigenen Transaktion. init_db() hält dabei startup_lock(),
+damit parallel startende Worker nicht gleichzeitig Tabellen anlegen oder
+dieselbe Spalte per ALTER TABLE hinzufügen.
+
+Neue Migration: Funktion `_mNNN_...(conn)` schreiben und unten in
+MIGRATIONS mit der nächsten Nummer eintragen. Migrationen müssen auch auf
+frischen Datenbanken funktionieren (dort hat create_all() schon alles
+angelegt), also `IF NOT EXISTS` bzw. vorher prüfen.
+"""
+
+from __future__ import annotations
+
+import fcntl
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from app.db import SchemaMigration
+
+
+def _m001_hot_path_indexes(conn):
+    # passend zu den Queries in Policy, Grant-Endpunkten, Audit-Ansicht und Wartung
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_overrides_user_until ON overrides (username, grant_until)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_log_child_at ON audit_log (child, at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_log_at ON audit_log (at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_daily_usage_day ON daily_usage (day)"))
+
+
+def _m002_schedule_windows(conn):
+    # mehrere Zeitfenster pro Tag (app/schedule_bitmap.py)
+    columns = {c["name"] for c in inspect(conn).get_columns("schedules")}
+    if "windows" not in columns:
+        conn.execute(text("ALTER TABLE schedules ADD COLUMN windows VARCHAR"))
+
+
+def _m003_widget_tokens(conn):
+    # Widget-Token pro Kind (app/widget_tokens.py)
+    columns = {c["name"] for c in inspect(conn).get_columns("children")}
+    if "widget_token_hash" not in columns:
+        conn.execute(text("ALTER TABLE children ADD COLUMN widget_token_hash VARCHAR"))
+    conn.execute(
+        text("CREATE UNIQUE INDEX IF NOT EXISTS ix_children_widget_token_hash ON children (widget_token_hash)")
+    )
+
+
+def _m004_sqlite_incremental_vacuum(conn):
+    # PRAGMA incremental_vacuum (app/maintenance.py) braucht auto_vacuum=INCREMENTAL;
+    # bei bestehenden Dateien greift die Umstellung erst nach einem VACUUM.
+    # VACUUM geht nur außerhalb einer Transaktion, also vor jedem Schreibzugriff.
+    if conn.dialect.name != "sqlite" or conn.engine.url.database in (None, "", ":memory:"):
+        return
+    if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+
+
+MIGRATIONS = [
+    (1, "hot-path indexes", _m001_hot_path_indexes),
+    (2, "schedule windows", _m002_schedule_windows),
+    (3, "widget tokens", _m003_widget_tokens),
+    (4, "sqlite incremental vacuum", _m004_sqlite_incremental_vacuum),
+]
+
+
+def applied_versions(conn) -> set[int]:
+    return {row[0] for row in conn.execute(SchemaMigration.__table__.select().with_only_columns(SchemaMigration.version))}
+
+
+# Schlüssel für pg_advisory_lock, beliebig aber fest
+_PG_LOCK_KEY = 0x4B494453
+
+
+@contextmanager
+def startup_lock(engine):
+    """
+    Mehrere Worker starten gleichzeitig: nur einer legt Tabellen an und
+    migriert, die anderen warten und finden danach alles fertig vor.
+    SQLite: flock auf eine Datei neben der Datenbank, PostgreSQL: Advisory Lock.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _PG_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PG_LOCK_KEY})
+        return
+    path = engine.url.database
+    if engine.dialect.name != "sqlite" or not path or path == ":memory:":
+        yield
+        return
+    with open(f"{path}.init-lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def run_migrations(engine) -> list[int]:
+    """Wendet alle noch fehlenden Migrationen an und gibt deren Versionen zurück."""
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, name, migrate in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(
+                    SchemaMigration.__table__.insert().values(
+                        version=version, name=name, applied_at=datetime.now(timezone.utc)
+                    )
+                )
+        except (IntegrityError, OperationalError, ProgrammingError):
+            # ohne startup_lock: ein anderer Worker war schneller, wenn seine
+            # Version jetzt eingetragen ist ("duplicate column", doppelter Eintrag)
+            with engine.connect() as conn:
+                if version in applied_versions(conn):
+                    continue
+            raise
+        applied.append(version)
+        print(f"[INFO] Migration {version:03d} angewendet: {name}")
+    return applied
@@ -0,0 +1,139 @@
+"""Signiertes Offline-Paket pro Kind: vorausberechnete Zeitleiste für die nächsten Stunden.
+
+Der Client holt das Paket selten (siehe refresh_after) und entscheidet
+dazwischen lokal: Zeitleiste + Restbudget. Fällt der Server aus, gilt das
+letzte Paket bis valid_until weiter.
+
+Inhalt (payload):
+- timeline: lückenlose Abschnitte {from, to, state, reason, counts}
+  state ist allow | warn | deny, aus Zeitplan, Freigaben und "heute unbegrenzt".
+  counts=True: in diesem Abschnitt läuft das Tagesbudget mit.
+- budget: pro lokalem Tag daily_limit, used (nur heute bekannt), remaining.
+  Der Client zieht in counts-Abschnitten die eigene Nutzung ab; bei 0 gilt deny.
+- policy_version: Version des Policy-Snapshots. Ändert sich die Policy, ist das Paket veraltet.
+
+Signatur: HMAC-SHA256 über das kanonische JSON des payload (sortierte
+Schlüssel, keine Leerzeichen, UTF-8) mit KIDSCONTROL_BUNDLE_KEY. Der Schlüssel
+gehört nur auf die Server und in den root-Agenten der Clients, nicht in
+Benutzerkonten.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from app import policy_cache, usage_buffer
+from app.policy import COUNTING_REASONS, clock_at, decide
+
+BUNDLE_KEY = os.getenv("KIDSCONTROL_BUNDLE_KEY", "")
+BUNDLE_DEFAULT_HOURS = int(os.getenv("KIDSCONTROL_BUNDLE_HOURS", "24"))
+BUNDLE_MAX_HOURS = 48
+# Empfohlener Abstand zwischen zwei Abrufen; Policy-Änderungen kommen spätestens dann an
+BUNDLE_REFRESH_SECONDS = int(os.getenv("KIDSCONTROL_BUNDLE_REFRESH_SECONDS", "900"))
+
+FORMAT = 1
+ALG = "HMAC-SHA256"
+# Schutz gegen Endlosschleifen bei kaputten Daten (normal: eine Handvoll pro Tag)
+_MAX_STEPS = 2000
+
+
+def _state(out: dict) -> str:
+    if not out.get("allow"):
+        return "deny"
+    return "warn" if out.get("warn") else "allow"
+
+
+def timeline(user: str, child: dict, start: datetime, until: datetime) -> list[dict]:
+    """
+    Entscheidungen von `start` bis `until` als Abschnitte. Gerechnet wird mit
+    decide() und leerem Budget-Verbrauch – das Budget verwaltet der Client selbst.
+    """
+    rows = {"children": {user: child}, "usages": {user: 0}}
+    segments: list[dict] = []
+    at = start
+    for _ in range(_MAX_STEPS):
+        out = decide(user, rows, clock_at(at))
+        # fromisoformat liefert nur einen festen Offset; zurück in die Zone,
+        # sonst stimmt der Offset nach einer Sommer-/Winterzeit-Umstellung nicht
+        nxt = min(datetime.fromisoformat(out["next_change_at"]).astimezone(start.tzinfo), until)
+        seg = {
+            "state": _state(out),
+            "reason": out["reason"],
+            "counts": out["reason"] in COUNTING_REASONS,
+        }
+        last = segments[-1] if segments else None
+        if last and all(last[k] == seg[k] for k in ("state", "reason", "counts")):
+            last["to"] = nxt.isoformat()
+        else:
+            segments.append({"from": at.isoformat(), "to": nxt.isoformat(), **seg})
+        if nxt >= until:
+            break
+        at = nxt
+    return segments
+
+
+def budget(child: dict, used_today: int, start: datetime, until: datetime) -> list[dict]:
+    out = []
+    day = start.date()
+    while day <= until.date():
+        sched = child["week"].get(day.weekday())
+        limit = sched["daily_minutes"] if sched else 0
+        used = used_today if day == start.date() else 0
+        out.append({"day": day.isoformat(), "daily_limit": limit, "used": used, "remaining": max(0, limit - used)})
+        day += timedelta(days=1)
+    return out
+
+
+def build(user: str, child: dict, used_today: int, now_loc: datetime, hours: int, policy_version: int | None) -> dict:
+    hours = max(1, min(BUNDLE_MAX_HOURS, int(hours)))
+    # in UTC rechnen: über eine Zeitumstellung hinweg sind es sonst nicht `hours` Stunden
+    now_utc = now_loc.astimezone(timezone.utc)
+    until = (now_utc + timedelta(hours=hours)).astimezone(now_loc.tzinfo)
+    return {
+        "format": FORMAT,
+        "user": user,
+        "policy_version": policy_version,
+        "issued_at": now_loc.isoformat(),
+        "valid_until": until.isoformat(),
+        "refresh_after": (now_utc + timedelta(seconds=BUNDLE_REFRESH_SECONDS)).astimezone(now_loc.tzinfo).isoformat(),
+        "warn_minutes": child["warn_minutes"],
+        "after_expiry_mode": child["after_expiry_mode"],
+        "timeline": timeline(user, child, now_loc, until),
+        "budget": budget(child, used_today, now_loc, until),
+    }
+
+
+def canonical(payload: dict) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def sign(payload: dict, key: str | None = None) -> dict:
+    key = BUNDLE_KEY if key is None else key
+    sig = hmac.new(key.encode("utf-8"), canonical(payload), hashlib.sha256).hexdigest()
+    return {"alg": ALG, "payload": payload, "sig": sig}
+
+
+def verify(bundle: dict, key: str | None = None) -> bool:
+    """Gegenstück für Clients/Tests: stimmt die Signatur zum payload?"""
+    key = BUNDLE_KEY if key is None else key
+    if bundle.get("alg") != ALG or not isinstance(bundle.get("payload"), dict):
+        return False
+    expected = hmac.new(key.encode("utf-8"), canonical(bundle["payload"]), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, str(bundle.get("sig", "")))
+
+
+async def load_bundle_async(adb, user: str, now_loc: datetime, hours: int = BUNDLE_DEFAULT_HOURS) -> dict | None:
+    """Signiertes Paket für `user`; None, wenn das Kind unbekannt ist."""
+    snap = await policy_cache.get_snapshot_async(adb)
+    child = snap.get(user)
+    if child is None:
+        return None
+    day = now_loc.date().isoformat()
+    used = (await usage_buffer.totals_async(adb, [user], day)).get(user, 0)
+    # Sekunden abschneiden: Abschnittsgrenzen liegen dann auf vollen Minuten
+    start = now_loc.replace(second=0, microsecond=0)
+    return sign(build(user, child, used, start, hours, policy_cache.snapshot_version()))
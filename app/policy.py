@@ -1,8 +1,23 @@
-from datetime import datetime, timedelta, timezone
+import inspect
+import os
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone
+from functools import wraps
+from time import perf_counter
 from zoneinfo import ZoneInfo
 from sqlalchemy.exc import IntegrityError
 
-from app.db import Child, Schedule, Override, ChildPolicy, PrewarnLog, DailyUsage, DayOverride
+from app import metrics, policy_cache, tracing, usage_buffer
+from app.db import PrewarnLog
+
+# Gerät geht etwas vor: so viel wird noch als "jetzt" gezählt, mehr wird verworfen
+HEARTBEAT_MAX_SKEW_SECONDS = int(os.getenv("KIDSCONTROL_HEARTBEAT_MAX_SKEW_SECONDS", "60"))
+# Nachgereichte Heartbeats (Batch) zählen nur so weit zurück. Der Endpunkt ist
+# nicht authentifiziert; ohne Grenze ließe sich mit rückdatierten Einträgen
+# das ganze Tagesbudget auf einmal verbrauchen. Standard: zwei Intervall-Lücken.
+HEARTBEAT_MAX_BACKFILL_SECONDS = int(
+    os.getenv("KIDSCONTROL_HEARTBEAT_MAX_BACKFILL_SECONDS", str(2 * usage_buffer.USAGE_GAP_SECONDS))
+)
 
 
 def as_aware_utc(dt):
@@ -34,68 +49,132 @@ def fmt_remaining(seconds: int) -> str:
         return f"{h}h {mm}min"
     return f"{mm}min"
 
-def compute_access(db, user: str, tz: ZoneInfo, include_debug: bool = False) -> dict:
-    child = db.query(Child).filter_by(username=user).first()
+def clock_snapshot(tz: ZoneInfo) -> dict:
+    """Eine gemeinsame Uhrzeit für alle Entscheidungen eines Requests."""
+    return clock_at(now_local(tz))
+
+
+def clock_at(now_loc: datetime) -> dict:
+    """Uhr zu einem beliebigen lokalen Zeitpunkt (z. B. für vorausberechnete Zeitleisten)."""
+    return {
+        "now_loc": now_loc,
+        "now_utc": now_loc.astimezone(timezone.utc),
+        "day": now_loc.date().isoformat(),
+        "weekday": now_loc.weekday(),
+        "mins_now": now_loc.hour * 60 + now_loc.minute,
+    }
+
+
+def load_policy_rows(db, users: list[str], day: str) -> dict:
+    """
+    Statische Policy kommt aus dem Snapshot (app/policy_cache.py),
+    die heutige Nutzung aus dem Write-behind-Puffer (app/usage_buffer.py).
+    """
+    snap = policy_cache.get_snapshot(db)
+    return {"children": snap, "usages": usage_buffer.totals(db, users, day)}
+
+
+def decide(user: str, rows: dict, clock: dict, include_debug: bool = False) -> dict:
+    """Reine Entscheidungslogik auf bereits geladenen Daten – keine DB-Zugriffe."""
+    out = _decide(user, rows, clock, include_debug)
+    child = rows["children"].get(user)
+    if child:
+        out["next_change_at"] = next_change_at(child, clock, out).isoformat()
+    return out
+
+
+def _local_at(clock: dict, minute: int) -> datetime:
+    """Lokaler Zeitpunkt zur Minute `minute` von heute; ab 1440 = nächste Mitternacht."""
+    now_loc = clock["now_loc"]
+    day = now_loc.date()
+    if minute >= 1440:
+        day += timedelta(days=1)
+        minute = 0
+    return datetime.combine(day, time(minute // 60, minute % 60), tzinfo=now_loc.tzinfo)
+
+
+def next_change_at(child: dict, clock: dict, out: dict) -> datetime:
+    """
+    Frühester Zeitpunkt, an dem sich die Entscheidung ändern kann:
+    Override-Ende, Fensterbeginn/-ende, Vorwarnung, aufgebrauchtes Budget
+    (bei laufender Nutzung eine Minute pro Minute) oder Mitternacht.
+    Eltern-Aktionen (Freigaben, Zeitplan) sind nicht vorhersehbar.
+    """
+    now_loc = clock["now_loc"]
+    mnow = clock["mins_now"]
+    reason = out["reason"]
+    candidates = [_local_at(clock, 1440)]
+
+    sched = child["week"].get(clock["weekday"])
+    if reason == "override":
+        candidates.append(datetime.fromisoformat(out["until"]))
+    elif sched and reason != "override-day":
+        # nächster Fensterbeginn bzw. Minute nach dem Fensterende, direkt aus der Bitmap
+        edge = child["bitmap"].next_edge(clock["weekday"], mnow)
+        if edge is not None:
+            candidates.append(_local_at(clock, min(mnow + edge, 1440)))
+        if reason == "schedule":
+            warn_minutes = child["warn_minutes"]
+            if warn_minutes > 0 and not out["warn"]:
+                candidates.append(_local_at(clock, mnow + out["minutes_left_window"] - warn_minutes))
+            # ab der vollen Minute wie die Fensterkanten, sonst wandert der Wert mit jeder Sekunde
+            candidates.append(_local_at(clock, mnow + out["daily_remaining"]))
+
+    return min(c for c in candidates if c > now_loc).astimezone(now_loc.tzinfo)
+
+
+def _decide(user: str, rows: dict, clock: dict, include_debug: bool) -> dict:
+    child = rows["children"].get(user)
     if not child:
         return {"allow": False, "reason": "unknown-user"}
 
-    now_loc = now_local(tz)
-    day = now_loc.date().isoformat()
-    wd = now_loc.weekday()
-    mnow = mins_now(tz)
-    now_utc = datetime.now(timezone.utc)
+    now_loc = clock["now_loc"]
+    now_utc = clock["now_utc"]
+    day = clock["day"]
+    wd = clock["weekday"]
+    mnow = clock["mins_now"]
 
     dbg = {"tz_now": now_loc.isoformat(), "weekday": wd, "mins_now": mnow, "day": day}
 
     # Day override (bool toggle for today)
-    do = db.query(DayOverride).filter_by(username=user, day=day, enabled=True).first()
-    if do:
+    if child["day_override"] == day:
         out = {"allow": True, "reason": "override-day", "override_text": "Heute unbegrenzt"}
         if include_debug:
             out["debug"] = dbg
         return out
 
     # Hour override (latest active)
-    ov = (
-        db.query(Override)
-        .filter(Override.username == user)
-        .order_by(Override.grant_until.desc())
-        .first()
-    )
-    if ov:
-        until = as_aware_utc(ov.grant_until)
-        if until and until > now_utc:
-            sec_left = int((until - now_utc).total_seconds())
-            out = {
-                "allow": True,
-                "reason": "override",
-                "until": until.isoformat(),
-                "override_seconds_left": sec_left,
-                "override_text": f"Noch {fmt_remaining(sec_left)}",
-            }
-            if include_debug:
-                dbg["override_until"] = until.isoformat()
-                dbg["override_seconds_left"] = sec_left
-                out["debug"] = dbg
-            return out
+    until = as_aware_utc(child["override_until"])
+    if until and until > now_utc:
+        sec_left = int((until - now_utc).total_seconds())
+        out = {
+            "allow": True,
+            "reason": "override",
+            "until": until.isoformat(),
+            "override_seconds_left": sec_left,
+            "override_text": f"Noch {fmt_remaining(sec_left)}",
+        }
+        if include_debug:
+            dbg["override_until"] = until.isoformat()
+            dbg["override_seconds_left"] = sec_left
+            out["debug"] = dbg
+        return out
 
     # Schedule
-    sched = db.query(Schedule).filter_by(username=user, weekday=wd).first()
+    sched = child["week"].get(wd)
     if not sched:
         out = {"allow": False, "reason": "no-schedule"}
         if include_debug:
             out["debug"] = dbg
         return out
 
-    start_min = int(sched.start_min)
-    end_min = int(sched.end_min)
-    limit = int(sched.daily_minutes or 0)
+    limit = sched["daily_minutes"]
 
-    dbg["start_min"] = start_min
-    dbg["end_min"] = end_min
+    dbg["windows"] = ", ".join(f"{fmt_hm_from_minutes(s)}–{fmt_hm_from_minutes(e)}" for s, e in sched["windows"])
     dbg["daily_minutes"] = limit
 
-    if not (start_min <= mnow <= end_min):
+    bitmap = child["bitmap"]
+    if not bitmap.allowed(wd, mnow):
         out = {"allow": False, "reason": "outside-time"}
         if include_debug:
             out["debug"] = dbg
@@ -108,65 +187,31 @@ def compute_access(db, user: str, tz: ZoneInfo, include_debug: bool = False) ->
             out["debug"] = dbg
         return out
 
-    # cleanup old rows
-    cutoff = (now_loc.date() - timedelta(days=14)).isoformat()
-    db.query(DailyUsage).filter(DailyUsage.day < cutoff).delete(synchronize_session=False)
-    db.commit()
-
-    # store last_seen_at as naive UTC (SQLite-safe)
-    now_utc_naive = datetime.utcnow()
-    usage = db.query(DailyUsage).filter_by(username=user, day=day).first()
-    if not usage:
-        usage = DailyUsage(username=user, day=day, used_minutes=0, last_seen_at=now_utc_naive)
-        db.add(usage)
-        db.commit()
-        db.refresh(usage)
-
-    last = usage.last_seen_at
-    if getattr(last, "tzinfo", None) is not None:
-        last = last.astimezone(timezone.utc).replace(tzinfo=None)
-
-    delta_min = int((now_utc_naive - last).total_seconds() // 60)
-    if delta_min < 0:
-        delta_min = 0
-    if delta_min > 2:
-        delta_min = 0
-
-    if delta_min > 0:
-        usage.used_minutes += delta_min
-        usage.last_seen_at = now_utc_naive
-        db.commit()
-
-    remaining = limit - int(usage.used_minutes)
+    used = rows["usages"].get(user, 0)
+    remaining = limit - used
+    # Fensterende = Minute vor der nächsten Kante; Mitternacht beendet das Fenster wie bisher
+    edge = bitmap.next_edge(wd, mnow)
+    end_min = min(mnow + edge - 1, 1439) if edge is not None else 1439
     minutes_left_window = end_min - mnow
 
     if remaining <= 0:
         out = {
             "allow": False,
             "reason": "daily-limit-reached",
-            "daily_used": int(usage.used_minutes),
+            "daily_used": used,
             "daily_limit": limit,
             "daily_remaining": 0,
         }
         if include_debug:
-            dbg["daily_used"] = int(usage.used_minutes)
+            dbg["daily_used"] = used
             dbg["daily_remaining"] = 0
             out["debug"] = dbg
         return out
 
     # Prewarn
-    policy = db.query(ChildPolicy).filter_by(username=user).first()
-    warn_minutes = int(policy.warn_minutes) if policy else 10
-    mode = policy.after_expiry_mode if policy else "LOCK"
-
-    warn = False
-    if warn_minutes > 0 and 0 <= minutes_left_window <= warn_minutes:
-        warn = True
-        try:
-            db.add(PrewarnLog(username=user, day=day, mode=mode, shown_at=now_loc.isoformat()))
-            db.commit()
-        except IntegrityError:
-            db.rollback()
+    warn_minutes = child["warn_minutes"]
+
+    warn = warn_minutes > 0 and 0 <= minutes_left_window <= warn_minutes
 
     out = {
         "allow": True,
@@ -174,14 +219,294 @@ def compute_access(db, user: str, tz: ZoneInfo, include_debug: bool = False) ->
         "warn": warn,
         "minutes_left_window": minutes_left_window,
         "window_end_hm": fmt_hm_from_minutes(end_min),
-        "daily_used": int(usage.used_minutes),
+        "daily_used": used,
         "daily_limit": limit,
         "daily_remaining": remaining,
     }
     if include_debug:
-        dbg["daily_used"] = int(usage.used_minutes)
+        dbg["daily_used"] = used
         dbg["daily_remaining"] = remaining
         dbg["warn_minutes"] = warn_minutes
         dbg["warn"] = warn
         out["debug"] = dbg
     return out
+
+
+@contextmanager
+def _stage(name: str):
+    """Wandzeit einer Stufe: Histogramm für /metrics und – im Debug-Modus – ins Trace-Protokoll."""
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        dt = perf_counter() - t0
+        metrics.observe("kidscontrol_decision_stage_seconds", dt, {"stage": name})
+        tracing.stage(name, dt)
+
+
+def _count(results: dict, kind: str):
+    for out in results.values():
+        metrics.inc("kidscontrol_decisions_total", {"reason": out.get("reason", ""), "kind": kind})
+
+
+def _traced(fn):
+    """
+    Bei include_debug=True den Ablauf aufzeichnen (app/tracing.py) und als
+    "profile" an jedes Ergebnis hängen: SQL-Statements, Cache-Treffer, Zeit je Stufe.
+    """
+    sig = inspect.signature(fn)
+
+    def _debug(args, kwargs) -> bool:
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return bool(bound.arguments["include_debug"])
+
+    def _attach(results: dict, rec: dict) -> dict:
+        for out in results.values():
+            out["profile"] = rec
+        return results
+
+    if inspect.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if not _debug(args, kwargs):
+                return await fn(*args, **kwargs)
+            with tracing.record() as rec:
+                results = await fn(*args, **kwargs)
+            return _attach(results, rec)
+
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _debug(args, kwargs):
+            return fn(*args, **kwargs)
+        with tracing.record() as rec:
+            results = fn(*args, **kwargs)
+        return _attach(results, rec)
+
+    return wrapper
+
+
+@_traced
+def evaluate_access_many(db, users: list[str], tz: ZoneInfo, include_debug: bool = False) -> dict[str, dict]:
+    """
+    Seiteneffektfreie Auswertung für mehrere Kinder (Dashboard, Trace, Widget).
+    Liest nur – zählt keine Nutzung und schreibt keine Vorwarnung.
+    """
+    users = list(dict.fromkeys(users))
+    if not users:
+        return {}
+    clock = clock_snapshot(tz)
+    with _stage("load"):
+        rows = load_policy_rows(db, users, clock["day"])
+    with _stage("decide"):
+        results = {u: decide(u, rows, clock, include_debug=include_debug) for u in users}
+    _count(results, "evaluate")
+    return results
+
+
+def evaluate_access(db, user: str, tz: ZoneInfo, include_debug: bool = False) -> dict:
+    return evaluate_access_many(db, [user], tz, include_debug=include_debug)[user]
+
+
+# Nur in diesen Zuständen läuft das Tagesbudget mit
+COUNTING_REASONS = ("schedule", "daily-limit-reached")
+
+# (username, mode) – heute schon geschriebene Vorwarnungen dieses Prozesses;
+# beim Tageswechsel geleert, damit die Menge nicht mit jedem Tag wächst
+_prewarn_day = ""
+_prewarn_logged: set[tuple[str, str]] = set()
+
+
+def _prewarn_due(user: str, day: str, mode: str) -> bool:
+    global _prewarn_day
+    if day != _prewarn_day:
+        _prewarn_logged.clear()
+        _prewarn_day = day
+    if (user, mode) in _prewarn_logged:
+        return False
+    _prewarn_logged.add((user, mode))
+    return True
+
+
+def _apply_heartbeats(
+    users: list[str], rows: dict, clock: dict, include_debug: bool, observed: dict | None = None
+) -> tuple[dict, list]:
+    """
+    Zählt im Puffer hoch und entscheidet; liefert die noch zu schreibenden Vorwarnungen.
+    observed: optional user -> [(Zeitpunkt naive UTC, device), ...] der einzelnen
+    Heartbeats (leere Liste: nichts zählen), ohne observed "jetzt" vom Gerät "".
+    Ob ein Heartbeat zählt, entscheidet die Lage zu seinem eigenen Zeitpunkt.
+    """
+    day = clock["day"]
+    tz = clock["now_loc"].tzinfo
+    # store last_seen_at as naive UTC (SQLite-safe)
+    now_utc_naive = clock["now_utc"].replace(tzinfo=None)
+    results = {}
+    prewarns = []
+    for user in users:
+        seen = [(now_utc_naive, "")] if observed is None else observed.get(user, [])
+        # Entscheidung für "jetzt" samt dem Verbrauch, mit dem sie gerechnet wurde
+        current = None
+        for ts, device in sorted((min(t, now_utc_naive), d) for t, d in seen):
+            if ts == now_utc_naive:
+                out = current = decide(user, rows, clock, include_debug=include_debug)
+                used = rows["usages"].get(user)
+            else:
+                out = _decide(user, rows, clock_at(ts.replace(tzinfo=timezone.utc).astimezone(tz)), False)
+            if out["reason"] in COUNTING_REASONS:
+                rows["usages"][user] = usage_buffer.tick(user, day, ts, device)
+
+        if current is None or rows["usages"].get(user) != used:
+            current = decide(user, rows, clock, include_debug=include_debug)
+        out = current
+        if out.get("warn"):
+            mode = rows["children"][user]["after_expiry_mode"]
+            if _prewarn_due(user, day, mode):
+                prewarns.append(PrewarnLog(username=user, day=day, mode=mode, shown_at=clock["now_loc"].isoformat()))
+        results[user] = out
+    return results, prewarns
+
+
+@_traced
+def record_heartbeat_many(
+    db, users: list[str], tz: ZoneInfo, include_debug: bool = False, device: str = ""
+) -> dict[str, dict]:
+    """
+    Heartbeat des durchsetzenden Clients: zählt Nutzung hoch, schreibt die
+    Vorwarnung ins Log und liefert die aktuelle Entscheidung zurück.
+    Die Minuten landen im Write-behind-Puffer (app/usage_buffer.py),
+    alte Zeilen räumt app/maintenance.py auf.
+    """
+    users = list(dict.fromkeys(users))
+    if not users:
+        return {}
+
+    clock = clock_snapshot(tz)
+    with _stage("load"):
+        rows = load_policy_rows(db, users, clock["day"])
+    now_utc_naive = clock["now_utc"].replace(tzinfo=None)
+    observed = {u: [(now_utc_naive, device)] for u in users}
+    with _stage("decide"):
+        results, prewarns = _apply_heartbeats(users, rows, clock, include_debug, observed)
+
+    if prewarns:
+        with _stage("write"):
+            for entry in prewarns:
+                try:
+                    # Savepoint: ein paralleler Heartbeat darf den Eintrag schon geschrieben haben
+                    with db.begin_nested():
+                        db.add(entry)
+                except IntegrityError:
+                    pass
+            db.commit()
+    _count(results, "heartbeat")
+    return results
+
+
+def record_heartbeat(db, user: str, tz: ZoneInfo, include_debug: bool = False, device: str = "") -> dict:
+    return record_heartbeat_many(db, [user], tz, include_debug=include_debug, device=device)[user]
+
+
+# Kompatibilität für bestehende Aufrufer (Dashboard, Trace): nur lesen.
+# Nutzung zählt ausschließlich record_heartbeat*.
+compute_access = evaluate_access
+compute_access_many = evaluate_access_many
+
+
+# =========================
+# ASYNC (AsyncSession, siehe app/db.py)
+# =========================
+async def load_policy_rows_async(adb, users: list[str], day: str) -> dict:
+    snap = await policy_cache.get_snapshot_async(adb)
+    return {"children": snap, "usages": await usage_buffer.totals_async(adb, users, day)}
+
+
+@_traced
+async def evaluate_access_many_async(adb, users: list[str], tz: ZoneInfo, include_debug: bool = False) -> dict[str, dict]:
+    users = list(dict.fromkeys(users))
+    if not users:
+        return {}
+    clock = clock_snapshot(tz)
+    with _stage("load"):
+        rows = await load_policy_rows_async(adb, users, clock["day"])
+    with _stage("decide"):
+        results = {u: decide(u, rows, clock, include_debug=include_debug) for u in users}
+    _count(results, "evaluate")
+    return results
+
+
+async def evaluate_access_async(adb, user: str, tz: ZoneInfo, include_debug: bool = False) -> dict:
+    return (await evaluate_access_many_async(adb, [user], tz, include_debug=include_debug))[user]
+
+
+@_traced
+async def record_heartbeat_many_async(
+    adb, users: list[str], tz: ZoneInfo, include_debug: bool = False, observed: dict | None = None
+) -> dict[str, dict]:
+    users = list(dict.fromkeys(users))
+    if not users:
+        return {}
+
+    clock = clock_snapshot(tz)
+    with _stage("load"):
+        rows = await load_policy_rows_async(adb, users, clock["day"])
+    with _stage("decide"):
+        results, prewarns = _apply_heartbeats(users, rows, clock, include_debug, observed)
+
+    if prewarns:
+        with _stage("write"):
+            for entry in prewarns:
+                try:
+                    async with adb.begin_nested():
+                        adb.add(entry)
+                except IntegrityError:
+                    pass
+            await adb.commit()
+    _count(results, "heartbeat")
+    return results
+
+
+async def record_heartbeat_async(adb, user: str, tz: ZoneInfo, include_debug: bool = False, device: str = "") -> dict:
+    now_utc_naive = datetime.now(timezone.utc).replace(tzinfo=None)
+    observed = {user: [(now_utc_naive, device)]}
+    return (await record_heartbeat_many_async(adb, [user], tz, include_debug=include_debug, observed=observed))[user]
+
+
+async def record_heartbeat_batch_async(adb, records: list[dict], tz: ZoneInfo) -> list[dict]:
+    """
+    Viele Heartbeats (device, user, observed_at) in einem Rutsch: jedes
+    betroffene Kind wird einmal ausgewertet, alle Schreibzugriffe gehen in
+    eine Transaktion. Liefert eine Entscheidung pro Eintrag, in Eingabereihenfolge.
+
+    Gezählt wird nur der heutige lokale Tag und höchstens
+    HEARTBEAT_MAX_BACKFILL_SECONDS zurück: ältere Einträge ("stale") und mehr
+    als HEARTBEAT_MAX_SKEW_SECONDS in der Zukunft ("future") werden verworfen
+    und im Ergebnis mit "ignored" markiert. Ohne observed_at gilt "jetzt".
+    """
+    now_loc = now_local(tz)
+    now_utc = now_loc.astimezone(timezone.utc)
+    midnight = datetime.combine(now_loc.date(), time(0), tzinfo=tz).astimezone(timezone.utc)
+    earliest = max(midnight, now_utc - timedelta(seconds=HEARTBEAT_MAX_BACKFILL_SECONDS))
+    latest = now_utc + timedelta(seconds=HEARTBEAT_MAX_SKEW_SECONDS)
+    observed: dict[str, list] = {}
+    ignored: dict[int, str] = {}
+    for i, r in enumerate(records):
+        ts = as_aware_utc(r.get("observed_at")) or now_utc
+        seen = observed.setdefault(r["user"], [])
+        if ts < earliest:
+            ignored[i] = "stale"
+        elif ts > latest:
+            ignored[i] = "future"
+        else:
+            seen.append((ts.replace(tzinfo=None), r.get("device") or ""))
+    decisions = await record_heartbeat_many_async(adb, list(observed), tz, observed=observed)
+    out = []
+    for i, r in enumerate(records):
+        entry = {"device": r.get("device"), "user": r["user"], "decision": decisions[r["user"]]}
+        if i in ignored:
+            entry["ignored"] = ignored[i]
+        out.append(entry)
+    return out
@@ -0,0 +1,216 @@
+"""In-Process-Snapshot der statischen Kinder-Policy.
+
+Zeitplan, Vorwarnzeit, Modus nach Ablauf, Anzeigename und die aktiven
+Freigaben ändern sich nur, wenn Eltern etwas speichern. Statt sie bei jedem
+Poll neu zu lesen, hält jeder Worker einen Snapshot im Speicher.
+
+Schreibende Admin-Endpunkte rufen mark_changed(db) auf: das erhöht den
+Versionszähler in `policy_version` in derselben Transaktion und verwirft
+nach dem Commit den lokalen Snapshot. Andere Worker sehen die neue Version
+spätestens nach POLICY_CACHE_CHECK_SECONDS und bauen dann neu.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from sqlalchemy import event, func, select
+
+from app import tracing
+from app.db import SessionLocal, Child, Schedule, ChildPolicy, Override, DayOverride, PolicyVersion
+from app.schedule_bitmap import WeekBitmap, normalize_windows, parse_windows
+
+POLICY_CACHE_CHECK_SECONDS = float(os.getenv("KIDSCONTROL_POLICY_CACHE_CHECK_SECONDS", "2"))
+
+# nur für das Austauschen der globalen Werte, nie über DB-Zugriffe hinweg:
+# rebuild() läuft im async-Pfad per run_sync, dessen IO zurück an die
+# Event-Loop gibt – ein dabei gehaltener Lock blockiert den ganzen Worker
+_lock = threading.Lock()
+_snapshot: dict | None = None
+_version: int | None = None
+# zählt invalidate()-Aufrufe; ein Neuaufbau, der eine Invalidierung
+# überlappt hat, wird nicht übernommen
+_generation = 0
+# SHA-256 des Widget-Tokens -> username, passend zu _snapshot
+_token_index: dict[str, str] = {}
+_checked_at = 0.0
+
+
+_VERSION_QUERY = select(PolicyVersion.version).where(PolicyVersion.id == 1)
+
+
+def current_version(db) -> int:
+    return int(db.execute(_VERSION_QUERY).scalar() or 0)
+
+
+def build_snapshot(db) -> dict:
+    """
+    Alle Kinder mit Wochenplan, Policy, Freigaben und Tagesausnahmen – fünf
+    Queries für den ganzen Haushalt. Die Zeitfenster werden dabei einmal zur Wochen-Bitmap kompiliert.
+    """
+    snap = {}
+    for c in db.query(Child).order_by(Child.username.asc()):
+        snap[c.username] = {
+            "display_name": c.display_name or c.username,
+            "week": {},
+            "warn_minutes": 10,
+            "after_expiry_mode": "LOCK",
+            "override_until": None,
+            "day_override": None,
+            "bitmap": WeekBitmap(),
+            "widget_token_hash": c.widget_token_hash,
+        }
+    users = list(snap.keys())
+    if not users:
+        return snap
+
+    for s in db.query(Schedule).filter(Schedule.username.in_(users)):
+        if s.windows is not None:
+            windows = parse_windows(s.windows)
+        else:
+            windows = normalize_windows([(s.start_min, s.end_min)])
+        snap[s.username]["week"][int(s.weekday)] = {
+            "start_min": int(s.start_min),
+            "end_min": int(s.end_min),
+            "windows": windows,
+            "daily_minutes": int(s.daily_minutes or 0),
+        }
+    for child in snap.values():
+        child["bitmap"] = WeekBitmap.from_week(child["week"])
+    for p in db.query(ChildPolicy).filter(ChildPolicy.username.in_(users)):
+        snap[p.username]["warn_minutes"] = int(p.warn_minutes)
+        snap[p.username]["after_expiry_mode"] = p.after_expiry_mode
+    for user, until in (
+        db.query(Override.username, func.max(Override.grant_until))
+        .filter(Override.username.in_(users))
+        .group_by(Override.username)
+    ):
+        snap[user]["override_until"] = until
+    for d in db.query(DayOverride).filter(DayOverride.username.in_(users), DayOverride.enabled.is_(True)):
+        snap[d.username]["day_override"] = d.day
+    return snap
+
+
+def rebuild(db) -> dict:
+    global _snapshot, _version, _checked_at, _token_index
+    generation = _generation
+    version = current_version(db)
+    snap = build_snapshot(db)
+    token_index = {c["widget_token_hash"]: u for u, c in snap.items() if c["widget_token_hash"]}
+    with _lock:
+        if generation == _generation:
+            _snapshot = snap
+            _token_index = token_index
+            _version = version
+            _checked_at = time.monotonic()
+    return snap
+
+
+def _traced_rebuild(snap: dict) -> dict:
+    tracing.cache("policy snapshot", hit=False, rows=len(snap), detail=f"neu aufgebaut, Version {_version}")
+    return snap
+
+
+def get_snapshot(db) -> dict:
+    global _checked_at
+    snap = _snapshot
+    if snap is None:
+        return _traced_rebuild(rebuild(db))
+    if time.monotonic() - _checked_at >= POLICY_CACHE_CHECK_SECONDS:
+        if current_version(db) != _version:
+            return _traced_rebuild(rebuild(db))
+        _checked_at = time.monotonic()
+    tracing.cache("policy snapshot", hit=True, rows=len(snap), detail=f"Version {_version}")
+    return snap
+
+
+async def get_snapshot_async(adb) -> dict:
+    """Wie get_snapshot, für AsyncSession; der seltene Neuaufbau läuft über run_sync."""
+    global _checked_at
+    snap = _snapshot
+    if snap is None:
+        return _traced_rebuild(await adb.run_sync(rebuild))
+    if time.monotonic() - _checked_at >= POLICY_CACHE_CHECK_SECONDS:
+        if int((await adb.execute(_VERSION_QUERY)).scalar() or 0) != _version:
+            return _traced_rebuild(await adb.run_sync(rebuild))
+        _checked_at = time.monotonic()
+    tracing.cache("policy snapshot", hit=True, rows=len(snap), detail=f"Version {_version}")
+    return snap
+
+
+def snapshot_version() -> int | None:
+    return _version
+
+
+def user_for_token_hash(token_hash: str) -> str | None:
+    """Kind zum Widget-Token (Hash) laut aktuellem Snapshot; vorher get_snapshot*() aufrufen."""
+    return _token_index.get(token_hash)
+
+
+_listeners: list = []
+
+
+def on_invalidate(callback):
+    """callback() wird nach jeder lokalen Invalidierung aufgerufen (z. B. Live-Stream anstoßen)."""
+    _listeners.append(callback)
+
+
+def invalidate():
+    global _snapshot, _generation
+    with _lock:
+        _snapshot = None
+        _generation += 1
+    for callback in _listeners:
+        callback()
+
+
+def mark_changed(db):
+    """
+    Erhöht die Policy-Version in der laufenden Transaktion; nach dem Commit
+    wird der lokale Snapshot verworfen. ORM-Schreibzugriffe auf die
+    Policy-Tabellen lösen das automatisch aus (siehe Events unten),
+    direkt aufrufen nur bei rohem SQL.
+    """
+    updated = (
+        db.query(PolicyVersion)
+        .filter(PolicyVersion.id == 1)
+        .update({PolicyVersion.version: PolicyVersion.version + 1}, synchronize_session=False)
+    )
+    if not updated:
+        db.add(PolicyVersion(id=1, version=1))
+    db.info["policy_changed"] = True
+
+
+_POLICY_MODELS = (Child, Schedule, ChildPolicy, Override, DayOverride)
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _track_policy_writes(session, flush_context, instances):
+    if session.info.get("policy_changed"):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _POLICY_MODELS):
+            mark_changed(session)
+            return
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _track_bulk_policy_writes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _POLICY_MODELS) and not orm_execute_state.session.info.get("policy_changed"):
+        mark_changed(orm_execute_state.session)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("policy_changed", False):
+        invalidate()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("policy_changed", None)
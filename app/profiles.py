@@ -1,7 +1,19 @@
-import os, json
+import os, json, copy, tempfile, threading, time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import policy_cache
+from app.db import AuditLog, Schedule
+from app.schedule_bitmap import day_windows, format_windows
 
 PROFILE_DIR = "/opt/kids-control/app/data/profiles"
+# Wie oft das Verzeichnis-mtime geprüft wird; dazwischen kein Plattenzugriff
+PROFILE_CHECK_SECONDS = float(os.getenv("KIDSCONTROL_PROFILE_CHECK_SECONDS", "2"))
 
+# Tageseintrag: {"windows": [[start_min, end_min], ...], "daily_minutes": N}.
+# Ältere Profile (und die Presets) haben nur ein Fenster als start_min/end_min.
 PRESETS = {
     "Schule (Standard)": {
         "week": {
@@ -41,13 +53,54 @@ def _safe_name(name: str) -> str:
     s = "".join(out).strip().replace(" ", "_")
     return s[:60] if s else ""
 
-def list_profiles():
-    ensure_profile_dir()
-    names = []
+# Index der gespeicherten Profile: safe_name -> (Anzeigename, Profil).
+# Gültig, solange sich das mtime von PROFILE_DIR nicht ändert – jedes Anlegen,
+# Löschen oder Umbenennen (auch das atomare Speichern) ändert es.
+_lock = threading.Lock()
+_index: dict[str, tuple[str, dict]] | None = None
+_dir_mtime: int | None = None
+_checked_at = 0.0
+
+def _scan() -> dict[str, tuple[str, dict]]:
+    index = {}
     for fn in os.listdir(PROFILE_DIR):
-        if fn.endswith(".json"):
-            names.append(fn[:-5].replace("_", " "))
-    return sorted(names)
+        if not fn.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, fn), "r", encoding="utf-8") as f:
+                index[fn[:-5]] = (fn[:-5].replace("_", " "), json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Profil {fn} nicht lesbar: {e}")
+    return index
+
+def _saved() -> dict[str, tuple[str, dict]]:
+    global _index, _dir_mtime, _checked_at
+    index = _index
+    if index is not None and time.monotonic() - _checked_at < PROFILE_CHECK_SECONDS:
+        return index
+    with _lock:
+        ensure_profile_dir()
+        mtime = os.stat(PROFILE_DIR).st_mtime_ns
+        if _index is None or mtime != _dir_mtime:
+            _index = _scan()
+            _dir_mtime = mtime
+        _checked_at = time.monotonic()
+        return _index
+
+def invalidate():
+    global _index
+    with _lock:
+        _index = None
+
+def list_profiles():
+    return sorted(display for display, _ in _saved().values())
+
+def all_profiles() -> dict:
+    """PRESETS und gespeicherte Profile in einem Dict (Anzeigename -> Profil)."""
+    out = dict(PRESETS)
+    for display, profile in _saved().values():
+        out.setdefault(display, profile)
+    return out
 
 def save_profile(name: str, profile: dict):
     ensure_profile_dir()
@@ -55,17 +108,97 @@ def save_profile(name: str, profile: dict):
     if not safe:
         return False
     path = os.path.join(PROFILE_DIR, safe + ".json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(profile, f, ensure_ascii=False, indent=2)
+    # erst vollständig in eine Temp-Datei, dann atomar umbenennen:
+    # ein paralleler Leser sieht immer die alte oder die neue Datei
+    fd, tmp = tempfile.mkstemp(dir=PROFILE_DIR, prefix=f".{safe}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    with _lock:
+        if _index is not None:
+            # mtime bleibt alt -> beim nächsten Check einmal neu einlesen (sieht dann auch andere Worker)
+            _index[safe] = (safe.replace("_", " "), copy.deepcopy(profile))
     return True
 
 def load_profile(name: str):
-    ensure_profile_dir()
     safe = _safe_name(name)
     if not safe:
         return None
-    path = os.path.join(PROFILE_DIR, safe + ".json")
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    hit = _saved().get(safe)
+    if hit is None:
+        preset = PRESETS.get(name)
+        return copy.deepcopy(preset) if preset is not None else None
+    return copy.deepcopy(hit[1])
+
+def schedule_values(d: dict) -> dict:
+    """Profil-Tageseintrag -> Spalten einer Schedule-Zeile (beide Formate)."""
+    windows = day_windows(d)
+    return {
+        "start_min": windows[0][0] if windows else 0,
+        "end_min": windows[-1][1] if windows else 0,
+        "windows": format_windows(windows),
+        "daily_minutes": int(d.get("daily_minutes") or 0),
+    }
+
+def week_profile(week: dict) -> dict:
+    """Wochenplan (weekday -> Eintrag, z. B. aus dem Policy-Snapshot) im Profilformat."""
+    out = {}
+    for wd, d in week.items():
+        windows = day_windows(d)
+        out[str(wd)] = {
+            "windows": [list(w) for w in windows],
+            "start_min": windows[0][0] if windows else 0,
+            "end_min": windows[-1][1] if windows else 0,
+            "daily_minutes": int(d.get("daily_minutes") or 0),
+        }
+    return {"week": out}
+
+def apply_profile(db, users: list[str], profile: dict, actor: str, name: str = "", details: str | None = None) -> int:
+    """
+    Wendet den Wochenplan eines Profils auf viele Kinder an: ein Upsert für
+    alle Schedule-Zeilen, ein AuditLog-Insert (eine Zeile pro Kind), ein Commit.
+    Liefert die Zahl der geschriebenen Schedule-Zeilen.
+    """
+    users = list(dict.fromkeys(users))
+    week = (profile or {}).get("week") or {}
+    rows = []
+    for user in users:
+        for wd in range(7):
+            d = week.get(str(wd), week.get(wd))
+            if not d:
+                continue
+            rows.append({"username": user, "weekday": wd, **schedule_values(d)})
+    if not rows:
+        return 0
+
+    dialect = db.get_bind().dialect.name
+    upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = upsert(Schedule.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["username", "weekday"],
+        set_={
+            "start_min": stmt.excluded.start_min,
+            "end_min": stmt.excluded.end_min,
+            "windows": stmt.excluded.windows,
+            "daily_minutes": stmt.excluded.daily_minutes,
+        },
+    )
+    db.execute(stmt)
+    if details is None:
+        details = f"Profil: {name}" if name else "Profil angewendet"
+    now = datetime.now(timezone.utc)
+    db.execute(
+        insert(AuditLog.__table__),
+        [{"at": now, "actor": actor, "child": user, "action": "SCHEDULE_UPDATE", "details": details} for user in users],
+    )
+    # Core-Upsert läuft an den ORM-Events vorbei
+    policy_cache.mark_changed(db)
+    db.commit()
+    return len(rows)
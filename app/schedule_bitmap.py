@@ -0,0 +1,95 @@
+"""Wochenplan als Bitmap: ein Bit pro Minute der Woche (7 × 1440 = 10080 Bit, 1260 Byte).
+
+Ein Tag kann mehrere Zeitfenster haben (Schedule.windows, z. B. "420-465,900-1110").
+Fenster gelten wie bisher einschließlich Endminute. Der Snapshot
+(app/policy_cache.py) kompiliert die Fenster eines Kindes einmal zur Bitmap;
+pro Poll bleiben dann ein Bit-Test ("jetzt erlaubt?") und die Suche nach der
+nächsten Kante ("wie lange noch?") – beides auf fester Größe, unabhängig von
+der Zahl der Fenster.
+"""
+
+from __future__ import annotations
+
+DAY_MINUTES = 1440
+WEEK_MINUTES = 7 * DAY_MINUTES
+_FULL = (1 << WEEK_MINUTES) - 1
+
+
+def parse_windows(text: str | None) -> list[tuple[int, int]]:
+    """ "900-1110,1200-1260" -> [(900, 1110), (1200, 1260)]; kaputte Teile werden ignoriert."""
+    out = []
+    for part in (text or "").split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            continue
+        try:
+            out.append((int(start), int(end)))
+        except ValueError:
+            continue
+    return normalize_windows(out)
+
+
+def format_windows(windows: list[tuple[int, int]]) -> str:
+    return ",".join(f"{s}-{e}" for s, e in windows)
+
+
+def normalize_windows(windows) -> list[tuple[int, int]]:
+    """Auf 0..1439 begrenzen, leere Fenster (Start nach Ende) verwerfen, sortieren, Überlappungen zusammenfassen."""
+    clean = sorted((max(0, int(s)), min(DAY_MINUTES - 1, int(e))) for s, e in windows)
+    merged: list[tuple[int, int]] = []
+    for s, e in clean:
+        if s > e:
+            continue
+        if merged and s <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def day_windows(sched: dict) -> list[tuple[int, int]]:
+    """Fenster eines Tages aus Snapshot-/Profil-Eintrag; alte Einträge haben nur start_min/end_min."""
+    if sched.get("windows") is not None:
+        return normalize_windows(sched["windows"])
+    return normalize_windows([(sched["start_min"], sched["end_min"])])
+
+
+class WeekBitmap:
+    """Bit i = Minute i der Woche (Montag 00:00 = 0) ist erlaubt; die Woche ist zyklisch."""
+
+    __slots__ = ("bits", "_bytes", "_edges")
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits & _FULL
+        self._bytes = self.bits.to_bytes(WEEK_MINUTES // 8, "little")
+        # Bit i der Kanten: Minute i+1 hat einen anderen Zustand als Minute i
+        rotated = (self.bits >> 1) | ((self.bits & 1) << (WEEK_MINUTES - 1))
+        self._edges = self.bits ^ rotated
+
+    @classmethod
+    def from_week(cls, week: dict) -> "WeekBitmap":
+        """week: weekday -> Eintrag mit "windows" (oder start_min/end_min)."""
+        bits = 0
+        for wd, sched in week.items():
+            base = int(wd) * DAY_MINUTES
+            for s, e in day_windows(sched):
+                bits |= ((1 << (e - s + 1)) - 1) << (base + s)
+        return cls(bits)
+
+    def allowed(self, weekday: int, minute: int) -> bool:
+        i = weekday * DAY_MINUTES + minute
+        return bool(self._bytes[i >> 3] >> (i & 7) & 1)
+
+    def next_edge(self, weekday: int, minute: int) -> int | None:
+        """Minuten bis zum nächsten Zustandswechsel (>= 1); None, wenn die ganze Woche gleich ist."""
+        i = weekday * DAY_MINUTES + minute
+        ahead = self._edges >> i
+        if ahead:
+            return (ahead & -ahead).bit_length()
+        wrapped = self._edges & ((1 << i) - 1)
+        if wrapped:
+            return WEEK_MINUTES - i + (wrapped & -wrapped).bit_length()
+        return None
+
+    def __len__(self) -> int:
+        return len(self._bytes)
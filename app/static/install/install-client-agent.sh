@@ -64,6 +64,7 @@ import os
 import time
 import requests
 import subprocess
+import socket
 from datetime import datetime
 
 CONF = "/etc/kidscontrol/client.env"
@@ -95,9 +96,9 @@ def main():
 
     while True:
         try:
-            r = requests.get(
-                f"{server}/api/check-access",
-                params={"user": user},
+            r = requests.post(
+                f"{server}/api/heartbeat/{user}",
+                params={"device": socket.gethostname()},
                 timeout=5,
             )
             data = r.json()
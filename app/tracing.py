@@ -0,0 +1,124 @@
+"""Ablauf-Protokoll einer Entscheidung für den Debug-Modus (Trace-Seite).
+
+Solange record() aktiv ist, landet jedes SQL-Statement (Dauer, Zeilen, ob
+SQLAlchemy es aus dem Compiled-Cache hatte) und jeder Treffer in den
+In-Process-Caches (Policy-Snapshot, Nutzungspuffer) im Protokoll, dazu die
+Wandzeit je Stufe. Die Aufzeichnung hängt an einer ContextVar – sie gilt also
+nur für den aktuellen Request/Task, auch auf dem async-Pfad. Ohne aktive
+Aufzeichnung kosten die Hooks einen ContextVar-Lookup.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+from sqlalchemy.orm import Session
+
+from app.db import engine, async_engine
+
+MAX_ENTRIES = 200
+SQL_PREVIEW_CHARS = 400
+
+_active: contextvars.ContextVar[dict | None] = contextvars.ContextVar("kidscontrol_trace", default=None)
+
+
+@contextmanager
+def record():
+    rec = {"queries": [], "stages_ms": {}, "total_ms": None}
+    token = _active.set(rec)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec["total_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        _active.reset(token)
+
+
+def active() -> bool:
+    return _active.get() is not None
+
+
+def stage(name: str, seconds: float):
+    rec = _active.get()
+    if rec is not None:
+        rec["stages_ms"][name] = round(rec["stages_ms"].get(name, 0.0) + seconds * 1000, 3)
+
+
+def _append(rec: dict, entry: dict):
+    if len(rec["queries"]) < MAX_ENTRIES:
+        rec["queries"].append(entry)
+
+
+def cache(source: str, hit: bool, rows: int | None = None, detail: str = ""):
+    """Zugriff auf einen In-Process-Cache protokollieren (hit=False: musste nachladen)."""
+    rec = _active.get()
+    if rec is not None:
+        _append(
+            rec,
+            {
+                "kind": "cache",
+                "sql": f"[{source}] {detail}".strip(),
+                "ms": 0.0,
+                "rows": rows,
+                "from_cache": hit,
+                "compiled_cached": None,
+            },
+        )
+
+
+@event.listens_for(engine, "before_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get() is not None:
+        conn.info.setdefault("kidscontrol_trace_t0", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    rec = _active.get()
+    starts = conn.info.get("kidscontrol_trace_t0")
+    if rec is None or not starts:
+        return
+    dt = time.perf_counter() - starts.pop()
+    rowcount = getattr(cursor, "rowcount", -1)
+    compiled_cached = None
+    if context is not None and getattr(context, "compiled", None) is not None:
+        compiled_cached = context.cache_hit is CACHE_HIT
+    sql = " ".join(statement.split())
+    _append(
+        rec,
+        {
+            "kind": "sql",
+            "sql": sql[:SQL_PREVIEW_CHARS] + ("…" if len(sql) > SQL_PREVIEW_CHARS else ""),
+            "ms": round(dt * 1000, 3),
+            "rows": rowcount if rowcount is not None and rowcount >= 0 else None,
+            "from_cache": False,
+            "compiled_cached": compiled_cached,
+        },
+    )
+
+
+@event.listens_for(engine, "handle_error")
+@event.listens_for(async_engine.sync_engine, "handle_error")
+def _forget_failed(ctx):
+    starts = ctx.connection.info.get("kidscontrol_trace_t0") if ctx.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_rows(orm_execute_state):
+    # SELECT-Zeilen kennt der Cursor erst nach dem Fetch: Ergebnis puffern und zählen
+    rec = _active.get()
+    if rec is None or not orm_execute_state.is_select:
+        return None
+    n0 = len(rec["queries"])
+    frozen = orm_execute_state.invoke_statement().freeze()
+    if len(rec["queries"]) > n0:
+        rec["queries"][-1]["rows"] = len(frozen().all())
+    return frozen()
@@ -2,16 +2,20 @@
 
 Exports used by main.py:
 - CSS: str  -> the full CSS stylesheet
+- CSS_URL: str -> content-hashed URL of CSS (served immutable by main.py)
 - css_block(): str -> same as CSS (compat helper)
 - render_login_page(css: str, admin_user: str) -> str
 - render_dashboard(css: str, now_iso: str, kids: list[dict]) -> str
 - render_trace(css: str, user: str, display_name: str, data: dict) -> str
 - render_schedule_editor(css: str, user: str, display_name: str, schedules: dict, presets: dict, profiles: list[str]) -> str
+- parse_schedule_form(form) -> dict  -> editor form as profile week (several windows per day)
 - render_child_view(css: str, user: str, display_name: str, data: dict) -> str
 """
 
 from __future__ import annotations
 
+import hashlib
+import threading
 from html import escape
 
 REASON_MAP_DE = {
@@ -162,6 +166,9 @@ summary{ cursor:pointer; color: var(--mint2); font-weight: 700; }
 
 # Back-compat exports expected by main.py
 CSS: str = css()
+# Stylesheet only once per browser: URL changes whenever the CSS does
+CSS_HASH: str = hashlib.sha256(CSS.encode("utf-8")).hexdigest()[:12]
+CSS_URL: str = f"/static/app.{CSS_HASH}.css"
 
 
 def css_block() -> str:
@@ -169,6 +176,13 @@ def css_block() -> str:
     return CSS
 
 
+def _stylesheet(css: str) -> str:
+    """The shared CSS as <link> (cacheable), anything else inline."""
+    if css == CSS:
+        return f'<link rel="stylesheet" href="{CSS_URL}"/>'
+    return f"<style>{css}</style>"
+
+
 def _pill(label: str, value: str, mint: bool = False) -> str:
     cls = "pill mint" if mint else "pill"
     return f'<span class="{cls}"><b>{escape(label)}:</b>&nbsp;{escape(value)}</span>'
@@ -181,7 +195,7 @@ def render_login_page(css: str, admin_user: str) -> str:
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width, initial-scale=1"/>
   <title>KidsControl – Login</title>
-  <style>{css}</style>
+  {_stylesheet(css)}
 </head>
 <body>
   <div class="wrap">
@@ -213,38 +227,74 @@ def render_login_page(css: str, admin_user: str) -> str:
 """
 
 
-def render_dashboard(css: str, now_iso: str, kids: list[dict]) -> str:
-    rows_html = ""
-    for k in kids:
-        u = k["username"]
-        dn = k["display_name"]
-        st = k.get("state") or {}
-        allow = bool(st.get("allow"))
-        reason = st.get("reason", "")
-        reason_de = REASON_MAP_DE.get(reason, reason)
-        warn = bool(st.get("warn", False))
+# username -> (fingerprint, html) – one entry per child, replaced when its state changes,
+# dropped when the child no longer shows up on the dashboard
+_row_cache: dict[str, tuple[tuple, str]] = {}
+_row_lock = threading.Lock()
+
+
+def _row_fingerprint(k: dict) -> tuple:
+    st = k.get("state") or {}
+    return (
+        k["display_name"],
+        bool(st.get("allow")),
+        st.get("reason", ""),
+        bool(st.get("warn", False)),
+        st.get("override_text"),
+        st.get("minutes_left_window"),
+        st.get("daily_remaining"),
+        st.get("daily_limit"),
+    )
+
+
+def _dashboard_row(k: dict) -> str:
+    u = k["username"]
+    fp = _row_fingerprint(k)
+    hit = _row_cache.get(u)
+    if hit is not None and hit[0] == fp:
+        return hit[1]
+    html = _render_dashboard_row(k)
+    with _row_lock:
+        _row_cache[u] = (fp, html)
+    return html
+
+
+def _prune_rows(usernames: set[str]):
+    with _row_lock:
+        for u in [u for u in _row_cache if u not in usernames]:
+            del _row_cache[u]
+
+
+def _render_dashboard_row(k: dict) -> str:
+    u = k["username"]
+    dn = k["display_name"]
+    st = k.get("state") or {}
+    allow = bool(st.get("allow"))
+    reason = st.get("reason", "")
+    reason_de = REASON_MAP_DE.get(reason, reason)
+    warn = bool(st.get("warn", False))
 
-        status_icon = "✅" if allow else "⛔"
-        warn_icon = "⚠️" if warn else ""
+    status_icon = "✅" if allow else "⛔"
+    warn_icon = "⚠️" if warn else ""
 
-        pills = [_pill("Grund", reason_de, mint=True)]
+    pills = [_pill("Grund", reason_de, mint=True)]
 
-        if reason == "override-day":
-            pills.append(_pill("Sonderfreigabe", "Heute unbegrenzt", mint=True))
-        elif reason == "override":
-            pills.append(_pill("Sonderfreigabe", str(st.get("override_text") or "aktiv"), mint=True))
+    if reason == "override-day":
+        pills.append(_pill("Sonderfreigabe", "Heute unbegrenzt", mint=True))
+    elif reason == "override":
+        pills.append(_pill("Sonderfreigabe", str(st.get("override_text") or "aktiv"), mint=True))
 
-        if st.get("minutes_left_window") is not None:
-            pills.append(_pill("Zeitfenster", f'noch {st.get("minutes_left_window")} Min', mint=False))
-        if st.get("daily_remaining") is not None and st.get("daily_limit") is not None:
-            pills.append(_pill("Tagesbudget", f'{st.get("daily_remaining")}/{st.get("daily_limit")} Min', mint=True))
+    if st.get("minutes_left_window") is not None:
+        pills.append(_pill("Zeitfenster", f'noch {st.get("minutes_left_window")} Min', mint=False))
+    if st.get("daily_remaining") is not None and st.get("daily_limit") is not None:
+        pills.append(_pill("Tagesbudget", f'{st.get("daily_remaining")}/{st.get("daily_limit")} Min', mint=True))
 
-        pills_html = "".join(pills)
+    pills_html = "".join(pills)
 
-        day_override_active = (reason == "override-day")
-        hour_disabled = "disabled" if day_override_active else ""
+    day_override_active = (reason == "override-day")
+    hour_disabled = "disabled" if day_override_active else ""
 
-        rows_html += f"""
+    return f"""
 <div class="rowcard">
   <div class="kid">
     <div class="kidname">{escape(dn)}</div>
@@ -257,7 +307,7 @@ def render_dashboard(css: str, now_iso: str, kids: list[dict]) -> str:
   </div>
 
   <div class="actions">
-    <a class="link" href="/ui/schedule/{escape(u)}">Zeitplan</a>
+    <a class="link" href="/ui/schedule/{escape(u)}/week">Zeitplan</a>
     <form method="post" action="/grant/{escape(u)}/hour">
       <button class="btn" {hour_disabled}>+1h</button>
     </form>
@@ -272,13 +322,18 @@ def render_dashboard(css: str, now_iso: str, kids: list[dict]) -> str:
 </div>
 """
 
+
+def render_dashboard(css: str, now_iso: str, kids: list[dict]) -> str:
+    rows_html = "".join(_dashboard_row(k) for k in kids)
+    _prune_rows({k["username"] for k in kids})
+
     return f"""
 <html lang="de">
 <head>
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width, initial-scale=1"/>
   <title>KidsControl – Dashboard</title>
-  <style>{css}</style>
+  {_stylesheet(css)}
 </head>
 <body>
   <div class="wrap">
@@ -308,6 +363,52 @@ def render_dashboard(css: str, now_iso: str, kids: list[dict]) -> str:
 """
 
 
+def _render_profile(profile: dict | None) -> str:
+    """SQL-Statements, Cache-Treffer und Stufenzeiten aus dem Debug-Modus (app/tracing.py)."""
+    if not profile:
+        return ""
+    stages = "".join(
+        f"<tr><td class='small'>{escape(name)}</td><td><code>{ms:.3f} ms</code></td></tr>"
+        for name, ms in profile.get("stages_ms", {}).items()
+    )
+    stages += f"<tr><td class='small'>gesamt</td><td><code>{profile.get('total_ms') or 0:.3f} ms</code></td></tr>"
+
+    queries = profile.get("queries") or []
+    rows = ""
+    for i, q in enumerate(queries, 1):
+        if q["kind"] == "cache":
+            source = "Cache" if q["from_cache"] else "Cache (nachgeladen)"
+        elif q["compiled_cached"]:
+            source = "SQL (kompiliert: Cache)"
+        else:
+            source = "SQL"
+        rows += (
+            f"<tr><td class='small'>{i}</td><td class='small'>{source}</td>"
+            f"<td><code>{q['ms']:.3f} ms</code></td>"
+            f"<td><code>{'' if q['rows'] is None else q['rows']}</code></td>"
+            f"<td><code>{escape(q['sql'])}</code></td></tr>"
+        )
+    if not rows:
+        rows = "<tr><td colspan='5' class='small'>Keine Queries.</td></tr>"
+    sql_count = sum(1 for q in queries if q["kind"] == "sql")
+    sql_ms = sum(q["ms"] for q in queries if q["kind"] == "sql")
+
+    return f"""
+        <details open>
+          <summary>Ablauf: {sql_count} SQL-Statements, {sql_ms:.3f} ms</summary>
+          <div style="margin-top:10px;">
+            <table>
+              {stages}
+            </table>
+            <table style="margin-top:12px;">
+              <tr><th>#</th><th>Quelle</th><th>Dauer</th><th>Zeilen</th><th>Statement</th></tr>
+              {rows}
+            </table>
+          </div>
+        </details>
+"""
+
+
 def render_trace(css: str, user: str, display_name: str, data: dict) -> str:
     allow = bool(data.get("allow"))
     erlaubnis = "Erlaubt" if allow else "Gesperrt"
@@ -344,13 +445,15 @@ def render_trace(css: str, user: str, display_name: str, data: dict) -> str:
     expl = "Erlaubt, weil " if allow else "Gesperrt, weil "
     expl += reason_de.lower()
 
+    profile_html = _render_profile(data.get("profile"))
+
     return f"""
 <html lang="de">
 <head>
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width, initial-scale=1"/>
   <title>KidsControl – Log: {escape(user)}</title>
-  <style>{css}</style>
+  {_stylesheet(css)}
 </head>
 <body>
   <div class="wrap">
@@ -383,6 +486,8 @@ def render_trace(css: str, user: str, display_name: str, data: dict) -> str:
             </table>
           </div>
         </details>
+
+        {profile_html}
       </div>
     </div>
   </div>
@@ -391,28 +496,74 @@ def render_trace(css: str, user: str, display_name: str, data: dict) -> str:
 """
 
 
-def render_schedule_editor(css: str, user: str, display_name: str, schedules: dict, presets: dict, profiles: list[str]) -> str:
-    def hm(mins: int):
-        h = mins // 60
-        m = mins % 60
-        return h, m
+# Leere Zusatzfenster pro Tag im Editor (mehr werden es nach dem Speichern)
+EDITOR_SPARE_WINDOWS = 1
+EDITOR_MIN_WINDOWS = 3
+
 
+def _hm_value(mins: int) -> str:
+    return f"{mins // 60:02d}:{mins % 60:02d}"
+
+
+def _parse_hm(value: str) -> int | None:
+    h, sep, m = (value or "").strip().partition(":")
+    if not sep:
+        return None
+    try:
+        return int(h) * 60 + int(m)
+    except ValueError:
+        return None
+
+
+def parse_schedule_form(form) -> dict:
+    """
+    Formular des Zeitplan-Editors -> Wochenplan im Profilformat
+    (weekday -> {"windows": [[start, end], ...], "daily_minutes": N}).
+    Halb ausgefüllte oder verdrehte Fenster werden ignoriert.
+    """
+    week = {}
+    for wd in range(7):
+        windows = []
+        i = 0
+        while f"wd{wd}_w{i}_start" in form:
+            start = _parse_hm(form.get(f"wd{wd}_w{i}_start"))
+            end = _parse_hm(form.get(f"wd{wd}_w{i}_end"))
+            if start is not None and end is not None and start <= end:
+                windows.append([start, end])
+            i += 1
+        try:
+            daily = max(0, min(1440, int(form.get(f"wd{wd}_daily") or 0)))
+        except ValueError:
+            daily = 0
+        week[str(wd)] = {"windows": windows, "daily_minutes": daily}
+    return {"week": week}
+
+
+def render_schedule_editor(css: str, user: str, display_name: str, schedules: dict, presets: dict, profiles: list[str]) -> str:
+    """schedules: weekday -> {"windows": [...], "daily_minutes"} (oder alt: start_min/end_min)."""
     preset_opts = "".join([f"<option value='{escape(name)}'>{escape(name)}</option>" for name in presets.keys()])
     profile_opts = "".join([f"<option value='{escape(name)}'>{escape(name)}</option>" for name in profiles])
 
     rows = ""
     for wd in range(7):
-        s = schedules.get(wd) or {"start_min": 900, "end_min": 1110, "daily_minutes": 120}
-        sh, sm = hm(int(s["start_min"]))
-        eh, em = hm(int(s["end_min"]))
+        s = schedules.get(wd) or schedules.get(str(wd)) or {"start_min": 900, "end_min": 1110, "daily_minutes": 120}
+        windows = s.get("windows")
+        if windows is None:
+            windows = [(s["start_min"], s["end_min"])]
         dm = int(s["daily_minutes"])
+        slots = list(windows) + [None] * max(EDITOR_SPARE_WINDOWS, EDITOR_MIN_WINDOWS - len(windows))
+        cells = ""
+        for i, w in enumerate(slots):
+            start, end = (_hm_value(int(w[0])), _hm_value(int(w[1]))) if w else ("", "")
+            cells += f"""
+    <span style="display:inline-flex; gap:4px; align-items:center; margin:0 10px 4px 0;">
+      <input name="wd{wd}_w{i}_start" type="time" value="{start}" style="width:110px;">–<input name="wd{wd}_w{i}_end" type="time" value="{end}" style="width:110px;">
+    </span>"""
         rows += f"""
 <tr>
   <td><b>{WEEKDAYS_DE[wd]}</b></td>
-  <td style="width:90px;"><input name="wd{wd}_start_h" type="number" min="0" max="23" value="{sh}"></td>
-  <td style="width:90px;"><input name="wd{wd}_start_m" type="number" min="0" max="59" value="{sm}"></td>
-  <td style="width:90px;"><input name="wd{wd}_end_h" type="number" min="0" max="23" value="{eh}"></td>
-  <td style="width:90px;"><input name="wd{wd}_end_m" type="number" min="0" max="59" value="{em}"></td>
+  <td>{cells}
+  </td>
   <td style="width:140px;"><input name="wd{wd}_daily" type="number" min="0" max="1440" value="{dm}"></td>
 </tr>
 """
@@ -423,7 +574,7 @@ def render_schedule_editor(css: str, user: str, display_name: str, schedules: di
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width, initial-scale=1"/>
   <title>KidsControl – Zeitplan: {escape(display_name)}</title>
-  <style>{css}</style>
+  {_stylesheet(css)}
 </head>
 <body>
   <div class="wrap">
@@ -441,7 +592,7 @@ def render_schedule_editor(css: str, user: str, display_name: str, schedules: di
 
       <div class="grid">
         <div class="card">
-          <form method="post" action="/ui/schedule/{escape(user)}">
+          <form method="post" action="/ui/schedule/{escape(user)}/week">
             <div style="display:flex; gap:10px; flex-wrap:wrap; align-items:flex-end;">
               <div style="min-width:260px;">
                 <div class="small">Preset (Zeitplan)</div>
@@ -466,7 +617,7 @@ def render_schedule_editor(css: str, user: str, display_name: str, schedules: di
               <table>
                 <thead>
                   <tr>
-                    <th>Tag</th><th>Start (h)</th><th>Start (m)</th><th>Ende (h)</th><th>Ende (m)</th><th>Tagesminuten</th>
+                    <th>Tag</th><th>Zeitfenster (von – bis, einschließlich)</th><th>Tagesminuten</th>
                   </tr>
                 </thead>
                 <tbody>{rows}</tbody>
@@ -480,6 +631,7 @@ def render_schedule_editor(css: str, user: str, display_name: str, schedules: di
 
             <div class="small" style="margin-top:10px;">
               Tagesminuten <b>0</b> sperrt komplett (auch wenn Zeitfenster aktiv wäre).
+              Mehrere Fenster pro Tag sind möglich; leere Felder werden ignoriert, überlappende Fenster zusammengefasst.
             </div>
           </form>
         </div>
@@ -512,7 +664,7 @@ def render_child_view(css: str, user: str, display_name: str, data: dict) -> str
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width, initial-scale=1"/>
   <title>KidsControl – {escape(display_name)}</title>
-  <style>{css}</style>
+  {_stylesheet(css)}
 </head>
 <body>
   <div class="wrap">
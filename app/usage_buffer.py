@@ -0,0 +1,443 @@
+"""Write-behind-Puffer für die Tagesnutzung.
+
+Jedes Gerät führt pro Kind und Tag eigene Aktivitätsintervalle: ein Heartbeat
+verlängert das offene Intervall des Geräts, nach einer Lücke von mehr als
+KIDSCONTROL_USAGE_GAP_SECONDS beginnt ein neues. Die Tagesnutzung ist die
+Vereinigung aller Intervalle (app/intervals.py) – zwei gleichzeitig laufende
+Geräte zählen also nur einmal, und Heartbeats verschiedener Geräte stören
+sich nicht gegenseitig.
+
+Ein Hintergrund-Thread schreibt alle KIDSCONTROL_USAGE_FLUSH_SECONDS die
+geänderten Intervalle nach `usage_intervals` (neue Zeilen per Insert, offene
+per Update mit end_at = max(end_at, neu)), liest danach alle Intervalle der
+betroffenen Kinder zurück und schreibt die Summe mit
+used_minutes = max(used_minutes, neu) nach `daily_usage`. Beide Updates sind
+idempotent – mehrere Worker können dasselbe Kind zählen, ohne dass Minuten
+verloren gehen oder doppelt zählen. Beim Shutdown wird ein letztes Mal geschrieben.
+
+Weil nie kleiner geschrieben wird, hinterlässt reset_day() eine Marke in
+`usage_resets`. Vor jedem Flush liest jeder Worker die Marken seiner Einträge
+und verwirft, was er von vor dem Zurücksetzen im Speicher hat – sonst
+schriebe er den alten Stand beim nächsten Flush zurück.
+
+Entscheidungen nutzen immer die Summe im Speicher (DB-Stand + noch nicht
+geschriebene Intervalle).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, case, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import metrics, tracing
+from app.db import SessionLocal, DailyUsage, UsageInterval, UsageReset
+from app.intervals import IntervalUnion
+
+USAGE_FLUSH_SECONDS = int(os.getenv("KIDSCONTROL_USAGE_FLUSH_SECONDS", "30"))
+# Längere Pausen zwischen zwei Heartbeats eines Geräts zählen nicht als Nutzung
+USAGE_GAP_SECONDS = int(os.getenv("KIDSCONTROL_USAGE_GAP_SECONDS", "120"))
+
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+# (username, day) -> {
+#     "union": IntervalUnion,        # alle bekannten Intervalle (Epoch-Sekunden)
+#     "devices": {device: {"name": str, "id": int | None, "start": float, "end": float, "dirty": bool}},
+#     "closed": [...],               # nach einer Lücke abgelöste, noch ungeschriebene Intervalle
+#     "legacy": int,                 # Minuten in daily_usage ohne Intervalle (Altbestand)
+#     "last_seen": datetime | None,
+#     "since": float,                # Stand gilt ab hier (Epoch); ältere usage_resets sind schon drin
+# }
+_entries: dict[tuple[str, str], dict] = {}
+
+stats = {"flushes": 0, "rows_flushed": 0, "heartbeats": 0, "failures": 0, "last_flush_at": None}
+
+
+def _epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _naive(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def _minutes(e: dict) -> int:
+    return e["legacy"] + int(e["union"].total() // 60)
+
+
+def _new_entry(since: float | None = None) -> dict:
+    return {
+        "union": IntervalUnion(),
+        "devices": {},
+        "closed": [],
+        "legacy": 0,
+        "last_seen": None,
+        "since": time.time() if since is None else since,
+    }
+
+
+def _usage_query(users: list[str], day: str):
+    return select(DailyUsage.username, DailyUsage.used_minutes).where(
+        DailyUsage.username.in_(users), DailyUsage.day == day
+    )
+
+
+def _interval_query(users: list[str], day: str):
+    return (
+        select(UsageInterval.id, UsageInterval.username, UsageInterval.device, UsageInterval.start_at, UsageInterval.end_at)
+        .where(UsageInterval.username.in_(users), UsageInterval.day == day)
+        .order_by(UsageInterval.id)
+    )
+
+
+def _merge(e: dict, intervals):
+    """DB-Intervalle in den Eintrag übernehmen (Lock muss gehalten werden)."""
+    for r in intervals:
+        start, end = _epoch(r.start_at), _epoch(r.end_at)
+        e["union"].add(start, end)
+        dev = e["devices"].get(r.device)
+        # jüngstes Intervall eines Geräts übernehmen, solange lokal nichts offen ist
+        if dev is None or (not dev["dirty"] and end > dev["end"]):
+            e["devices"][r.device] = {"name": r.device, "id": r.id, "start": start, "end": end, "dirty": False}
+
+
+def _dirty(e: dict) -> bool:
+    return bool(e["closed"]) or any(d["dirty"] for d in e["devices"].values())
+
+
+def _missing(users: list[str], day: str) -> list[str]:
+    return [u for u in users if (u, day) not in _entries]
+
+
+def _fill(missing: list[str], day: str, usage_rows, interval_rows):
+    used = {r.username: int(r.used_minutes) for r in usage_rows}
+    by_user: dict[str, list] = {}
+    for r in interval_rows:
+        by_user.setdefault(r.username, []).append(r)
+    with _lock:
+        for u in missing:
+            if (u, day) in _entries:
+                continue
+            e = _new_entry()
+            _merge(e, by_user.get(u, []))
+            # daily_usage und Intervalle werden in einer Transaktion geschrieben;
+            # was darüber hinausgeht, stammt aus der Zeit vor den Intervallen
+            e["legacy"] = max(0, used.get(u, 0) - _minutes(e))
+            _entries[(u, day)] = e
+
+
+def _totals(users: list[str], day: str, loaded: int = 0) -> dict[str, int]:
+    if tracing.active():
+        detail = f"{len(users) - loaded} aus dem Speicher, {loaded} nachgeladen"
+        tracing.cache("usage buffer", hit=not loaded, rows=len(users), detail=detail)
+    out = {}
+    for u in users:
+        e = _entries.get((u, day))
+        if e is not None:
+            out[u] = _minutes(e)
+    return out
+
+
+def totals(db, users: list[str], day: str) -> dict[str, int]:
+    """Aktuelle Minuten pro Kind; fehlende Einträge werden mit zwei Queries nachgeladen."""
+    missing = _missing(users, day)
+    if missing:
+        _fill(
+            missing,
+            day,
+            db.execute(_usage_query(missing, day)).all(),
+            db.execute(_interval_query(missing, day)).all(),
+        )
+    return _totals(users, day, len(missing))
+
+
+async def totals_async(adb, users: list[str], day: str) -> dict[str, int]:
+    missing = _missing(users, day)
+    if missing:
+        _fill(
+            missing,
+            day,
+            (await adb.execute(_usage_query(missing, day))).all(),
+            (await adb.execute(_interval_query(missing, day))).all(),
+        )
+    return _totals(users, day, len(missing))
+
+
+def tick(user: str, day: str, now_utc_naive: datetime, device: str = "") -> int:
+    """
+    Ein Heartbeat eines Geräts: verlängert dessen offenes Intervall bis jetzt
+    oder beginnt nach einer Lücke ein neues. Liefert die Tagesminuten.
+    Der Eintrag sollte vorher über totals() geladen sein.
+    """
+    t = _epoch(now_utc_naive)
+    with _lock:
+        # nach reset() zwischen Laden und Tick neu bei 0 anfangen
+        e = _entries.get((user, day))
+        if e is None:
+            e = _entries[(user, day)] = _new_entry()
+        stats["heartbeats"] += 1
+        if e["last_seen"] is None or now_utc_naive > e["last_seen"]:
+            e["last_seen"] = now_utc_naive
+
+        dev = e["devices"].get(device)
+        if dev is not None and dev["start"] <= t <= dev["end"]:
+            pass  # verspäteter Heartbeat, schon abgedeckt
+        elif dev is not None and 0 < t - dev["end"] <= USAGE_GAP_SECONDS:
+            e["union"].add(dev["end"], t)
+            dev["end"] = t
+            dev["dirty"] = True
+        elif dev is None or t > dev["end"]:
+            # erster Kontakt oder Lücke: die Pause zählt nicht, ab jetzt neu
+            if dev is not None and dev["dirty"]:
+                e["closed"].append(dev)
+            e["devices"][device] = {"name": device, "id": None, "start": t, "end": t, "dirty": True}
+        return _minutes(e)
+
+
+def reset(user: str, day: str):
+    """Nur den Eintrag dieses Workers verwerfen; für alle Worker: reset_day()."""
+    with _lock:
+        _entries.pop((user, day), None)
+
+
+def _insert_for(db):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+def reset_day(db, user: str, day: str):
+    """Nutzung von `user` an `day` löschen und eine Marke für die anderen Worker setzen; committet."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    db.query(DailyUsage).filter_by(username=user, day=day).delete(synchronize_session=False)
+    db.query(UsageInterval).filter_by(username=user, day=day).delete(synchronize_session=False)
+    stmt = _insert_for(db)(UsageReset.__table__).values(username=user, day=day, reset_at=now)
+    db.execute(stmt.on_conflict_do_update(index_elements=["username", "day"], set_={"reset_at": stmt.excluded.reset_at}))
+    db.commit()
+    reset(user, day)
+
+
+def _restart(e: dict, reset_ts: float) -> dict:
+    """Eintrag ab dem Zurücksetzen neu beginnen; nur noch ungeschriebene Nutzung danach bleibt."""
+    fresh = _new_entry(since=reset_ts)
+    pending = [(dev, True) for dev in e["closed"]] + [(dev, False) for dev in e["devices"].values() if dev["dirty"]]
+    for dev, closed in pending:
+        if dev["end"] <= reset_ts:
+            continue
+        kept = {**dev, "id": None, "start": max(dev["start"], reset_ts), "dirty": True}
+        fresh["union"].add(kept["start"], kept["end"])
+        if closed:
+            fresh["closed"].append(kept)
+        else:
+            fresh["devices"][kept["name"]] = kept
+        fresh["last_seen"] = e["last_seen"]
+    return fresh
+
+
+def _apply_resets(db):
+    """usage_resets anderer Worker übernehmen, bevor geschrieben wird."""
+    with _lock:
+        days = {d for (_, d) in _entries}
+    if not days:
+        return
+    rows = db.execute(
+        select(UsageReset.username, UsageReset.day, UsageReset.reset_at).where(UsageReset.day.in_(days))
+    ).all()
+    with _lock:
+        for r in rows:
+            e = _entries.get((r.username, r.day))
+            reset_ts = _epoch(r.reset_at)
+            if e is not None and reset_ts > e["since"]:
+                _entries[(r.username, r.day)] = _restart(e, reset_ts)
+
+
+def _upsert_usage(db, rows: list[dict]):
+    t = DailyUsage.__table__
+    stmt = _insert_for(db)(t).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["username", "day"],
+        set_={
+            # Summe aus der Vereinigung – nie kleiner werden, egal welcher Worker zuletzt schreibt
+            "used_minutes": case(
+                (t.c.used_minutes < stmt.excluded.used_minutes, stmt.excluded.used_minutes),
+                else_=t.c.used_minutes,
+            ),
+            "last_seen_at": case(
+                (t.c.last_seen_at < stmt.excluded.last_seen_at, stmt.excluded.last_seen_at),
+                else_=t.c.last_seen_at,
+            ),
+        },
+    )
+    db.execute(stmt)
+
+
+def _write_intervals(db, new: list[tuple], extended: list[dict]):
+    t = UsageInterval.__table__
+    if new:
+        ids = db.execute(
+            insert(t).returning(t.c.id, sort_by_parameter_order=True),
+            [row for _, row in new],
+        ).scalars().all()
+        with _lock:
+            for (dev, _), row_id in zip(new, ids):
+                dev["id"] = row_id
+    if extended:
+        db.execute(
+            update(t)
+            .where(t.c.id == bindparam("b_id"))
+            .values(end_at=case((t.c.end_at < bindparam("b_end"), bindparam("b_end")), else_=t.c.end_at)),
+            extended,
+        )
+
+
+def flush(db=None) -> int:
+    """Schreibt alle geänderten Intervalle in einer Transaktion und gleicht die Summen mit der DB ab."""
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        _apply_resets(db)
+        return _flush(db)
+    finally:
+        if own:
+            db.close()
+
+
+def _flush(db) -> int:
+    with _lock:
+        new, extended, owners, keys = [], [], [], set()
+        for (u, d), e in _entries.items():
+            devices = [(name, dev) for name, dev in e["devices"].items() if dev["dirty"]]
+            devices += [(dev["name"], dev) for dev in e["closed"]]
+            e["closed"] = []
+            for name, dev in devices:
+                dev["dirty"] = False
+                owners.append(((u, d), dev))
+                keys.add((u, d))
+                if dev["id"] is None:
+                    row = {
+                        "username": u,
+                        "day": d,
+                        "device": name,
+                        "start_at": _naive(dev["start"]),
+                        "end_at": _naive(dev["end"]),
+                    }
+                    new.append((dev, row))
+                else:
+                    extended.append({"b_id": dev["id"], "b_end": _naive(dev["end"])})
+
+    if keys:
+        try:
+            _write_intervals(db, new, extended)
+            _sync_totals(db, keys)
+            db.commit()
+        except Exception:
+            db.rollback()
+            stats["failures"] += 1
+            with _lock:
+                for dev, _ in new:
+                    dev["id"] = None
+                for (u, d), dev in owners:
+                    e = _entries.get((u, d))
+                    if e is None:
+                        continue
+                    dev["dirty"] = True
+                    if e["devices"].get(dev["name"]) is not dev:
+                        e["closed"].append(dev)
+            raise
+        stats["flushes"] += 1
+        stats["rows_flushed"] += len(new) + len(extended)
+        stats["last_flush_at"] = datetime.now().isoformat()
+    _refresh(db)
+    return len(keys)
+
+
+def _sync_totals(db, keys: set[tuple[str, str]]):
+    """Vereinigung aus allen Intervallen (auch anderer Worker) bilden und nach daily_usage schreiben."""
+    by_day: dict[str, list[str]] = {}
+    for u, d in keys:
+        by_day.setdefault(d, []).append(u)
+    rows = []
+    for day, users in by_day.items():
+        _load(db, users, day)
+        with _lock:
+            for u in users:
+                e = _entries.get((u, day))
+                if e is not None:
+                    rows.append({"username": u, "day": day, "used_minutes": _minutes(e), "last_seen_at": e["last_seen"]})
+    for r in rows:
+        if r["last_seen_at"] is None:
+            r["last_seen_at"] = datetime.now(timezone.utc).replace(tzinfo=None)
+    if rows:
+        _upsert_usage(db, rows)
+
+
+def _load(db, users: list[str], day: str):
+    used = {r.username: int(r.used_minutes) for r in db.execute(_usage_query(users, day))}
+    by_user: dict[str, list] = {}
+    for r in db.execute(_interval_query(users, day)):
+        by_user.setdefault(r.username, []).append(r)
+    with _lock:
+        for u in users:
+            e = _entries.get((u, day))
+            if e is None:
+                continue
+            if u not in used and u not in by_user and not _dirty(e):
+                # Tag wurde (ggf. von einem anderen Worker) zurückgesetzt
+                _entries[(u, day)] = _new_entry()
+                continue
+            _merge(e, by_user.get(u, []))
+
+
+def _refresh(db):
+    """Intervalle anderer Worker übernehmen; alte Tage aus dem Speicher werfen."""
+    with _lock:
+        days = {d for (_, d) in _entries}
+        if not days:
+            return
+        today = max(days)
+        for key in [k for k, e in _entries.items() if k[1] != today and not _dirty(e)]:
+            del _entries[key]
+        users = [u for (u, d) in _entries if d == today]
+    _load(db, users, today)
+    db.rollback()
+
+
+def _gauges():
+    with _lock:
+        dirty = sum(1 for e in _entries.values() if _dirty(e))
+        out = [({"kind": "entries"}, len(_entries)), ({"kind": "dirty"}, dirty)]
+    out += [({"kind": k}, stats[k]) for k in ("flushes", "rows_flushed", "heartbeats", "failures")]
+    return out
+
+
+metrics.register_gauges("kidscontrol_usage_buffer", "Write-behind-Puffer (Einträge, Flushes seit Start)", _gauges)
+
+
+def _loop():
+    while not _stop.wait(USAGE_FLUSH_SECONDS):
+        try:
+            flush()
+        except Exception as e:
+            print(f"[WARN] usage flush fehlgeschlagen: {e}")
+
+
+def start():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="kidscontrol-usage-flush", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
+    flush()
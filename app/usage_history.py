@@ -0,0 +1,188 @@
+"""Nutzungsverlauf über die Aufbewahrung von daily_usage hinaus.
+
+Die Wartung (app/maintenance.py) rechnet vor dem Löschen alter Tageszeilen
+alle abgeschlossenen Tage in Wochen- und Monatssummen ein (`weekly_usage`,
+`monthly_usage`). Jede Summenzeile merkt sich in `through_day`, bis zu welchem
+Tag sie schon gezählt hat; ein erneuter Lauf addiert nur spätere Tage, und das
+Update greift nur, wenn `through_day` noch unverändert ist – laufen zwei
+Worker gleichzeitig, zählt keiner doppelt.
+
+usage_range() beantwortet Abfragen über beliebige Zeiträume mit einem
+Indexzugriff auf die Summen plus den wenigen Tageszeilen, die noch nicht
+eingerechnet sind (heute, gestern vor dem nächsten Wartungslauf). Der
+Aufwand hängt nur von der Zahl der Buckets ab, nicht von der Länge des
+Verlaufs.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.db import DailyUsage, WeeklyUsage, MonthlyUsage
+
+GRANULARITIES = ("day", "week", "month")
+# Schutz gegen versehentlich riesige Tagesabfragen
+RANGE_MAX_BUCKETS = int(os.getenv("KIDSCONTROL_USAGE_RANGE_MAX_BUCKETS", "400"))
+
+_MODELS = {"week": WeeklyUsage, "month": MonthlyUsage}
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def period_key(day: date, granularity: str) -> str:
+    start = period_start(day, granularity)
+    return start.strftime("%Y-%m") if granularity == "month" else start.isoformat()
+
+
+def rollup(db, today: date) -> int:
+    """Abgeschlossene Tage (vor `today`) in die Wochen-/Monatssummen einrechnen. Gibt die Zahl geänderter Summen zurück."""
+    days = db.execute(
+        select(DailyUsage.username, DailyUsage.day, DailyUsage.used_minutes).where(DailyUsage.day < today.isoformat())
+    ).all()
+    if not days:
+        return 0
+
+    changed = 0
+    for granularity, model in _MODELS.items():
+        t = model.__table__
+        buckets: dict[tuple[str, str], list[tuple[str, int]]] = {}
+        for username, day, minutes in days:
+            key = (username, period_key(date.fromisoformat(day), granularity))
+            buckets.setdefault(key, []).append((day, minutes or 0))
+
+        existing = {
+            (r.username, r.period): r
+            for r in db.execute(
+                select(t.c.id, t.c.username, t.c.period, t.c.through_day).where(
+                    t.c.username.in_({u for u, _ in buckets}),
+                    t.c.period.in_({p for _, p in buckets}),
+                )
+            )
+        }
+
+        for (username, period), entries in buckets.items():
+            row = existing.get((username, period))
+            through = row.through_day if row else ""
+            new = [(d, m) for d, m in entries if d > through]
+            if not new:
+                continue
+            used = sum(m for _, m in new)
+            active = sum(1 for _, m in new if m > 0)
+            peak = max(m for _, m in new)
+            last = max(d for d, _ in new)
+
+            if row is None:
+                try:
+                    with db.begin_nested():
+                        db.execute(
+                            insert(t).values(
+                                username=username,
+                                period=period,
+                                used_minutes=used,
+                                active_days=active,
+                                max_minutes=peak,
+                                through_day=last,
+                            )
+                        )
+                except IntegrityError:
+                    # ein anderer Worker hat die Summe gerade angelegt – der nächste Lauf holt den Rest nach
+                    continue
+                changed += 1
+                continue
+
+            result = db.execute(
+                update(t)
+                .where(t.c.id == row.id, t.c.through_day == through)
+                .values(
+                    used_minutes=t.c.used_minutes + used,
+                    active_days=t.c.active_days + active,
+                    max_minutes=case((t.c.max_minutes < peak, peak), else_=t.c.max_minutes),
+                    through_day=last,
+                )
+            )
+            changed += result.rowcount
+    return changed
+
+
+def _bucket(key: str, start: date, end: date) -> dict:
+    return {
+        "period": key,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "used_minutes": 0,
+        "active_days": 0,
+        "max_minutes": 0,
+    }
+
+
+def usage_range(db, username: str, start: date, end: date, granularity: str = "day") -> list[dict]:
+    """
+    Nutzung von `start` bis `end` (inklusive) in Buckets. Wochen und Monate
+    werden immer ganz geliefert, auch wenn `start`/`end` mitten hinein fallen.
+    Tageswerte gibt es nur, solange daily_usage sie noch aufbewahrt.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if end < start:
+        raise ValueError("'to' must not be before 'from'")
+
+    buckets: dict[str, dict] = {}
+    at = period_start(start, granularity)
+    while at <= end:
+        nxt = next_period(at, granularity)
+        key = period_key(at, granularity)
+        buckets[key] = _bucket(key, at, nxt - timedelta(days=1))
+        if len(buckets) > RANGE_MAX_BUCKETS:
+            raise ValueError(f"too many buckets (max {RANGE_MAX_BUCKETS})")
+        at = nxt
+    first, last = next(iter(buckets.values())), buckets[key]
+
+    through: dict[str, str] = {}
+    model = _MODELS.get(granularity)
+    if model is not None:
+        t = model.__table__
+        rows = db.execute(
+            select(t).where(t.c.username == username, t.c.period >= first["period"], t.c.period <= last["period"])
+        )
+        for r in rows:
+            b = buckets[r.period]
+            b["used_minutes"], b["active_days"], b["max_minutes"] = r.used_minutes, r.active_days, r.max_minutes
+            through[r.period] = r.through_day
+
+    # noch nicht eingerechnete Tage: nur die, die daily_usage noch hat
+    raw = db.execute(
+        select(DailyUsage.day, DailyUsage.used_minutes).where(
+            DailyUsage.username == username, DailyUsage.day >= first["from"], DailyUsage.day <= last["to"]
+        )
+    )
+    for day, minutes in raw:
+        key = period_key(date.fromisoformat(day), granularity)
+        if day <= through.get(key, ""):
+            continue
+        b = buckets[key]
+        minutes = minutes or 0
+        b["used_minutes"] += minutes
+        b["active_days"] += 1 if minutes > 0 else 0
+        b["max_minutes"] = max(b["max_minutes"], minutes)
+
+    for b in buckets.values():
+        b["avg_minutes"] = round(b["used_minutes"] / b["active_days"]) if b["active_days"] else 0
+    return list(buckets.values())
@@ -0,0 +1,51 @@
+"""Widget-Token pro Kind für GET /api/widget/status/{user}.
+
+Jedes Kind kann einen eigenen Token bekommen. Er öffnet nur den Status dieses
+einen Kindes. In der Datenbank steht nur sein SHA-256-Hash
+(children.widget_token_hash). Der Policy-Snapshot hält daraus einen Index
+Hash -> Kind im Speicher (policy_cache.user_for_token_hash). Eine Prüfung
+kostet also einen Hash und einen Dict-Zugriff, egal wie viele Kinder es gibt.
+Neu ausstellen oder widerrufen ändert Child und invalidiert damit
+automatisch die Snapshots aller Worker.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import secrets
+
+from app import policy_cache
+from app.db import AuditLog, Child
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue(db, user: str, actor: str) -> str | None:
+    """Neuen Token ausstellen (ersetzt den alten); liefert ihn im Klartext – nur dieses eine Mal."""
+    child = db.query(Child).filter(Child.username == user).first()
+    if child is None:
+        return None
+    token = secrets.token_urlsafe(24)
+    child.widget_token_hash = token_hash(token)
+    db.add(AuditLog(actor=actor, child=user, action="WIDGET_TOKEN_ISSUE", details="neuer Widget-Token"))
+    db.commit()
+    return token
+
+
+def revoke(db, user: str, actor: str) -> bool:
+    child = db.query(Child).filter(Child.username == user).first()
+    if child is None:
+        return False
+    child.widget_token_hash = None
+    db.add(AuditLog(actor=actor, child=user, action="WIDGET_TOKEN_REVOKE", details="Widget-Token widerrufen"))
+    db.commit()
+    return True
+
+
+def user_for(token: str | None) -> str | None:
+    """Kind, zu dem `token` gehört (laut aktuellem Snapshot), sonst None."""
+    if not token:
+        return None
+    return policy_cache.user_for_token_hash(token_hash(token))
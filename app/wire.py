@@ -0,0 +1,182 @@
+"""Kompaktes Binärformat (MessagePack/CBOR) für die Polling-Endpunkte.
+
+Die Clients wählen das Format per Content Negotiation:
+- `Accept: application/msgpack` (auch application/x-msgpack, application/vnd.msgpack)
+- `Accept: application/cbor`
+Ohne passenden Accept-Header, oder wenn die Bibliothek (`msgpack` bzw. `cbor2`)
+nicht installiert ist, bleibt es bei JSON wie bisher.
+
+Eine Entscheidung wird als Map mit kurzen Schlüsseln und nur ganzen Zahlen
+geschickt. Fehlende Werte fehlen auch in der Map:
+
+  a   allow (0/1)            r   Grund-Code, Index in REASON_CODES
+  w   warn (0/1)             ml  minutes_left_window
+  we  Fensterende, Minute des Tages
+  du  daily_used             dl  daily_limit          dr  daily_remaining
+  rm  remaining_minutes (nur Widget)
+  ou  Freigabe bis, Unix-Sekunden
+  nc  next_change_at, Unix-Sekunden
+
+Deutsche Beschriftungen (reason_label, remaining_label, override_text, ...)
+werden nicht mitgeschickt. Die Clients holen sie einmal über GET /api/reasons
+und cachen sie; `v` in jeder Antwort nennt die passende REASONS_VERSION.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime
+
+from app.ui import REASON_MAP_DE
+
+try:
+    import msgpack  # optional: pip install msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2  # optional: pip install cbor2
+except ImportError:
+    cbor2 = None
+
+# Codes sind Indizes: nur hinten anfügen, nie umsortieren
+REASON_CODES = (
+    "unknown-user",
+    "no-schedule",
+    "outside-time",
+    "no-daily-minutes",
+    "daily-limit-reached",
+    "schedule",
+    "override",
+    "override-day",
+)
+_REASON_INDEX = {reason: code for code, reason in enumerate(REASON_CODES)}
+
+
+def reasons_document() -> dict:
+    return {
+        "reasons": [
+            {"code": code, "reason": reason, "label_de": REASON_MAP_DE.get(reason, reason)}
+            for code, reason in enumerate(REASON_CODES)
+        ],
+        # Feldnamen des kompakten Formats -> JSON-Namen
+        "fields": {
+            "a": "allow",
+            "r": "reason",
+            "w": "warn",
+            "ml": "minutes_left_window",
+            "we": "window_end_min",
+            "du": "daily_used",
+            "dl": "daily_limit",
+            "dr": "daily_remaining",
+            "rm": "remaining_minutes",
+            "ou": "until",
+            "nc": "next_change_at",
+        },
+    }
+
+
+# Version = Inhalts-Hash: ändert sich automatisch mit Codes oder Texten
+REASONS_VERSION = hashlib.blake2b(
+    json.dumps(reasons_document(), sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=6
+).hexdigest()
+
+MEDIA_TYPES = {"msgpack": "application/msgpack", "cbor": "application/cbor"}
+_ACCEPTED = {
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/cbor": "cbor",
+}
+
+
+def available(fmt: str) -> bool:
+    return (msgpack if fmt == "msgpack" else cbor2) is not None
+
+
+def negotiate(accept: str | None) -> str | None:
+    """Bevorzugtes Binärformat laut Accept-Header; None = JSON."""
+    if not accept:
+        return None
+    ranked = []
+    for pos, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for p in params:
+            if p.startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranked.append((-q, pos, media.lower()))
+    for _, _, media in sorted(ranked):
+        fmt = _ACCEPTED.get(media)
+        if fmt and available(fmt):
+            return fmt
+        if media in ("application/json", "*/*", "application/*"):
+            return None
+    return None
+
+
+def content_format(content_type: str | None) -> str | None:
+    """Binärformat eines Request-Bodys laut Content-Type; None = JSON."""
+    media = (content_type or "").split(";")[0].strip().lower()
+    fmt = _ACCEPTED.get(media)
+    return fmt if fmt and available(fmt) else None
+
+
+def encode(fmt: str, obj) -> bytes:
+    if fmt == "msgpack":
+        return msgpack.packb(obj, use_bin_type=True)
+    return cbor2.dumps(obj)
+
+
+def decode(fmt: str, data: bytes):
+    if fmt == "msgpack":
+        return msgpack.unpackb(data, raw=False)
+    return cbor2.loads(data)
+
+
+def _epoch(value: str | None) -> int | None:
+    return int(datetime.fromisoformat(value).timestamp()) if value else None
+
+
+def _minute_of_day(hm: str | None) -> int | None:
+    if not hm:
+        return None
+    h, m = hm.split(":")
+    return int(h) * 60 + int(m)
+
+
+def _put(out: dict, key: str, value):
+    if value is not None:
+        out[key] = int(value)
+
+
+def compact_state(state: dict) -> dict:
+    """Entscheidung aus app/policy.py -> kompakte Map (ohne debug/profile)."""
+    out = {"a": 1 if state.get("allow") else 0, "r": _REASON_INDEX.get(state.get("reason", ""), -1)}
+    if "warn" in state:
+        out["w"] = 1 if state["warn"] else 0
+    _put(out, "ml", state.get("minutes_left_window"))
+    _put(out, "we", _minute_of_day(state.get("window_end_hm")))
+    _put(out, "du", state.get("daily_used"))
+    _put(out, "dl", state.get("daily_limit"))
+    _put(out, "dr", state.get("daily_remaining"))
+    _put(out, "ou", _epoch(state.get("until")))
+    _put(out, "nc", _epoch(state.get("next_change_at")))
+    return out
+
+
+def compact_widget_row(row: dict) -> dict:
+    """Zeile aus /api/widget/status -> kompakte Map; Namen bleiben, Beschriftungen entfallen."""
+    out = {"u": row["username"], "n": row["display_name"], **compact_state(row)}
+    _put(out, "rm", row.get("remaining_minutes"))
+    return out
+
+
+def envelope(server_time: str, **body) -> dict:
+    """Gemeinsamer Rahmen: Serverzeit (Unix-Sekunden) und Version des Grund-Wörterbuchs."""
+    return {"t": _epoch(server_time), "v": REASONS_VERSION, **body}
@@ -0,0 +1,222 @@
+"""Gemeinsame Helfer für die Benchmarks: Temp-DB, Seed, Query-Zähler, Statistik, Baseline.
+
+Wichtig: setup_db() setzt DATABASE_URL, bevor app.db importiert wird –
+deshalb app.* erst nach setup_db() importieren.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# Branch -> Benutzername der eigens dafür angelegten Kinder
+BRANCH_USERS = {
+    "override-day": "bench-override-day",
+    "override": "bench-override",
+    "outside-time": "bench-outside",
+    "limit-reached": "bench-limit",
+    "schedule-prewarn": "bench-prewarn",
+}
+
+queries = {"count": 0, "seconds": 0.0}
+
+
+def setup_db(path: str | None = None) -> str:
+    """Legt eine frische SQLite-Datei an und initialisiert das Schema."""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="kidscontrol-bench-"), "bench.sqlite3")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from sqlalchemy import event
+    from app.db import async_engine, engine, init_db
+
+    init_db()
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["bench_t0"] = time.perf_counter()
+
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        queries["count"] += 1
+        queries["seconds"] += time.perf_counter() - conn.info.pop("bench_t0", time.perf_counter())
+
+    # die async-Pfade (Heartbeat-Batch, Snapshot) laufen über async_engine
+    for eng in (engine, async_engine.sync_engine):
+        event.listen(eng, "before_cursor_execute", _before)
+        event.listen(eng, "after_cursor_execute", _after)
+
+    return path
+
+
+def _window_around(mins: int, before: int, after: int) -> tuple[int, int]:
+    return max(0, mins - before), min(1439, mins + after)
+
+
+def _window_outside(mins: int) -> tuple[int, int]:
+    if mins + 120 <= 1439:
+        return mins + 60, mins + 120
+    return 0, max(0, mins - 60)
+
+
+def seed(tz, children: int = 50, days: int = 14, overrides: int = 10, rnd_seed: int = 1) -> dict:
+    """
+    N normale Kinder mit Wochenplan, Policy, Freigaben und Nutzungsverlauf,
+    dazu je ein Kind pro Entscheidungszweig (BRANCH_USERS), dessen Zeitfenster
+    relativ zur aktuellen Uhrzeit liegt. Kurz vor Mitternacht sind die Zweige
+    deshalb nicht garantiert.
+    """
+    from app.db import SessionLocal, Child, Schedule, ChildPolicy, Override, DailyUsage, DayOverride
+
+    rnd = random.Random(rnd_seed)
+    now_loc = datetime.now(tz)
+    now_utc = datetime.now(timezone.utc)
+    today = now_loc.date()
+    mins = now_loc.hour * 60 + now_loc.minute
+    wd = now_loc.weekday()
+
+    db = SessionLocal()
+    try:
+        for i in range(children):
+            u = f"kind{i:04d}"
+            db.add(Child(username=u, display_name=f"Kind {i}"))
+            db.add(ChildPolicy(username=u, after_expiry_mode=rnd.choice(["LOCK", "SCHOOL"]), warn_minutes=10))
+            for d in range(7):
+                start = rnd.randrange(0, 12 * 60)
+                db.add(
+                    Schedule(
+                        username=u,
+                        weekday=d,
+                        start_min=start,
+                        end_min=min(1439, start + rnd.randrange(60, 12 * 60)),
+                        daily_minutes=rnd.choice([0, 60, 120, 180, 240]),
+                    )
+                )
+            for back in range(days):
+                db.add(
+                    DailyUsage(
+                        username=u,
+                        day=(today - timedelta(days=back)).isoformat(),
+                        used_minutes=rnd.randrange(0, 240),
+                        last_seen_at=now_utc - timedelta(days=back),
+                    )
+                )
+        for i in range(min(overrides, children)):
+            db.add(
+                Override(
+                    username=f"kind{i:04d}",
+                    grant_until=now_utc + timedelta(minutes=rnd.randrange(-600, 120)),
+                    grant_type="HOUR",
+                    created_by="bench",
+                )
+            )
+
+        windows = {
+            "override-day": _window_outside(mins),
+            "override": _window_outside(mins),
+            "outside-time": _window_outside(mins),
+            "limit-reached": _window_around(mins, 60, 120),
+            "schedule-prewarn": _window_around(mins, 60, 5),
+        }
+        for branch, u in BRANCH_USERS.items():
+            start, end = windows[branch]
+            db.add(Child(username=u, display_name=branch))
+            db.add(ChildPolicy(username=u, after_expiry_mode="LOCK", warn_minutes=10))
+            for d in range(7):
+                db.add(Schedule(username=u, weekday=d, start_min=start, end_min=end, daily_minutes=30 if d == wd else 120))
+        db.add(DayOverride(username=BRANCH_USERS["override-day"], day=today.isoformat(), enabled=True))
+        db.add(
+            Override(
+                username=BRANCH_USERS["override"],
+                grant_until=now_utc + timedelta(hours=1),
+                grant_type="HOUR",
+                created_by="bench",
+            )
+        )
+        db.add(DailyUsage(username=BRANCH_USERS["limit-reached"], day=today.isoformat(), used_minutes=45, last_seen_at=now_utc))
+        db.add(DailyUsage(username=BRANCH_USERS["schedule-prewarn"], day=today.isoformat(), used_minutes=5, last_seen_at=now_utc))
+        db.commit()
+    finally:
+        db.close()
+    return {"children": children, "days": days, "overrides": overrides}
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples_s: list[float], query_count: int = 0, ops: int | None = None) -> dict:
+    """Latenzen in Millisekunden; queries_per_op aus dem Query-Zähler."""
+    ms = sorted(x * 1000 for x in samples_s)
+    ops = ops if ops is not None else len(ms)
+    return {
+        "n": len(ms),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "mean_ms": round(statistics.fmean(ms), 4) if ms else 0.0,
+        "queries_per_op": round(query_count / ops, 3) if ops else 0.0,
+    }
+
+
+def measure(fn, iterations: int, warmup: int = 50) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    q0 = queries["count"]
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, queries["count"] - q0)
+
+
+def print_table(results: dict):
+    print(f"{'benchmark':<36} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/op':>7}")
+    for name, r in results.items():
+        print(f"{name:<36} {r['n']:>7} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['queries_per_op']:>7.2f}")
+
+
+def save_baseline(path: str, results: dict, meta: dict):
+    data = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "meta": meta,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    print(f"Baseline gespeichert: {path}")
+
+
+def compare_baseline(path: str, results: dict, tolerance: float) -> int:
+    """Vergleicht p95 und queries_per_op; liefert die Zahl der Regressionen."""
+    with open(path, "r", encoding="utf-8") as f:
+        base = json.load(f)["results"]
+    regressions = 0
+    for name, r in results.items():
+        b = base.get(name)
+        if b is None:
+            continue
+        slower = b["p95_ms"] > 0 and r["p95_ms"] > b["p95_ms"] * (1 + tolerance)
+        more_queries = r["queries_per_op"] > b["queries_per_op"] + 1e-9
+        flag = "REGRESSION" if slower or more_queries else "ok"
+        if flag != "ok":
+            regressions += 1
+        print(
+            f"{name:<36} p95 {b['p95_ms']:.3f} -> {r['p95_ms']:.3f} ms, "
+            f"q/op {b['queries_per_op']:.2f} -> {r['queries_per_op']:.2f}  {flag}"
+        )
+    return regressions
@@ -0,0 +1,170 @@
+"""HTTP-Lastgenerator: N Clients pollen Widget-, Status- und Heartbeat-Endpunkte.
+
+Gegen einen laufenden Server:
+    python -m bench.load --url http://127.0.0.1:8000 --clients 50 --duration 30
+
+Oder mit eigenem Server auf einer frisch befüllten Temp-DB (braucht uvicorn);
+dann werden auch die SQL-Queries gezählt, und zwar gesamt ("all"), nicht pro
+Endpunkt:
+    python -m bench.load --serve --children 200 --clients 50 --save bench/load-baseline.json
+
+--serve importiert app.main:app und setzt deshalb eine vollständige
+app/main.py voraus; mit dem Auszug in diesem Repo startet uvicorn nicht.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
+from bench import common
+
+
+def _serve(port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    for _ in range(200):
+        if server.started:
+            return server, thread
+        time.sleep(0.05)
+    raise RuntimeError("uvicorn startet nicht")
+
+
+def _users(conn, token: str) -> list[str]:
+    conn.request("GET", f"/api/widget/status?t={token}")
+    resp = conn.getresponse()
+    body = resp.read()
+    if resp.status != 200:
+        raise RuntimeError(f"/api/widget/status -> HTTP {resp.status}")
+    data = json.loads(body)
+    kids = data.get("kids", data) if isinstance(data, dict) else data
+    return [k["username"] for k in kids]
+
+
+def _client(idx: int, base, args, users: list[str], stop: threading.Event, samples: dict, lock: threading.Lock):
+    conn = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=10)
+    user = users[idx % len(users)]
+    plan = [
+        ("GET", f"/api/widget/status?t={args.token}", "GET /api/widget/status"),
+        ("GET", f"/api/status/{user}", "GET /api/status/{user}"),
+        ("POST", f"/api/heartbeat/{user}?device=bench-{idx}", "POST /api/heartbeat/{user}"),
+    ]
+    local: dict[str, list] = {}
+    errors = 0
+    i = idx
+    while not stop.is_set():
+        method, path, key = plan[i % len(plan)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path)
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status < 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=10)
+            ok = False
+        dt = time.perf_counter() - t0
+        if ok:
+            local.setdefault(key, []).append(dt)
+        else:
+            errors += 1
+        if args.interval:
+            stop.wait(args.interval)
+    conn.close()
+    with lock:
+        for key, values in local.items():
+            samples.setdefault(key, []).extend(values)
+        samples.setdefault("_errors", []).append(errors)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--serve", action="store_true", help="eigenen Server auf Temp-DB starten")
+    ap.add_argument("--port", type=int, default=8765, help="Port für --serve")
+    ap.add_argument("--children", type=int, default=50, help="Kinder in der Temp-DB (--serve)")
+    ap.add_argument("--clients", type=int, default=20)
+    ap.add_argument("--duration", type=float, default=20.0, help="Sekunden")
+    ap.add_argument("--interval", type=float, default=0.0, help="Pause pro Client zwischen Requests")
+    ap.add_argument("--token", default=os.getenv("KIDSCONTROL_WIDGET_TOKEN", ""))
+    ap.add_argument("--save", metavar="JSON")
+    ap.add_argument("--compare", metavar="JSON")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    meta = {"clients": args.clients, "duration": args.duration, "interval": args.interval}
+    server = None
+    if args.serve:
+        common.setup_db()
+        meta.update(common.seed(ZoneInfo("Europe/Berlin"), children=args.children))
+        server, thread = _serve(args.port)
+        args.url = f"http://127.0.0.1:{args.port}"
+
+    base = urlsplit(args.url)
+    conn = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=10)
+    users = _users(conn, args.token)
+    conn.close()
+    if not users:
+        print("Keine Kinder auf dem Server.")
+        return 2
+
+    samples: dict[str, list] = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_client, args=(i, base, args, users, stop, samples, lock), daemon=True)
+        for i in range(args.clients)
+    ]
+    q0 = common.queries["count"]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=15)
+    elapsed = time.perf_counter() - t0
+    query_count = common.queries["count"] - q0
+
+    errors = sum(samples.pop("_errors", []))
+    total = sum(len(v) for v in samples.values())
+    results = {}
+    for key, values in sorted(samples.items()):
+        # Queries nur gesamt: die Requests laufen parallel, ein Zuordnen pro
+        # Endpunkt wäre geraten
+        results[key] = common.summarize(values, 0, ops=len(values))
+    all_values = [x for v in samples.values() for x in v]
+    results["all"] = common.summarize(all_values, query_count if server else 0, ops=len(all_values))
+
+    common.print_table(results)
+    print(f"{total} Requests in {elapsed:.1f}s = {total / elapsed:.0f} req/s, {errors} Fehler")
+    if not server:
+        print("(Queries pro Request nur mit --serve messbar)")
+    else:
+        print("(Queries nur gesamt in \"all\", pro Endpunkt steht 0)")
+
+    if server:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    if args.save:
+        common.save_baseline(args.save, results, meta)
+    if args.compare:
+        return 1 if common.compare_baseline(args.compare, results, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Micro-Benchmarks: record_heartbeat/evaluate_access je Entscheidungszweig und die render_*-Funktionen.
+
+    python -m bench.micro --children 200 --save bench/baseline.json
+    python -m bench.micro --children 200 --compare bench/baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from zoneinfo import ZoneInfo
+
+from bench import common
+
+EXPECTED_REASON = {
+    "override-day": "override-day",
+    "override": "override",
+    "outside-time": "outside-time",
+    "limit-reached": "daily-limit-reached",
+    "schedule-prewarn": "schedule",
+}
+
+
+def bench_policy(tz, iterations: int) -> dict:
+    from app import policy_cache
+    from app.db import SessionLocal
+    from app.policy import evaluate_access, record_heartbeat, record_heartbeat_many
+
+    results = {}
+    db = SessionLocal()
+    try:
+        for branch, user in common.BRANCH_USERS.items():
+            out = record_heartbeat(db, user, tz)
+            if out.get("reason") != EXPECTED_REASON[branch] or (branch == "schedule-prewarn" and not out.get("warn")):
+                print(f"[WARN] {branch}: unerwartetes Ergebnis {out.get('reason')} (Uhrzeit nahe Mitternacht?)")
+            results[f"record_heartbeat[{branch}]"] = common.measure(lambda: record_heartbeat(db, user, tz), iterations)
+            results[f"evaluate_access[{branch}]"] = common.measure(lambda: evaluate_access(db, user, tz), iterations)
+
+        user = common.BRANCH_USERS["schedule-prewarn"]
+
+        def cold():
+            policy_cache.invalidate()
+            record_heartbeat(db, user, tz)
+
+        results["record_heartbeat[cold policy cache]"] = common.measure(cold, max(1, iterations // 10), warmup=5)
+
+        users = list(policy_cache.get_snapshot(db))
+        many = common.measure(lambda: record_heartbeat_many(db, users, tz), max(1, iterations // 20), warmup=3)
+        results[f"record_heartbeat_many[{len(users)} children]"] = many
+    finally:
+        db.close()
+    return results
+
+
+def bench_render(tz, iterations: int) -> dict:
+    from app import policy_cache, ui
+    from app.db import SessionLocal
+    from app.policy import evaluate_access_many, now_local
+    from app.profiles import PRESETS
+
+    db = SessionLocal()
+    try:
+        snap = policy_cache.get_snapshot(db)
+        states = evaluate_access_many(db, list(snap), tz, include_debug=True)
+    finally:
+        db.close()
+
+    kids = [{"username": u, "display_name": c["display_name"], "state": states[u]} for u, c in snap.items()]
+    now_iso = now_local(tz).isoformat()
+    user = common.BRANCH_USERS["schedule-prewarn"]
+    child = snap[user]
+    css = ui.CSS
+
+    def dashboard_cold():
+        ui._row_cache.clear()
+        ui.render_dashboard(css, now_iso, kids)
+
+    return {
+        f"render_dashboard[{len(kids)} children, cold]": common.measure(dashboard_cold, iterations),
+        f"render_dashboard[{len(kids)} children, warm]": common.measure(
+            lambda: ui.render_dashboard(css, now_iso, kids), iterations
+        ),
+        "render_trace": common.measure(lambda: ui.render_trace(css, user, child["display_name"], states[user]), iterations),
+        "render_schedule_editor": common.measure(
+            lambda: ui.render_schedule_editor(css, user, child["display_name"], child["week"], PRESETS, ["A", "B"]),
+            iterations,
+        ),
+        "render_child_view": common.measure(
+            lambda: ui.render_child_view(css, user, child["display_name"], states[user]), iterations
+        ),
+        "render_login_page": common.measure(lambda: ui.render_login_page(css, "administrator"), iterations),
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--children", type=int, default=50)
+    ap.add_argument("--days", type=int, default=14, help="Tage Nutzungsverlauf pro Kind")
+    ap.add_argument("--overrides", type=int, default=10)
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--db", help="Pfad der SQLite-Datei (Standard: Temp-Verzeichnis)")
+    ap.add_argument("--save", metavar="JSON", help="Ergebnisse als Baseline speichern")
+    ap.add_argument("--compare", metavar="JSON", help="gegen Baseline vergleichen (Exit 1 bei Regression)")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="erlaubte p95-Verschlechterung (0.25 = 25%%)")
+    args = ap.parse_args(argv)
+
+    path = common.setup_db(args.db)
+    tz = ZoneInfo("Europe/Berlin")
+    meta = common.seed(tz, children=args.children, days=args.days, overrides=args.overrides)
+    meta["iterations"] = args.iterations
+    print(f"DB: {path}  ({args.children} Kinder, {args.days} Tage Verlauf)")
+
+    results = bench_policy(tz, args.iterations)
+    results.update(bench_render(tz, args.iterations))
+    common.print_table(results)
+
+    if args.save:
+        common.save_baseline(args.save, results, meta)
+    if args.compare:
+        return 1 if common.compare_baseline(args.compare, results, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
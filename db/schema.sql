@@ -2,9 +2,11 @@ CREATE TABLE children (
 	id INTEGER NOT NULL, 
 	username VARCHAR NOT NULL, 
 	display_name VARCHAR NOT NULL, 
+	widget_token_hash VARCHAR, 
 	PRIMARY KEY (id), 
 	UNIQUE (username)
 );
+CREATE UNIQUE INDEX ix_children_widget_token_hash ON children (widget_token_hash);
 CREATE TABLE schedules (
 	id INTEGER NOT NULL, 
 	username VARCHAR NOT NULL, 
@@ -12,9 +14,26 @@ CREATE TABLE schedules (
 	start_min INTEGER NOT NULL, 
 	end_min INTEGER NOT NULL, 
 	daily_minutes INTEGER NOT NULL, 
+	windows VARCHAR, 
 	PRIMARY KEY (id), 
 	CONSTRAINT uq_schedule_user_weekday UNIQUE (username, weekday)
 );
+CREATE TABLE child_policy (
+	username VARCHAR NOT NULL, 
+	after_expiry_mode VARCHAR NOT NULL, 
+	hard_lock BOOLEAN NOT NULL, 
+	warn_minutes INTEGER NOT NULL, 
+	PRIMARY KEY (username)
+);
+CREATE TABLE prewarn_log (
+	id INTEGER NOT NULL, 
+	username VARCHAR NOT NULL, 
+	day VARCHAR NOT NULL, 
+	mode VARCHAR NOT NULL, 
+	shown_at VARCHAR NOT NULL, 
+	PRIMARY KEY (id), 
+	CONSTRAINT uq_prewarn_user_day_mode UNIQUE (username, day, mode)
+);
 CREATE TABLE overrides (
 	id INTEGER NOT NULL, 
 	username VARCHAR NOT NULL, 
@@ -24,6 +43,7 @@ CREATE TABLE overrides (
 	created_at DATETIME NOT NULL, 
 	PRIMARY KEY (id)
 );
+CREATE INDEX ix_overrides_user_until ON overrides (username, grant_until);
 CREATE TABLE audit_log (
 	id INTEGER NOT NULL, 
 	at DATETIME NOT NULL, 
@@ -33,30 +53,55 @@ CREATE TABLE audit_log (
 	details VARCHAR, 
 	PRIMARY KEY (id)
 );
-CREATE TABLE child_policy (
+CREATE INDEX ix_audit_log_at ON audit_log (at);
+CREATE INDEX ix_audit_log_child_at ON audit_log (child, at);
+CREATE TABLE daily_usage (
+	id INTEGER NOT NULL, 
 	username VARCHAR NOT NULL, 
-	after_expiry_mode VARCHAR NOT NULL, 
-	hard_lock BOOLEAN NOT NULL, 
-	warn_minutes INTEGER NOT NULL, 
-	PRIMARY KEY (username)
+	day VARCHAR NOT NULL, 
+	used_minutes INTEGER NOT NULL, 
+	last_seen_at DATETIME NOT NULL, 
+	PRIMARY KEY (id), 
+	CONSTRAINT uq_daily_usage_user_day UNIQUE (username, day)
 );
-CREATE TABLE prewarn_log (
+CREATE INDEX ix_daily_usage_day ON daily_usage (day);
+CREATE TABLE usage_intervals (
 	id INTEGER NOT NULL, 
 	username VARCHAR NOT NULL, 
 	day VARCHAR NOT NULL, 
-	mode VARCHAR NOT NULL, 
-	shown_at VARCHAR NOT NULL, 
+	device VARCHAR NOT NULL, 
+	start_at DATETIME NOT NULL, 
+	end_at DATETIME NOT NULL, 
+	PRIMARY KEY (id)
+);
+CREATE INDEX ix_usage_intervals_user_day ON usage_intervals (username, day);
+CREATE TABLE usage_resets (
+	username VARCHAR NOT NULL, 
+	day VARCHAR NOT NULL, 
+	reset_at DATETIME NOT NULL, 
+	PRIMARY KEY (username, day)
+);
+CREATE TABLE weekly_usage (
+	id INTEGER NOT NULL, 
+	username VARCHAR NOT NULL, 
+	period VARCHAR NOT NULL, 
+	used_minutes INTEGER NOT NULL, 
+	active_days INTEGER NOT NULL, 
+	max_minutes INTEGER NOT NULL, 
+	through_day VARCHAR NOT NULL, 
 	PRIMARY KEY (id), 
-	CONSTRAINT uq_prewarn_user_day_mode UNIQUE (username, day, mode)
+	CONSTRAINT uq_weekly_usage_user_period UNIQUE (username, period)
 );
-CREATE TABLE daily_usage (
+CREATE TABLE monthly_usage (
 	id INTEGER NOT NULL, 
 	username VARCHAR NOT NULL, 
-	day VARCHAR NOT NULL, 
+	period VARCHAR NOT NULL, 
 	used_minutes INTEGER NOT NULL, 
-	last_seen_at DATETIME NOT NULL, 
+	active_days INTEGER NOT NULL, 
+	max_minutes INTEGER NOT NULL, 
+	through_day VARCHAR NOT NULL, 
 	PRIMARY KEY (id), 
-	CONSTRAINT uq_daily_usage_user_day UNIQUE (username, day)
+	CONSTRAINT uq_monthly_usage_user_period UNIQUE (username, period)
 );
 CREATE TABLE day_overrides (
 	username VARCHAR NOT NULL, 
@@ -65,3 +110,20 @@ CREATE TABLE day_overrides (
 	updated_at DATETIME NOT NULL, 
 	PRIMARY KEY (username)
 );
+CREATE TABLE policy_version (
+	id INTEGER NOT NULL, 
+	version INTEGER NOT NULL, 
+	PRIMARY KEY (id)
+);
+CREATE TABLE maintenance_lease (
+	id INTEGER NOT NULL, 
+	holder VARCHAR NOT NULL, 
+	lease_until DATETIME NOT NULL, 
+	PRIMARY KEY (id)
+);
+CREATE TABLE schema_migrations (
+	version INTEGER NOT NULL, 
+	name VARCHAR NOT NULL, 
+	applied_at DATETIME NOT NULL, 
+	PRIMARY KEY (version)
+);
@@ -12,6 +12,14 @@ Item {
     property string serverTime: ""
     property string errorMessage: ""
     property bool loading: false
+    property string etag: ""
+    property string etagUrl: ""
+    property var streamXhr: null
+    property int streamOffset: 0
+    // Der Stream liefert nur den Haushalts-Status und kennt keine Kind-Tokens;
+    // mit einer Kind-URL (/api/widget/status/<user>) bleibt es beim Abfragen
+    readonly property bool perChildUrl: /\/api\/widget\/status\/[^\/?]+/.test(plasmoid.configuration.serverUrl || "")
+    readonly property bool useStream: plasmoid.configuration.useStream && !perChildUrl
 
     function buildUrl() {
         var baseUrl = plasmoid.configuration.serverUrl || "";
@@ -38,20 +46,31 @@ Item {
 
         var xhr = new XMLHttpRequest();
         xhr.open("GET", url);
+        // ETag nur für dieselbe URL zurückschicken (Token/URL kann sich ändern)
+        if (etag.length && etagUrl === url && kids.length) {
+            xhr.setRequestHeader("If-None-Match", etag);
+        }
         xhr.onreadystatechange = function () {
             if (xhr.readyState !== XMLHttpRequest.DONE) {
                 return;
             }
             loading = false;
+            if (xhr.status === 304) {
+                // unverändert: letzte Antwort bleibt stehen
+                return;
+            }
             if (xhr.status !== 200) {
                 errorMessage = "Fehler: " + xhr.status;
                 kids = [];
+                etag = "";
                 return;
             }
             try {
                 var data = JSON.parse(xhr.responseText);
                 kids = data.kids || [];
                 serverTime = data.server_time || "";
+                etag = xhr.getResponseHeader("ETag") || "";
+                etagUrl = url;
             } catch (err) {
                 errorMessage = "Antwort ungültig.";
                 kids = [];
@@ -60,15 +79,118 @@ Item {
         xhr.send();
     }
 
+    function applyEvent(block) {
+        var kind = "message";
+        var data = [];
+        var lines = block.split("\n");
+        for (var i = 0; i < lines.length; i++) {
+            var line = lines[i];
+            if (line.indexOf("event:") === 0) {
+                kind = line.substring(6).trim();
+            } else if (line.indexOf("data:") === 0) {
+                data.push(line.substring(5).trim());
+            }
+        }
+        if (kind !== "status" || !data.length) {
+            return;
+        }
+        try {
+            var payload = JSON.parse(data.join("\n"));
+            kids = payload.kids || [];
+            serverTime = payload.server_time || "";
+            errorMessage = "";
+        } catch (err) {
+            errorMessage = "Antwort ungültig.";
+        }
+    }
+
+    function openStream() {
+        var url = buildUrl().replace(/\/api\/widget\/status(?=\?|$)/, "/api/stream/status");
+        if (!url.length) {
+            errorMessage = "Server-URL fehlt.";
+            kids = [];
+            return;
+        }
+        if (streamXhr) {
+            var old = streamXhr;
+            streamXhr = null;
+            old.abort();
+        }
+        streamOffset = 0;
+        loading = true;
+
+        var xhr = new XMLHttpRequest();
+        streamXhr = xhr;
+        xhr.open("GET", url);
+        xhr.setRequestHeader("Accept", "text/event-stream");
+        xhr.onreadystatechange = function () {
+            if (xhr !== streamXhr) {
+                return;
+            }
+            if (xhr.readyState === XMLHttpRequest.LOADING || xhr.readyState === XMLHttpRequest.DONE) {
+                loading = false;
+                var text = xhr.responseText || "";
+                var end = text.lastIndexOf("\n\n");
+                if (end >= streamOffset) {
+                    var blocks = text.substring(streamOffset, end).split("\n\n");
+                    streamOffset = end + 2;
+                    for (var i = 0; i < blocks.length; i++) {
+                        applyEvent(blocks[i]);
+                    }
+                }
+                // responseText wächst mit – ab und zu neu verbinden
+                if (streamOffset > 512 * 1024) {
+                    reconnect.interval = 100;
+                    xhr.abort();
+                }
+            }
+            if (xhr.readyState === XMLHttpRequest.DONE) {
+                streamXhr = null;
+                if (xhr.status !== 200 && streamOffset === 0) {
+                    errorMessage = "Stream getrennt: " + xhr.status;
+                }
+                reconnect.start();
+            }
+        };
+        xhr.send();
+    }
+
+    function restart() {
+        if (useStream) {
+            openStream();
+        } else {
+            if (streamXhr) {
+                var old = streamXhr;
+                streamXhr = null;
+                old.abort();
+            }
+            refresh();
+        }
+    }
+
+    onUseStreamChanged: restart()
+
     Timer {
         id: poller
         interval: Math.max(5, plasmoid.configuration.refreshSeconds || 30) * 1000
         repeat: true
-        running: true
+        running: !useStream
         onTriggered: refresh()
     }
 
-    Component.onCompleted: refresh()
+    Timer {
+        id: reconnect
+        interval: 5000
+        repeat: false
+        onTriggered: {
+            interval = 5000;
+            if (useStream) {
+                openStream();
+            }
+        }
+    }
+
+    Component.onCompleted: restart()
 
     ColumnLayout {
         anchors.fill: parent
@@ -87,7 +209,7 @@ Item {
             PC3.Button {
                 text: loading ? "…" : "↻"
                 enabled: !loading
-                onClicked: refresh()
+                onClicked: restart()
             }
         }
 
@@ -0,0 +1,31 @@
+"""Gemeinsame Test-Helfer.
+
+Die Tests laufen gegen eine eigene SQLite-Datei im Temp-Verzeichnis; die
+Umgebung muss stehen, bevor app.db die Engines baut.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='kidscontrol-test-')}/kidscontrol.sqlite3")
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    """Leere Test-Datenbank; Policy-Snapshot und Nutzungspuffer starten frisch."""
+    from app import policy_cache, usage_buffer
+    from app.db import Base, SessionLocal, engine, init_db
+
+    init_db()
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    usage_buffer._entries.clear()
+    policy_cache.invalidate()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
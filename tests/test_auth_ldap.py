@@ -0,0 +1,320 @@
+"""auth_ldap gegen einen nachgebauten DC auf 127.0.0.1: echtes ldap3 mit ServerPool, StartTLS und Timeouts."""
+
+import asyncio
+import re
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("ldap3")
+
+from ldap3.protocol import rfc4511
+from ldap3.strategy.base import BaseStrategy
+from pyasn1.codec.ber import decoder, encoder
+
+from app import auth_ldap
+from app.auth_ldap import LDAPUnavailable, authenticate_parent_async
+
+START_TLS = "1.3.6.1.4.1.1466.20037"
+ELTERN = "CN=eltern,OU=Gruppen,DC=home,DC=lan"
+
+
+def _recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _read_message(sock):
+    head = _recv_exact(sock, 2)
+    if head is None:
+        return None
+    extra = b""
+    length = head[1]
+    if length & 0x80:
+        extra = _recv_exact(sock, length & 0x7F)
+        length = int.from_bytes(extra, "big")
+    return head + extra + _recv_exact(sock, length)
+
+
+def _encode(message_id, name, op):
+    msg = rfc4511.LDAPMessage()
+    msg["messageID"] = message_id
+    protocol_op = rfc4511.ProtocolOp()
+    protocol_op[name] = op
+    msg["protocolOp"] = protocol_op
+    return encoder.encode(msg)
+
+
+def _result(cls, code=0, **extra):
+    op = cls()
+    op["resultCode"] = code
+    op["matchedDN"] = ""
+    op["diagnosticMessage"] = ""
+    for key, value in extra.items():
+        op[key] = value
+    return op
+
+
+def _entry(login, member_of):
+    entry = rfc4511.SearchResultEntry()
+    entry["object"] = f"CN={login},DC=home,DC=lan"
+    attr = rfc4511.PartialAttribute()
+    attr["type"] = "memberOf"
+    vals = rfc4511.Vals()
+    for group in member_of:
+        vals.append(group)
+    attr["vals"] = vals
+    attrs = rfc4511.PartialAttributeList()
+    attrs.append(attr)
+    entry["attributes"] = attrs
+    return entry
+
+
+class StandInDC:
+    """
+    Minimaler LDAP-Server: StartTLS, Simple Bind, Suche nach sAMAccountName, Unbind.
+    release hält jede Antwort zurück, solange es nicht gesetzt ist; mute antwortet
+    gar nicht; drip schickt die Suchtreffer einzeln mit Pause (langsamer DC).
+    """
+
+    def __init__(self, cert_dir):
+        self.passwords = {"mama": "geheim", "kind1": "kind"}
+        self.groups = {"mama": [ELTERN], "kind1": ["CN=kinder,OU=Gruppen,DC=home,DC=lan"]}
+        self.binds = 0
+        self.searches = 0
+        self.tls = 0
+        self.mute = False
+        self.drip = 0.0
+        self.release = threading.Event()
+        self.release.set()
+        self._stop = threading.Event()
+        self._ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._ctx.load_cert_chain(cert_dir / "cert.pem", cert_dir / "key.pem")
+        self._sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        self.release.set()
+        self._sock.close()
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _send(self, sock, data):
+        self.release.wait(10)
+        sock.sendall(data)
+
+    def _serve(self, sock):
+        try:
+            while True:
+                raw = _read_message(sock)
+                if raw is None:
+                    return
+                if self.mute:
+                    self._stop.wait(30)
+                    return
+                if self._handle(sock, raw) == "starttls":
+                    sock = self._ctx.wrap_socket(sock, server_side=True)
+                    self.tls += 1
+        except (OSError, ssl.SSLError):
+            return
+        finally:
+            sock.close()
+
+    def _handle(self, sock, raw):
+        # 30 len | 02 len messageID | Tag der Operation ...
+        at = 2 + (raw[1] & 0x7F if raw[1] & 0x80 else 0)
+        id_len = raw[at + 1]
+        message_id = int.from_bytes(raw[at + 2:at + 2 + id_len], "big")
+        tag = raw[at + 2 + id_len]
+        if tag == 0x63:  # searchRequest: pyasn1 kann den rekursiven Filter nicht ohne Weiteres dekodieren
+            self.searches += 1
+            m = re.search(rb"\x04\x0esAMAccountName\x04(.)", raw, re.S)
+            login = raw[m.end():m.end() + m.group(1)[0]].decode()
+            entries = [_entry(login, self.groups[login])] if login in self.groups else []
+            if self.drip and entries:
+                entries = entries * 6
+            for entry in entries:
+                if self.drip:
+                    time.sleep(self.drip)
+                self._send(sock, _encode(message_id, "searchResEntry", entry))
+            self._send(sock, _encode(message_id, "searchResDone", _result(rfc4511.SearchResultDone)))
+            return None
+        msg = decoder.decode(raw, asn1Spec=rfc4511.LDAPMessage())[0]
+        kind = msg["protocolOp"].getName()
+        req = BaseStrategy.decode_request(kind, msg["protocolOp"].getComponent())
+        if kind == "extendedReq" and req["name"] == START_TLS:
+            self._send(sock, _encode(message_id, "extendedResp", _result(rfc4511.ExtendedResponse, responseName=START_TLS)))
+            return "starttls"
+        elif kind == "bindRequest":
+            self.binds += 1
+            login = req["name"].split("@")[0]
+            ok = self.passwords.get(login) == req["authentication"]["simple"]
+            self._send(sock, _encode(message_id, "bindResponse", _result(rfc4511.BindResponse, 0 if ok else 49)))
+        return None
+
+
+def _free_port():
+    # nach close() lauscht dort niemand: Verbindungsaufbau wird abgewiesen
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def cert_dir(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl fehlt (Testzertifikat für StartTLS)")
+    path = tmp_path_factory.mktemp("ldap-cert")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-keyout", str(path / "key.pem"), "-out", str(path / "cert.pem")],
+        check=True,
+        capture_output=True,
+    )
+    return path
+
+
+@pytest.fixture
+def dc(cert_dir, monkeypatch):
+    server = StandInDC(cert_dir)
+    # erster DC nicht erreichbar: der Pool muss auf den zweiten ausweichen
+    monkeypatch.setattr(
+        auth_ldap, "server_pool", auth_ldap.make_server_pool(f"ldap://127.0.0.1:{_free_port()} ldap://127.0.0.1:{server.port}")
+    )
+    monkeypatch.setattr(auth_ldap, "breaker", {"failures": 0, "open_until": 0.0, "trial": False})
+    monkeypatch.setattr(auth_ldap, "_pending", threading.BoundedSemaphore(auth_ldap.LDAP_MAX_PENDING))
+    auth_ldap.clear_cache()
+    yield server
+    server.close()
+
+
+def login(user, password):
+    return asyncio.run(authenticate_parent_async(user, password))
+
+
+def test_login_over_pool_with_starttls(dc):
+    assert login("mama", "geheim") is True
+    assert dc.tls == 1
+    assert (dc.binds, dc.searches) == (1, 1)
+
+
+def test_no_reachable_dc(dc, monkeypatch):
+    monkeypatch.setattr(auth_ldap, "server_pool", auth_ldap.make_server_pool(f"ldap://127.0.0.1:{_free_port()}"))
+    with pytest.raises(LDAPUnavailable):
+        login("mama", "geheim")
+    assert auth_ldap.breaker["failures"] == 1
+
+
+def test_group_lookup_is_cached_but_password_always_checked(dc):
+    assert login("mama", "geheim") is True
+    assert login("mama", "geheim") is True
+    assert (dc.binds, dc.searches) == (2, 1)
+    assert login("mama", "falsch") is False
+    assert login("kind1", "kind") is False
+
+
+def test_group_cache_expires(dc):
+    assert login("mama", "geheim") is True
+    dc.groups["mama"] = []
+    assert login("mama", "geheim") is True  # noch aus dem Cache
+    auth_ldap._group_cache["mama"] = (0.0, True)  # abgelaufen
+    assert login("mama", "geheim") is False
+    assert dc.searches == 2
+
+
+def test_breaker_opens_then_lets_one_trial_through(dc, monkeypatch):
+    live_pool = auth_ldap.server_pool
+    monkeypatch.setattr(auth_ldap, "server_pool", auth_ldap.make_server_pool(f"ldap://127.0.0.1:{_free_port()}"))
+    for _ in range(auth_ldap.LDAP_BREAKER_FAILURES):
+        with pytest.raises(LDAPUnavailable):
+            login("mama", "geheim")
+    with pytest.raises(LDAPUnavailable, match="circuit open"):
+        login("mama", "geheim")
+    assert dc.binds == 0
+
+    # Wartezeit vorbei: halb offen, genau ein Versuch darf durch
+    auth_ldap.breaker["open_until"] = 0.0
+    monkeypatch.setattr(auth_ldap, "server_pool", live_pool)
+    dc.release.clear()
+
+    async def trial_and_second():
+        trial = asyncio.ensure_future(authenticate_parent_async("mama", "geheim"))
+        await asyncio.sleep(0.1)
+        with pytest.raises(LDAPUnavailable, match="circuit open"):
+            await authenticate_parent_async("mama", "geheim")
+        dc.release.set()
+        return await trial
+
+    assert asyncio.run(trial_and_second()) is True
+    assert dc.binds == 1
+    assert auth_ldap.breaker["failures"] == 0
+    assert login("mama", "geheim") is True
+
+
+def test_pending_limit(dc, monkeypatch):
+    monkeypatch.setattr(auth_ldap, "_pending", threading.BoundedSemaphore(1))
+    dc.release.clear()
+
+    async def two_at_once():
+        first = asyncio.ensure_future(authenticate_parent_async("mama", "geheim"))
+        await asyncio.sleep(0.1)
+        with pytest.raises(LDAPUnavailable, match="too many pending"):
+            await authenticate_parent_async("mama", "geheim")
+        dc.release.set()
+        return await first
+
+    assert asyncio.run(two_at_once()) is True
+    assert login("mama", "geheim") is True  # Platz wieder frei
+
+
+def test_receive_timeout_reaches_the_socket(dc, monkeypatch):
+    monkeypatch.setattr(auth_ldap, "LDAP_RECEIVE_TIMEOUT", 1)
+    dc.mute = True
+    t0 = time.monotonic()
+    with pytest.raises(LDAPUnavailable) as exc:
+        login("mama", "geheim")
+    # ldap3 selbst bricht ab, nicht erst das Gesamt-Timeout im async-Wrapper
+    assert str(exc.value) != "timeout"
+    assert time.monotonic() - t0 < auth_ldap.LDAP_CONNECT_TIMEOUT + 2 * auth_ldap.LDAP_RECEIVE_TIMEOUT
+    assert auth_ldap.breaker["failures"] == 1
+
+
+def test_slow_dc_times_out_once_and_late_result_is_ignored(dc, monkeypatch):
+    # jede Antwort kommt rechtzeitig (0,5 s < 1 s), alle zusammen dauern zu lange
+    monkeypatch.setattr(auth_ldap, "LDAP_CONNECT_TIMEOUT", 0.2)
+    monkeypatch.setattr(auth_ldap, "LDAP_RECEIVE_TIMEOUT", 1)
+    dc.drip = 0.5
+    late = threading.Event()
+    record = auth_ldap._breaker_record
+
+    def tracked(ok, attempt=None):
+        record(ok, attempt)
+        if ok:
+            late.set()
+
+    monkeypatch.setattr(auth_ldap, "_breaker_record", tracked)
+    with pytest.raises(LDAPUnavailable, match="timeout"):
+        login("mama", "geheim")
+    assert auth_ldap.breaker["failures"] == 1
+
+    # der DC antwortet doch noch – erfolgreich, aber zu spät
+    assert late.wait(10)
+    assert auth_ldap.breaker["failures"] == 1
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+from app import metrics
+
+
+def _write(path, pid, start, value):
+    snap = {"pid": pid, "start": start, "at": 0.0, "counters": [["kidscontrol_sql_queries_total", [], value]],
+            "hists": [], "gauges": []}
+    path.write_text(json.dumps(snap), encoding="utf-8")
+
+
+def test_snapshots_of_ended_workers_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    running = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    ended = subprocess.Popen([sys.executable, "-c", "pass"])
+    ended.wait()
+    try:
+        start = metrics._proc_start(running.pid)
+        _write(tmp_path / f"metrics-{running.pid}-{start}.json", running.pid, start, 5)
+        _write(tmp_path / f"metrics-{ended.pid}-1.json", ended.pid, "1", 7)
+        if start:
+            # gleiche PID, anderer Start: Datei eines Vorgängers
+            _write(tmp_path / f"metrics-{running.pid}-1.json", running.pid, "1", 11)
+
+        snaps = metrics.collect_all()
+        assert sorted(s["pid"] for s in snaps) == sorted([os.getpid(), running.pid])
+        assert sorted(os.listdir(tmp_path)) == [f"metrics-{running.pid}-{start}.json"]
+    finally:
+        running.kill()
+        running.wait()
+
+
+def test_dump_is_keyed_by_pid_and_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    metrics.dump()
+    pid, start = metrics._identity()
+    assert os.listdir(tmp_path) == [f"metrics-{pid}-{start}.json"]
+    # der eigene Snapshot wird frisch erhoben, nicht zusätzlich aus der Datei gelesen
+    assert [s["pid"] for s in metrics.collect_all()] == [pid]
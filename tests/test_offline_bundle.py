@@ -0,0 +1,39 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from app import offline_bundle
+from app.schedule_bitmap import WeekBitmap
+
+TZ = ZoneInfo("Europe/Berlin")
+
+
+def _child(daily_minutes=120):
+    """Kind im Format des Policy-Snapshots (app/policy_cache.py): täglich 15:00-18:30."""
+    week = {wd: {"start_min": 900, "end_min": 1110, "windows": [(900, 1110)], "daily_minutes": daily_minutes} for wd in range(7)}
+    return {
+        "display_name": "Kind 1",
+        "week": week,
+        "warn_minutes": 10,
+        "after_expiry_mode": "LOCK",
+        "override_until": None,
+        "day_override": None,
+        "bitmap": WeekBitmap.from_week(week),
+        "widget_token_hash": None,
+    }
+
+
+def test_bundle_across_dst_change():
+    # 25.10.2026, 03:00 MESZ -> 02:00 MEZ
+    start = datetime(2026, 10, 24, 12, 0, tzinfo=TZ)
+    payload = offline_bundle.build("kind1", _child(), 0, start, 48, None)
+
+    # 48 echte Stunden, nicht 48 Stunden Wanduhr
+    assert payload["valid_until"] == "2026-10-26T11:00:00+01:00"
+    segments = payload["timeline"]
+    assert segments[0]["from"] == "2026-10-24T12:00:00+02:00"
+    after = [s for s in segments if datetime.fromisoformat(s["from"]) >= datetime(2026, 10, 25, 3, 0, tzinfo=TZ)]
+    assert after
+    assert all(s["from"].endswith("+01:00") and s["to"].endswith("+01:00") for s in after)
+    # lückenlos
+    assert all(a["to"] == b["from"] for a, b in zip(segments, segments[1:]))
+    assert segments[-1]["to"] == payload["valid_until"]
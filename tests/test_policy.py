@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from app import policy, usage_buffer
+from app.db import Child, Schedule
+from app.policy import clock_at, decide, record_heartbeat_batch_async
+from app.schedule_bitmap import WeekBitmap
+
+TZ = ZoneInfo("Europe/Berlin")
+
+
+def _child(daily_minutes=120):
+    """Kind im Format des Policy-Snapshots (app/policy_cache.py): täglich 15:00-18:30."""
+    week = {wd: {"start_min": 900, "end_min": 1110, "windows": [(900, 1110)], "daily_minutes": daily_minutes} for wd in range(7)}
+    return {
+        "display_name": "Kind 1",
+        "week": week,
+        "warn_minutes": 10,
+        "after_expiry_mode": "LOCK",
+        "override_until": None,
+        "day_override": None,
+        "bitmap": WeekBitmap.from_week(week),
+        "widget_token_hash": None,
+    }
+
+
+def test_decision_is_stable_within_a_minute():
+    # Budget (30 min) endet vor dem Fenster: next_change_at kommt aus dem Restbudget
+    rows = {"children": {"kind1": _child()}, "usages": {"kind1": 90}}
+    first = decide("kind1", rows, clock_at(datetime(2026, 10, 14, 16, 14, 8, 324426, tzinfo=TZ)))
+    second = decide("kind1", rows, clock_at(datetime(2026, 10, 14, 16, 14, 51, 639719, tzinfo=TZ)))
+    assert first == second
+    assert first["next_change_at"] == "2026-10-14T16:44:00+02:00"
+
+
+def _run_batch(records):
+    from app.db import AsyncSessionLocal, async_engine
+
+    async def run():
+        try:
+            async with AsyncSessionLocal() as adb:
+                return await record_heartbeat_batch_async(adb, records, TZ)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def _child_with_window(db, start_min, end_min):
+    db.add(Child(username="kind1", display_name="Kind 1"))
+    db.add_all(
+        Schedule(username="kind1", weekday=wd, start_min=start_min, end_min=end_min, daily_minutes=600) for wd in range(7)
+    )
+    db.commit()
+
+
+def _hb(at, minutes):
+    return {"device": "pc", "user": "kind1", "observed_at": at + timedelta(minutes=minutes)}
+
+
+def test_batch_backfill_is_capped(db, monkeypatch):
+    _child_with_window(db, 0, 1439)
+    now = datetime(2026, 10, 14, 15, 0, tzinfo=TZ)
+    monkeypatch.setattr(policy, "now_local", lambda tz: now)
+
+    # zehn Minuten nachgereicht: nur die letzten HEARTBEAT_MAX_BACKFILL_SECONDS (4 min) zählen
+    results = _run_batch([_hb(now, m) for m in range(-10, 1)])
+    assert [r.get("ignored") for r in results] == ["stale"] * 6 + [None] * 5
+    assert results[-1]["decision"]["daily_used"] == 4
+
+    # gestern, kurz vor Mitternacht, und weit in der Zukunft: beides zählt nicht
+    stale = {"device": "pc", "user": "kind1", "observed_at": datetime(2026, 10, 13, 23, 59, tzinfo=TZ)}
+    results = _run_batch([stale, _hb(now, 30)])
+    assert [r.get("ignored") for r in results] == ["stale", "future"]
+    assert results[0]["decision"]["daily_used"] == 4
+
+
+def test_batch_entries_count_by_their_own_time(db, monkeypatch):
+    # Fenster bis 14:59, jetzt ist es 15:00: die Einträge von davor zählen trotzdem
+    _child_with_window(db, 0, 899)
+    now = datetime(2026, 10, 14, 15, 0, tzinfo=TZ)
+    monkeypatch.setattr(policy, "now_local", lambda tz: now)
+    results = _run_batch([_hb(now, m) for m in (-3, -2, -1)])
+    assert results[-1]["decision"]["reason"] == "outside-time"
+    assert usage_buffer.totals(db, ["kind1"], "2026-10-14")["kind1"] == 2
+
+
+def test_batch_entries_before_the_window_do_not_count(db, monkeypatch):
+    # Fenster ab 15:00: was davor lag, zählt nicht, obwohl es jetzt offen ist
+    _child_with_window(db, 900, 1439)
+    now = datetime(2026, 10, 14, 15, 1, tzinfo=TZ)
+    monkeypatch.setattr(policy, "now_local", lambda tz: now)
+    results = _run_batch([_hb(now, m) for m in (-3, -2, 0)])
+    assert results[-1]["decision"]["reason"] == "schedule"
+    assert usage_buffer.totals(db, ["kind1"], "2026-10-14")["kind1"] == 0
+
+
+def test_compute_access_does_not_count_usage(db):
+    db.add(Child(username="kind1", display_name="Kind 1"))
+    db.add_all(Schedule(username="kind1", weekday=wd, start_min=0, end_min=1439, daily_minutes=600) for wd in range(7))
+    db.commit()
+    for _ in range(3):
+        assert policy.compute_access(db, "kind1", TZ)["reason"] == "schedule"
+    assert policy.compute_access_many(db, ["kind1"], TZ)["kind1"]["daily_used"] == 0
+    # gelesen wird über den Puffer, gesehen hat er aber kein Gerät
+    assert all(not entry["devices"] for entry in usage_buffer._entries.values())
+    policy.record_heartbeat(db, "kind1", TZ, device="pc")
+    assert any("pc" in entry["devices"] for entry in usage_buffer._entries.values())
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+
+from app import policy_cache
+from app.db import AsyncSessionLocal, Child, async_engine
+
+
+def test_concurrent_async_rebuilds_do_not_block(db):
+    db.add_all([Child(username="kind1", display_name="Kind 1"), Child(username="kind2", display_name="Kind 2")])
+    db.commit()
+    policy_cache.invalidate()
+
+    async def one():
+        async with AsyncSessionLocal() as adb:
+            return await policy_cache.get_snapshot_async(adb)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(one() for _ in range(5)))
+        finally:
+            await async_engine.dispose()
+
+    results = []
+    # läuft in einem eigenen Thread: ein Deadlock blockiert sonst den Testlauf
+    worker = threading.Thread(target=lambda: results.extend(asyncio.run(run())), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "get_snapshot_async hängt"
+    assert [sorted(snap) for snap in results] == [["kind1", "kind2"]] * 5
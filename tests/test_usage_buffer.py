@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app import usage_buffer
+from app.db import DailyUsage, UsageInterval, UsageReset
+
+
+def _used(db, user, day):
+    return db.execute(select(DailyUsage.used_minutes).where(DailyUsage.username == user, DailyUsage.day == day)).scalar()
+
+
+def test_reset_by_another_worker_is_not_undone(db):
+    day = "2026-10-14"
+    start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=30)
+    usage_buffer.totals(db, ["kind1"], day)
+    for m in range(11):
+        usage_buffer.tick("kind1", day, start + timedelta(minutes=m), "pc")
+    usage_buffer.flush(db)
+    assert _used(db, "kind1", day) == 10
+
+    # noch ungeschriebene Nutzung eines zweiten Geräts in diesem Worker ...
+    usage_buffer.tick("kind1", day, start + timedelta(minutes=11), "tablet")
+    usage_buffer.tick("kind1", day, start + timedelta(minutes=12), "tablet")
+    # ... während ein anderer Worker den Tag zurücksetzt (dessen Puffer ist nicht dieser)
+    db.query(DailyUsage).delete()
+    db.query(UsageInterval).delete()
+    db.add(UsageReset(username="kind1", day=day, reset_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+    db.commit()
+
+    usage_buffer.flush(db)
+    assert not _used(db, "kind1", day)
+    assert usage_buffer.totals(db, ["kind1"], day)["kind1"] == 0
+
+
+def test_reset_day_clears_local_entry(db):
+    day = "2026-10-14"
+    start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=10)
+    usage_buffer.totals(db, ["kind1"], day)
+    for m in range(6):
+        usage_buffer.tick("kind1", day, start + timedelta(minutes=m), "pc")
+    usage_buffer.flush(db)
+    usage_buffer.reset_day(db, "kind1", day)
+    usage_buffer.flush(db)
+    assert not _used(db, "kind1", day)
+    # danach zählt es wieder ab 0
+    usage_buffer.totals(db, ["kind1"], day)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    usage_buffer.tick("kind1", day, now, "pc")
+    usage_buffer.tick("kind1", day, now + timedelta(minutes=2), "pc")
+    usage_buffer.flush(db)
+    assert _used(db, "kind1", day) == 2